@@ -9,6 +9,11 @@ from models import Tag, Article, ArticleStatus, Attachment
 
 log = logging.getLogger('articles.admin')
 
+def invalidate_caches_for(queryset):
+    """Bulk updates skip the model signals, so drop the caches by hand"""
+
+    Article.objects.invalidate_caches(queryset)
+
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'article_count')
 
@@ -70,10 +75,12 @@ class ArticleAdmin(admin.ModelAdmin):
 
     def mark_active(self, request, queryset):
         queryset.update(is_active=True)
+        invalidate_caches_for(queryset)
     mark_active.short_description = _('Mark select articles as active')
 
     def mark_inactive(self, request, queryset):
         queryset.update(is_active=False)
+        invalidate_caches_for(queryset)
     mark_inactive.short_description = _('Mark select articles as inactive')
 
     def get_actions(self, request):
@@ -82,6 +89,7 @@ class ArticleAdmin(admin.ModelAdmin):
         def dynamic_status(name, status):
             def status_func(self, request, queryset):
                 queryset.update(status=status)
+                invalidate_caches_for(queryset)
 
             status_func.__name__ = name
             status_func.short_description = _('Set status of selected to "%s"' % status)
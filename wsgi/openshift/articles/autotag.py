@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Finds every tag name that occurs in a piece of text in a single pass.
+
+``TagMatcher`` builds an Aho-Corasick automaton over the (lowercased) tag
+names, so the cost of matching an article grows with the length of the
+article rather than with the number of tags times the length of the article.
+
+Matching follows the rules the old ``\\b<tag>\\b`` regular expressions had
+for ASCII: a tag which starts or ends with a letter, digit or underscore only
+matches where that end is not glued to another one, so "go" is not found in
+"good".  Other characters, CJK in particular, have no word boundaries, so a
+tag like u"开源" is found anywhere in the text.
+"""
+from collections import deque
+import re
+import string
+
+from django.utils.encoding import force_unicode
+
+__all__ = ('TagMatcher', 'tokenize')
+
+WORD_CHARS = frozenset(unicode(string.ascii_letters + string.digits + '_'))
+
+# runs of ASCII word characters, or any other single letter/digit (CJK...)
+TOKEN_RE = re.compile(ur'[a-z0-9_]+|[^\W\x00-\x7f]', re.U)
+MAX_TERM_LENGTH = 64
+
+def tokenize(text):
+    """
+    Returns the set of index terms in ``text``.  Whenever a tag matches some
+    text, every term of the tag name is also a term of that text, which is
+    what lets the term index narrow down the articles a new tag applies to.
+    """
+
+    return set(term[:MAX_TERM_LENGTH] for term in TOKEN_RE.findall(force_unicode(text).lower()))
+
+class TagMatcher(object):
+
+    def __init__(self, tags):
+        """``tags`` is an iterable of (key, name) pairs; ``find`` returns keys"""
+
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for key, name in tags:
+            word = force_unicode(name).lower().strip()
+            if not word:
+                continue
+
+            node = 0
+            for ch in word:
+                child = self._goto[node].get(ch)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[node][ch] = child
+                node = child
+
+            self._out[node] += ((key, len(word), word[0] in WORD_CHARS, word[-1] in WORD_CHARS),)
+
+        self._link()
+
+    def _link(self):
+        """Computes the failure links breadth-first"""
+
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].itervalues())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].iteritems():
+                queue.append(child)
+
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(ch, 0)
+                out[child] += out[fail[child]]
+
+    def find(self, text):
+        """Returns the set of keys of the tags which occur in ``text``"""
+
+        goto, fail, out = self._goto, self._fail, self._out
+        text = force_unicode(text).lower()
+        last = len(text) - 1
+        found = set()
+
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            for key, length, left, right in out[node]:
+                if key in found:
+                    continue
+
+                start = i - length + 1
+                if left and start > 0 and text[start - 1] in WORD_CHARS:
+                    continue
+                if right and i < last and text[i + 1] in WORD_CHARS:
+                    continue
+
+                found.add(key)
+
+        return found
@@ -0,0 +1,143 @@
+"""
+Cache keys used by the articles app, and the helpers that throw them away when
+the articles behind them change.
+
+Keeping every key in one place means the code which writes an article (saves,
+deletes, bulk updates, the expiry sweeper) does not need to know which pages
+happen to cache what.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+log = logging.getLogger('articles.caching')
+
+# how long derived listings (archives, tag cloud, navigation...) live in the
+# cache.  They only count articles published by now, and a scheduled article
+# going live sends no signal, so this is how late it may show up in them.
+CACHE_TIMEOUT = getattr(settings, 'ARTICLES_CACHE_TIMEOUT', 300)
+
+LATEST_ARTICLES_KEY = 'latest_articles'
+TAG_ARTICLES_KEY = 'articles_for_%s'
+ARCHIVE_KEY = 'article_archive_list'
+AUTHOR_ARCHIVE_KEY = 'article_author_archive_list'
+TAG_CLOUD_KEY = 'tag_cloud_tags'
+TAG_CLOUD_SCALES = ('linear', 'log')
+TAG_MATCHER_VERSION_KEY = 'article_tag_matcher_version'
+NAVIGATION_GENERATION_KEY = 'article_navigation_generation'
+NAVIGATION_KEY = 'article_navigation_%s_%s'
+LISTING_COUNT_KEY = 'article_count_%s_%s'
+ALL_LISTING = 'all'
+
+def tag_articles_key(name):
+    """Key of the cached feed items for the tag called ``name``"""
+
+    return TAG_ARTICLES_KEY % (name,)
+
+def archive_key(superuser, with_counts=False):
+    """
+    Key of the cached month archive.  Superusers also see articles which are
+    not live yet, so they get their own copy.
+    """
+
+    return '%s_%s%s' % (ARCHIVE_KEY,
+                        superuser and 'superuser' or 'public',
+                        with_counts and '_counts' or '')
+
+def tag_listing(pk):
+    return 'tag_%s' % (pk,)
+
+def author_listing(pk):
+    return 'author_%s' % (pk,)
+
+def month_listing(year, month):
+    return 'month_%s_%s' % (year, month)
+
+def article_listings(author_id, publish_date):
+    """
+    The listings an article by ``author_id`` published on ``publish_date``
+    shows up in, apart from those of its tags.
+    """
+
+    listings = [ALL_LISTING]
+    if author_id is not None:
+        listings.append(author_listing(author_id))
+    if publish_date is not None:
+        listings.append(month_listing(publish_date.year, publish_date.month))
+    return listings
+
+def listing_count_key(listing, superuser):
+    """
+    Key of the cached number of articles in ``listing`` (``ALL_LISTING`` or
+    what ``tag_listing``, ``author_listing`` or ``month_listing`` return).
+    Superusers also count articles which are not live yet.
+    """
+
+    return LISTING_COUNT_KEY % (listing, superuser and 'superuser' or 'public')
+
+def tag_cloud_keys():
+    return ['%s_%s' % (TAG_CLOUD_KEY, scale) for scale in TAG_CLOUD_SCALES]
+
+def generation(key):
+    """
+    Returns the current value of the counter stored under ``key``.  Caches
+    which are too many to delete one by one put it in their keys instead, and
+    are all dropped at once by bumping it.
+    """
+
+    version = cache.get(key)
+    if version is None:
+        version = time.time()
+        if not cache.add(key, version):
+            version = cache.get(key, version)
+    return version
+
+def bump_generation(key):
+    cache.set(key, time.time())
+
+def tag_matcher_version():
+    """
+    Returns the current version of the set of tags.  Every process keeps its
+    own auto-tag matcher and rebuilds it when this changes.
+    """
+
+    return generation(TAG_MATCHER_VERSION_KEY)
+
+def navigation_key(pk):
+    """Key of the cached next/previous articles of the article ``pk``"""
+
+    return NAVIGATION_KEY % (generation(NAVIGATION_GENERATION_KEY), pk)
+
+def invalidate_tag_caches():
+    """
+    Drops the cached tag cloud and tells every process to rebuild its auto-tag
+    matcher, e.g. after a tag is added, renamed or deleted.
+    """
+
+    cache.delete_many(tag_cloud_keys())
+    bump_generation(TAG_MATCHER_VERSION_KEY)
+
+def invalidate_article_caches(tag_names=(), listings=()):
+    """
+    Drops every cached listing that may contain an article.  ``tag_names``
+    are the names of the tags applied to the articles that changed, so their
+    tag feeds go too, and ``listings`` are the listings (see
+    ``listing_count_key``) whose article counts changed.
+    """
+
+    keys = [LATEST_ARTICLES_KEY, AUTHOR_ARCHIVE_KEY]
+    keys.extend(tag_cloud_keys())
+    keys.extend(archive_key(superuser, with_counts)
+                for superuser in (True, False) for with_counts in (True, False))
+    keys.extend(tag_articles_key(name) for name in tag_names)
+    keys.extend(listing_count_key(listing, superuser)
+                for listing in set(listings) for superuser in (True, False))
+
+    log.debug('Invalidating article caches: %s' % (keys,))
+    cache.delete_many(keys)
+
+    # any article moving, appearing or going away changes its neighbours'
+    # navigation, so drop all of it
+    bump_generation(NAVIGATION_GENERATION_KEY)
@@ -5,6 +5,7 @@ from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.utils.feedgenerator import Atom1Feed
 
+from articles.caching import LATEST_ARTICLES_KEY, tag_articles_key
 from articles.models import Article, Tag
 
 # default to 24 hours for feed caching
@@ -28,7 +29,7 @@ class LatestEntries(Feed, SiteMixin):
         return reverse('articles_archive')
 
     def items(self):
-        key = 'latest_articles'
+        key = LATEST_ARTICLES_KEY
         articles = cache.get(key)
 
         if articles is None:
@@ -64,7 +65,7 @@ class TagFeed(Feed, SiteMixin):
         return self.item_set(obj)[:10]
 
     def item_set(self, obj):
-        key = 'articles_for_%s' % obj.name
+        key = tag_articles_key(obj.name)
         articles = cache.get(key)
 
         if articles is None:
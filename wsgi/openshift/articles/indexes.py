@@ -0,0 +1,56 @@
+"""
+Composite indexes behind the article listings.
+
+Django 1.3 can only declare single column indexes on a model, so these are
+created by South migration 0009.  Deployments which only run ``syncdb`` can
+print the statements with ``manage.py benchmark_articles --print-sql`` and
+apply them once, e.g. from an alter.sql deploy hook.
+
+``articles_article (is_active, status_id, publish_date)``
+    ``ArticleManager.live()``/``active()``: every list page, feed, archive and
+    count filters on is_active and the (live) status and ranges on
+    publish_date, so counts are answered from the index alone.  ``live()``
+    joins the status table to check is_live, which makes every live status a
+    range of its own: the rows of a list page are still sorted by
+    publish_date after they are found.
+``articles_article (slug, publish_date)``
+    ``display_article`` looks articles up by slug within a publication year,
+    which is a range on publish_date.
+
+Tag pages need nothing more: Django already indexes the tag_id foreign key
+of the M2M table.
+"""
+from django.db import connections
+
+from models import Article
+
+__all__ = ('INDEXES', 'index_name', 'create_index_sql', 'create_indexes', 'drop_indexes')
+
+INDEXES = (
+    (Article._meta.db_table, ('is_active', 'status_id', 'publish_date')),
+    (Article._meta.db_table, ('slug', 'publish_date')),
+)
+
+def index_name(table, columns):
+    return ('%s_%s' % (table, '_'.join(columns)))[:64]
+
+def create_index_sql(using='default'):
+    qn = connections[using].ops.quote_name
+    return ['CREATE INDEX %s ON %s (%s)' % (qn(index_name(table, columns)), qn(table),
+                                            ', '.join(qn(c) for c in columns))
+            for table, columns in INDEXES]
+
+def create_indexes(using='default'):
+    cursor = connections[using].cursor()
+    for sql in create_index_sql(using):
+        cursor.execute(sql)
+
+def drop_indexes(using='default'):
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    for table, columns in INDEXES:
+        if 'mysql' in connection.settings_dict['ENGINE']:
+            cursor.execute('DROP INDEX %s ON %s' % (qn(index_name(table, columns)), qn(table)))
+        else:
+            cursor.execute('DROP INDEX %s' % (qn(index_name(table, columns)),))
@@ -0,0 +1,145 @@
+"""
+Background resolution of the titles of pages that articles link to.
+
+Articles queue their outbound links in the ``LinkTitle`` store when they are
+saved; ``resolve_pending`` fetches the titles of the links that are due with a
+bounded pool of worker threads.  Only the workers touch the network, and only
+the calling thread touches the database.
+
+default settings.py values
+<code>
+    ARTICLES_LINK_TITLE_WORKERS = 4
+    ARTICLES_LINK_TITLE_TIMEOUT = 5
+    ARTICLES_LINK_TITLE_MAX_BYTES = 65536
+    ARTICLES_LINK_TITLE_MAX_ATTEMPTS = 5
+    ARTICLES_LINK_TITLE_RETRY_DELAY = 300
+</code>
+"""
+from datetime import datetime, timedelta
+from HTMLParser import HTMLParser
+from multiprocessing.pool import ThreadPool
+import logging
+import re
+import urllib2
+
+from django.conf import settings
+
+from models import LinkTitle, TITLE_RE
+
+WORKERS = getattr(settings, 'ARTICLES_LINK_TITLE_WORKERS', 4)
+TIMEOUT = getattr(settings, 'ARTICLES_LINK_TITLE_TIMEOUT', 5)
+MAX_BYTES = getattr(settings, 'ARTICLES_LINK_TITLE_MAX_BYTES', 65536)
+MAX_ATTEMPTS = getattr(settings, 'ARTICLES_LINK_TITLE_MAX_ATTEMPTS', 5)
+# seconds before the first retry; doubled after every failed attempt
+RETRY_DELAY = getattr(settings, 'ARTICLES_LINK_TITLE_RETRY_DELAY', 300)
+
+CHARSET_RE = re.compile(r'<meta[^>]+charset=["\']?([\w-]+)', re.I)
+WHITESPACE_RE = re.compile(r'\s+')
+
+log = logging.getLogger('articles.linktitles')
+
+class NoTitle(Exception):
+    """The page was fetched fine but has no usable title"""
+
+def fetch_title(url, timeout=TIMEOUT, max_bytes=MAX_BYTES):
+    """
+    Fetches at most ``max_bytes`` of ``url`` and returns the page title as
+    unicode.  Raises NoTitle for pages without one (images, binaries...) and
+    the usual urllib2/socket errors when the page cannot be fetched.
+    """
+
+    response = urllib2.urlopen(url, timeout=timeout)
+    try:
+        info = response.info()
+        if 'html' not in info.gettype():
+            raise NoTitle('not an HTML page (%s)' % (info.gettype(),))
+        html = response.read(max_bytes)
+    finally:
+        response.close()
+
+    match = TITLE_RE.search(html)
+    if not match:
+        raise NoTitle('no title in the first %s bytes' % (max_bytes,))
+
+    charset = info.getparam('charset')
+    if not charset:
+        meta = CHARSET_RE.search(html)
+        charset = meta and meta.group(1) or 'utf-8'
+    try:
+        title = match.group(1).decode(charset, 'replace')
+    except LookupError:
+        title = match.group(1).decode('utf-8', 'replace')
+
+    title = WHITESPACE_RE.sub(' ', HTMLParser().unescape(title)).strip()
+    if not title:
+        raise NoTitle('empty title')
+
+    return title[:255]
+
+def _fetch(args):
+    """Runs in a worker thread; never lets an exception escape"""
+
+    url, timeout, max_bytes = args
+    try:
+        return fetch_title(url, timeout, max_bytes), None
+    except Exception, e:
+        return None, e
+
+def is_permanent(error):
+    """Pages without a title and client errors (404...) are not worth retrying"""
+
+    if isinstance(error, NoTitle):
+        return True
+    if isinstance(error, urllib2.HTTPError):
+        return 400 <= error.code < 500 and error.code not in (408, 429)
+    return False
+
+def retry_delay(attempts):
+    return timedelta(seconds=RETRY_DELAY * 2 ** (attempts - 1))
+
+def error_message(error):
+    try:
+        return unicode(error)[:255]
+    except UnicodeError:
+        return repr(error)[:255]
+
+def resolve_pending(limit=100, workers=WORKERS, timeout=TIMEOUT, max_bytes=MAX_BYTES):
+    """
+    Resolves up to ``limit`` links that are due.  Failed links are retried
+    with exponential backoff until MAX_ATTEMPTS is reached; pages which have
+    no title or answer with a client error are not retried at all.  Returns a (resolved, failed) tuple of
+    counts.
+    """
+
+    links = list(LinkTitle.objects.due()[:limit])
+    if not links:
+        return 0, 0
+
+    pool = ThreadPool(max(1, min(workers, len(links))))
+    try:
+        results = pool.map(_fetch, [(link.url, timeout, max_bytes) for link in links])
+    finally:
+        pool.close()
+        pool.join()
+
+    resolved = failed = 0
+    now = datetime.now()
+    for link, (title, error) in zip(links, results):
+        link.attempts += 1
+        if title is not None:
+            log.debug('Resolved title for "%s": %s' % (link.url, title))
+            link.title = title
+            link.status = LinkTitle.RESOLVED
+            link.last_error = ''
+            resolved += 1
+        else:
+            log.info('Failed to retrieve the title for "%s": %s' % (link.url, error))
+            link.last_error = error_message(error)
+            if is_permanent(error) or link.attempts >= MAX_ATTEMPTS:
+                link.status = LinkTitle.FAILED
+            else:
+                link.next_attempt = now + retry_delay(link.attempts)
+            failed += 1
+        link.save()
+
+    return resolved, failed
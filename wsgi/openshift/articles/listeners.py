@@ -1,9 +1,13 @@
 import logging
 
-from django.db.models import signals, Q
+from django.db.models import signals
 
+from djangosphinx.resultcache import bump_index_generation
+
+from autotag import TagMatcher
+from caching import invalidate_article_caches, invalidate_tag_caches, tag_listing
 from decorators import logtime
-from models import Article, Tag
+from models import Article, ArticleTerm, Tag, chunked, insert_new
 
 log = logging.getLogger('articles.listeners')
 
@@ -11,25 +15,95 @@ log = logging.getLogger('articles.listeners')
 def apply_new_tag(sender, instance, created, using='default', **kwargs):
     """Applies new tags to existing articles that are marked for auto-tagging"""
 
-    # attempt to find all articles that contain the new tag
-    # TODO: make sure this is standard enough... seems that both MySQL and
-    # PostgreSQL support it...
-    tag = r'[[:<:]]%s[[:>:]]' % instance.name
-
-    log.debug('Searching for auto-tag Articles using regex: %s' % (tag,))
-    applicable_articles = Article.objects.filter(
-        Q(auto_tag=True),
-        Q(content__iregex=tag) |
-        Q(title__iregex=tag) |
-        Q(description__iregex=tag) |
-        Q(keywords__iregex=tag)
-    )
-
-    log.debug('Found %s matches' % len(applicable_articles))
-    for article in applicable_articles:
-        #   Have no idea about why Chinese make error, but after deleted it's all OK. Deleted by Spark
-        #log.debug('Applying Tag "%s" (%s) to Article "%s" (%s)' % (instance, instance.pk, article.title, article.pk))
-        article.tags.add(instance)
-        article.save()
+    # narrow the articles down with the term index, then check them properly
+    candidates = ArticleTerm.objects.candidates(instance.name, using)
+    articles = Article.objects.using(using).filter(auto_tag=True)
+    if candidates is None:
+        batches = [articles]
+    else:
+        batches = [articles.filter(id__in=ids) for ids in chunked(candidates)]
+
+    matcher = TagMatcher([(instance.pk, instance.name)])
+    matched = []
+    for batch in batches:
+        matched.extend(pk for pk, title, description, keywords, content in batch
+                       .values_list('id', 'title', 'description', 'keywords', 'content')
+                       .order_by()
+                       if matcher.find(u'\n'.join((content, title, description, keywords))))
+
+    log.debug('Found %s matches' % len(matched))
+    if not matched:
+        return
+
+    # attach the tag with bulk inserts, skipping articles that have it
+    through = Article.tags.through
+    already = set()
+    for ids in chunked(matched):
+        already.update(through.objects.using(using)
+                              .filter(tag=instance, article__in=ids)
+                              .values_list('article', flat=True))
+    rows = insert_new(through, [through(article_id=pk, tag_id=instance.pk)
+                                for pk in matched if pk not in already], using)
+
+    # articles without keywords take them from their tags on save
+    for ids in chunked([row.article_id for row in rows]):
+        Article.objects.using(using).filter(id__in=ids, keywords='').update(keywords=instance.name)
+
+    invalidate_article_caches([instance.name], [tag_listing(instance.pk)])
+
+def article_tags(article):
+    return list(article.tags.values_list('id', 'name'))
+
+def invalidate_article(article, tags, listings=()):
+    listings = set(listings)
+    listings.update(article._listings())
+    listings.update(tag_listing(pk) for pk, name in tags)
+    invalidate_article_caches([name for pk, name in tags], listings)
+
+    # cached searches may list it with its old title, or not at all
+    bump_index_generation(Article.search.get_index())
+
+def invalidate_on_save(sender, instance, **kwargs):
+    """Drops cached listings which may include the saved article"""
+
+    # the article may have moved out of the author or month it was listed in
+    invalidate_article(instance, article_tags(instance), getattr(instance, '_saved_listings', ()))
+
+def remember_tags_on_delete(sender, instance, **kwargs):
+    """The tag relations are gone by post_delete, so grab them now"""
+
+    instance._deleted_tags = article_tags(instance)
+
+def invalidate_on_delete(sender, instance, **kwargs):
+    """Drops cached listings which included the deleted article"""
+
+    invalidate_article(instance, getattr(instance, '_deleted_tags', ()))
+
+def invalidate_on_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drops cached listings when tags are added to or removed from articles"""
+
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if reverse:
+        # instance is a Tag
+        tags = [(instance.pk, instance.name)]
+    elif action == 'pre_clear':
+        tags = article_tags(instance)
+    else:
+        tags = Tag.objects.filter(pk__in=pk_set).values_list('id', 'name')
+
+    invalidate_article_caches([name for pk, name in tags], [tag_listing(pk) for pk, name in tags])
+
+def invalidate_on_tag_changed(sender, instance, **kwargs):
+    """Drops the tag cloud when a tag is renamed or deleted"""
+
+    invalidate_tag_caches()
 
 signals.post_save.connect(apply_new_tag, sender=Tag)
+signals.post_save.connect(invalidate_on_tag_changed, sender=Tag)
+signals.post_delete.connect(invalidate_on_tag_changed, sender=Tag)
+signals.post_save.connect(invalidate_on_save, sender=Article)
+signals.pre_delete.connect(remember_tags_on_delete, sender=Article)
+signals.post_delete.connect(invalidate_on_delete, sender=Article)
+signals.m2m_changed.connect(invalidate_on_tags_changed, sender=Article.tags.through)
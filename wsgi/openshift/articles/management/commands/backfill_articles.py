@@ -0,0 +1,42 @@
+from django.core.management.base import NoArgsCommand
+from django.db.models import Q
+
+from articles.models import Article
+
+# columns filled in by Article.do_render_metadata()
+RENDER_FIELDS = ('brush_files', 'highlight_theme', 'word_count', 'reading_time', 'teaser_html')
+
+class Command(NoArgsCommand):
+    help = """Renders and saves every article that has no rendered content yet,
+and stores the render metadata (brushes, theme, word count, reading time,
+teaser) of articles saved before it existed"""
+
+    def handle_noargs(self, **opts):
+        verbosity = int(opts.get('verbosity', 1))
+
+        # only pull the column we need to decide, then load the few that need work
+        ids = [pk for pk, rendered in Article.objects.values_list('id', 'rendered_content')
+               if not rendered or not len(rendered.strip())]
+
+        for article in Article.objects.filter(id__in=ids):
+            article.save()
+            if verbosity > 1:
+                print 'Rendered article %s' % (article.pk,)
+
+        if verbosity > 0:
+            print 'Backfilled %s article(s)' % (len(ids),)
+
+        # the rest only lacks metadata: write just those columns, skipping the
+        # whole save pipeline (auto-tagging, slugs...)
+        count = 0
+        missing = Article.objects.filter(Q(teaser_html='') | Q(highlight_theme='')).exclude(id__in=ids)
+        for article in missing.iterator():
+            article.do_render_metadata()
+            Article.objects.filter(pk=article.pk).update(
+                **dict((field, getattr(article, field)) for field in RENDER_FIELDS))
+            count += 1
+            if verbosity > 1:
+                print 'Stored render metadata for article %s' % (article.pk,)
+
+        if verbosity > 0:
+            print 'Stored render metadata for %s article(s)' % (count,)
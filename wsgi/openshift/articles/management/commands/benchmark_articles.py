@@ -0,0 +1,208 @@
+from datetime import datetime, timedelta
+from optparse import make_option
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import NoArgsCommand
+from django.db import connections, transaction
+
+from articles.indexes import INDEXES, create_index_sql, create_indexes
+from articles.models import Article, Tag
+
+SCRATCH_ALIAS = 'articles_benchmark'
+CHUNK = 1000
+
+class Command(NoArgsCommand):
+    help = """Times the live article queries (list page, count, article page, tag
+page) and prints their query plans, before and after the composite indexes of
+articles.indexes are created.
+
+By default a scratch SQLite database is seeded with --articles articles.  With
+--database the queries run against an existing database as it is, without
+seeding it or changing its indexes.  --print-sql only prints the CREATE INDEX
+statements, for deployments that do not run the South migrations."""
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--articles', dest='articles', type='int', default=100000,
+                    help='Articles to seed the scratch database with (default: 100000)'),
+        make_option('--tags', dest='tags', type='int', default=200,
+                    help='Tags to seed the scratch database with (default: 200)'),
+        make_option('--repeat', dest='repeat', type='int', default=20,
+                    help='Runs per query (default: 20)'),
+        make_option('--database', dest='database', default=None,
+                    help='Benchmark this existing database instead of a scratch one'),
+        make_option('--print-sql', action='store_true', dest='print_sql', default=False,
+                    help='Print the CREATE INDEX statements and exit'),
+    )
+
+    def handle_noargs(self, **opts):
+        if opts['print_sql']:
+            for sql in create_index_sql(opts['database'] or 'default'):
+                print '%s;' % (sql,)
+            return
+
+        self.repeat = max(opts['repeat'], 1)
+
+        if opts['database']:
+            self.benchmark(opts['database'], 'current indexes')
+            return
+
+        tmpdir = tempfile.mkdtemp()
+        connections.databases[SCRATCH_ALIAS] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(tmpdir, 'articles.db'),
+        }
+        try:
+            call_command('syncdb', database=SCRATCH_ALIAS, interactive=False, verbosity=0)
+
+            started = time.time()
+            self.seed(SCRATCH_ALIAS, opts['articles'], max(opts['tags'], 1))
+            print 'Seeded %s articles in %.1fs' % (opts['articles'], time.time() - started)
+
+            self.benchmark(SCRATCH_ALIAS, 'without composite indexes')
+
+            create_indexes(SCRATCH_ALIAS)
+            self.analyze(SCRATCH_ALIAS)
+            self.benchmark(SCRATCH_ALIAS, 'with %s composite indexes' % (len(INDEXES),))
+        finally:
+            connections[SCRATCH_ALIAS].close()
+            del connections.databases[SCRATCH_ALIAS]
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def seed(self, using, count, tag_count):
+        """Fills the scratch database with raw inserts, bypassing save()"""
+
+        rand = random.Random(0)
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+
+        authors = [User.objects.db_manager(using).create(username='author%s' % i).pk for i in range(5)]
+
+        cursor.executemany('INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (
+                qn(Tag._meta.db_table), qn('name'), qn('slug')),
+            [('tag%s' % i, 'tag%s' % i) for i in range(tag_count)])
+        tags = list(Tag.objects.db_manager(using).values_list('pk', flat=True))
+
+        # a handful of drafts, switched off and future articles, the rest live
+        now = datetime.now()
+        def row(i):
+            return {
+                'title': 'Article %s' % i,
+                'slug': 'article-%s' % i,
+                'status_id': rand.random() < 0.1 and 1 or 2,
+                'author_id': rand.choice(authors),
+                'content': '<p>Article %s</p>' % i,
+                'rendered_content': '<p>Article %s</p>' % i,
+                'teaser_html': '<p>Article %s</p>' % i,
+                'publish_date': now - timedelta(minutes=rand.randint(-60 * 24 * 30, 60 * 24 * 365 * 5)),
+                'is_active': rand.random() > 0.05,
+            }
+
+        def value(field, values):
+            if field.attname in values:
+                return values[field.attname]
+            default = field.get_default()
+            # e.g. addthis_username, when DEFAULT_ADDTHIS_USER is not set
+            if default is None and not field.null and field.empty_strings_allowed:
+                return ''
+            return default
+
+        fields = [f for f in Article._meta.local_fields if not f.primary_key]
+        article_sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            qn(Article._meta.db_table),
+            ', '.join(qn(f.column) for f in fields),
+            ', '.join(['%s'] * len(fields)))
+
+        through = Article.tags.through._meta.db_table
+        tag_sql = 'INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (qn(through), qn('article_id'), qn('tag_id'))
+
+        for start in range(0, count, CHUNK):
+            rows = []
+            for i in range(start, min(start + CHUNK, count)):
+                values = row(i)
+                rows.append([f.get_db_prep_save(value(f, values), connection=connection) for f in fields])
+            cursor.executemany(article_sql, rows)
+
+        # a few tags are popular, most are not
+        tag_rows = []
+        for pk in Article.objects.db_manager(using).values_list('pk', flat=True).iterator():
+            for tag in set(tags[min(int(rand.paretovariate(1)) - 1, len(tags) - 1)]
+                           for n in range(rand.randint(0, 3))):
+                tag_rows.append((pk, tag))
+        for start in range(0, len(tag_rows), CHUNK):
+            cursor.executemany(tag_sql, tag_rows[start:start + CHUNK])
+
+        transaction.commit_unless_managed(using=using)
+        self.analyze(using)
+
+    def analyze(self, using):
+        """Refreshes the planner's statistics"""
+
+        if 'sqlite' in connections[using].settings_dict['ENGINE']:
+            connections[using].cursor().execute('ANALYZE')
+            transaction.commit_unless_managed(using=using)
+
+    def queries(self, using):
+        manager = Article.objects.db_manager(using)
+        sample = manager.live().order_by('?')[:1]
+        if not sample:
+            return []
+        article = sample[0]
+        tag = article.tags.using(using).values_list('pk', flat=True)[:1]
+
+        # ordered the way CursorPaginator orders the list pages
+        queries = [
+            ('list page', lambda: manager.live().order_by('-publish_date', '-id')[:20]),
+            ('article page', lambda: manager.live().filter(publish_date__year=article.publish_date.year,
+                                                           slug=article.slug)),
+        ]
+        if tag:
+            queries.append(('tag page', lambda: manager.live().filter(tags__id=tag[0])
+                                                   .order_by('-publish_date', '-id')[:20]))
+        return queries
+
+    def explain(self, using, query):
+        connection = connections[using]
+        sql, params = query.get_compiler(using=using).as_sql()
+        if 'sqlite' in connection.settings_dict['ENGINE']:
+            sql = 'EXPLAIN QUERY PLAN ' + sql
+        else:
+            sql = 'EXPLAIN ' + sql
+
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        for line in cursor.fetchall():
+            print '    %s' % (' | '.join(unicode(col) for col in line),)
+
+    def timed(self, func):
+        timings = []
+        for n in range(self.repeat):
+            started = time.time()
+            func()
+            timings.append((time.time() - started) * 1000)
+        timings.sort()
+        return timings[0], timings[len(timings) // 2]
+
+    def benchmark(self, using, label):
+        print
+        print '=== %s ===' % (label,)
+
+        for name, make in self.queries(using):
+            print '%s:' % (name,)
+            self.explain(using, make().query)
+            print '  best %.2fms, median %.2fms' % self.timed(lambda: list(make()))
+
+        # what count() runs, minus the ordering it drops
+        count = Article.objects.db_manager(using).live()
+        query = count.query.clone()
+        query.add_count_column()
+        query.clear_ordering(True)
+        print 'count:'
+        self.explain(using, query)
+        print '  best %.2fms, median %.2fms' % self.timed(lambda: Article.objects.db_manager(using).live().count())
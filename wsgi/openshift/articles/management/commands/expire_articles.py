@@ -0,0 +1,52 @@
+from optparse import make_option
+import logging
+import time
+
+from django.core.management.base import NoArgsCommand
+from django.db import connection, reset_queries
+
+from articles.models import Article
+
+log = logging.getLogger('articles.management.commands.expire_articles')
+
+class Command(NoArgsCommand):
+    help = """Marks every article past its expiration date as inactive.  Run it
+from cron, or with --daemon to keep sweeping every --interval seconds."""
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--daemon', action='store_true', dest='daemon', default=False,
+                    help='Keep running and sweep periodically'),
+        make_option('--interval', action='store', dest='interval', type='int', default=60,
+                    help='Seconds between sweeps when running as a daemon (default: 60)'),
+    )
+
+    def handle_noargs(self, **opts):
+        self.verbosity = int(opts.get('verbosity', 1))
+
+        if not opts['daemon']:
+            self.sweep()
+            return
+
+        interval = max(opts['interval'], 1)
+        while True:
+            try:
+                self.sweep()
+            except Exception:
+                # keep the daemon alive through a database hiccup
+                log.exception('Failed to expire articles')
+
+            # don't hold an idle connection (or a growing query log) between sweeps
+            reset_queries()
+            connection.close()
+            time.sleep(interval)
+
+    def sweep(self):
+        expired = Article.objects.expire()
+
+        for pk, title in expired:
+            log.info('Expired article %s: %s' % (pk, title))
+            if self.verbosity > 1:
+                print (u'Expired article %s: %s' % (pk, title)).encode('utf-8')
+
+        if self.verbosity > 0:
+            print 'Expired %s article(s)' % (len(expired),)
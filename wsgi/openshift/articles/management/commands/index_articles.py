@@ -0,0 +1,15 @@
+from django.core.management.base import NoArgsCommand
+
+from articles.models import Article, ArticleTerm
+
+class Command(NoArgsCommand):
+    help = """Rebuilds the term index used to auto-tag articles when tags are added"""
+
+    def handle_noargs(self, **opts):
+        count = 0
+        for article in Article.objects.all().iterator():
+            ArticleTerm.objects.index(article)
+            count += 1
+
+        if int(opts.get('verbosity', 1)) > 0:
+            print 'Indexed %s article(s)' % (count,)
@@ -0,0 +1,57 @@
+from optparse import make_option
+import logging
+import time
+
+from django.core.management.base import NoArgsCommand
+from django.db import connection, reset_queries
+
+from articles import linktitles
+
+log = logging.getLogger('articles.management.commands.resolve_link_titles')
+
+class Command(NoArgsCommand):
+    help = """Fetches the titles of pages linked from articles.  Run it from
+cron, or with --daemon to keep resolving every --interval seconds."""
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--limit', action='store', dest='limit', type='int', default=100,
+                    help='Maximum number of links to resolve per run (default: 100)'),
+        make_option('--workers', action='store', dest='workers', type='int', default=linktitles.WORKERS,
+                    help='Number of concurrent fetches (default: %s)' % linktitles.WORKERS),
+        make_option('--timeout', action='store', dest='timeout', type='float', default=linktitles.TIMEOUT,
+                    help='Seconds to wait for a page (default: %s)' % linktitles.TIMEOUT),
+        make_option('--max-bytes', action='store', dest='max_bytes', type='int', default=linktitles.MAX_BYTES,
+                    help='Maximum number of bytes to read from a page (default: %s)' % linktitles.MAX_BYTES),
+        make_option('--daemon', action='store_true', dest='daemon', default=False,
+                    help='Keep running and resolve periodically'),
+        make_option('--interval', action='store', dest='interval', type='int', default=60,
+                    help='Seconds between runs when running as a daemon (default: 60)'),
+    )
+
+    def handle_noargs(self, **opts):
+        self.verbosity = int(opts.get('verbosity', 1))
+        self.opts = opts
+
+        if not opts['daemon']:
+            self.resolve()
+            return
+
+        interval = max(opts['interval'], 1)
+        while True:
+            try:
+                self.resolve()
+            except Exception:
+                log.exception('Failed to resolve link titles')
+
+            reset_queries()
+            connection.close()
+            time.sleep(interval)
+
+    def resolve(self):
+        resolved, failed = linktitles.resolve_pending(limit=self.opts['limit'],
+                                                      workers=self.opts['workers'],
+                                                      timeout=self.opts['timeout'],
+                                                      max_bytes=self.opts['max_bytes'])
+
+        if self.verbosity > 0:
+            print 'Resolved %s link title(s), %s failed' % (resolved, failed)
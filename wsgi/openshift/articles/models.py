@@ -2,33 +2,58 @@
 from hashlib import sha1
 from datetime import datetime
 import logging
+import math
 import mimetypes
 import re
-import urllib
 
-from django.db import models
-from django.db.models import Q
+from django.db import connection, models, transaction, IntegrityError
+from django.db.models import Count, Max, Q
 from django.contrib.auth.models import User
 from django.contrib.markup.templatetags import markup
 from django.contrib.sites.models import Site
 from django.core.cache import cache
 from django.conf import settings
-from django.template.defaultfilters import slugify, striptags
+from django.template.defaultfilters import slugify
+from django.utils.encoding import force_unicode
+from django.utils.html import escape
 from django.utils.translation import ugettext_lazy as _
-from django.utils.text import truncate_html_words
 
+from autotag import TagMatcher, tokenize
+from caching import invalidate_article_caches, archive_key, navigation_key, \
+     tag_matcher_version, article_listings, tag_listing, AUTHOR_ARCHIVE_KEY, TAG_CLOUD_KEY, CACHE_TIMEOUT
 from decorators import logtime, once_per_instance
+import rendering
 
 
 from ckeditor.fields import RichTextField
 from djangosphinx.models import SphinxSearch
 
 
-WORD_LIMIT = getattr(settings, 'ARTICLES_TEASER_LIMIT', 75)
 AUTO_TAG = getattr(settings, 'ARTICLES_AUTO_TAG', True)
 DEFAULT_DB = getattr(settings, 'ARTICLES_DEFAULT_DB', 'default')
 LOOKUP_LINK_TITLE = getattr(settings, 'ARTICLES_LOOKUP_LINK_TITLE', True)
 
+# tag cloud weights run from 0 to TAG_CLOUD_MAX_WEIGHT; the scale is either
+# 'linear' or 'log' (which keeps a few very popular tags from flattening the rest)
+TAG_CLOUD_MAX_WEIGHT = getattr(settings, 'ARTICLES_TAG_CLOUD_MAX_WEIGHT', 7)
+TAG_CLOUD_SCALE = getattr(settings, 'ARTICLES_TAG_CLOUD_SCALE', 'linear')
+
+# rows per bulk insert and values per ``__in`` lookup; SQLite allows 999
+# parameters and 500 rows per statement
+CHUNK_SIZE = 400
+
+# search results show passages of these fields with the query words
+# highlighted, built by searchd for the shown page only (see BuildExcerpts)
+SEARCH_PASSAGES = getattr(settings, 'ARTICLES_SEARCH_PASSAGES', True)
+SEARCH_PASSAGES_FIELDS = ('title', 'description', 'content')
+SEARCH_PASSAGES_OPTS = getattr(settings, 'ARTICLES_SEARCH_PASSAGES_OPTS', {
+    'before_match': '<strong class="highlight">',
+    'after_match': '</strong>',
+    'chunk_separator': ' ... ',
+    'limit': 200,
+    'around': 5,
+})
+
 MARKUP_HTML = 'h'
 MARKUP_MARKDOWN = 'm'
 MARKUP_REST = 'r'
@@ -50,37 +75,109 @@ DEFAULT_ADDTHIS_USER = getattr(settings, 'DEFAULT_ADDTHIS_USER', None)
 
 # regex used to find links in an article
 LINK_RE = re.compile('<a.*?href="(.*?)".*?>(.*?)</a>', re.I|re.M)
-TITLE_RE = re.compile('<title.*?>(.*?)</title>', re.I|re.M)
+TITLE_RE = re.compile('<title.*?>(.*?)</title>', re.I|re.M|re.S)
 TAG_RE = re.compile('[^a-z0-9\-_\+\:\.]?', re.I)
 
 log = logging.getLogger('articles.models')
 
 #其实你好好的思考下 下面的思路其实就是利用了缓存来缓解数据库服务器的压力 如果缓存里面没有的数据 才从数据库里面去取数据
+USER_NAME_KEY = 'username_for_%s'
+USER_NAME_TIMEOUT = 86400
+
+def _display_name(user):
+    if len(user.get_full_name().strip()):
+        log.debug('Using full name')
+        return user.get_full_name()
+
+    log.debug('Using username')
+    return user.username
+
 def get_name(user):
     """
     Provides a way to fall back to a user's username if their full name has not
     been entered.
     """
 
-    key = 'username_for_%s' % user.id
+    # already looked up along with the rest of a page by cache_names()
+    name = getattr(user, '_display_name', None)
+    if name:
+        return name
+
+    key = USER_NAME_KEY % user.id
 
     log.debug('Looking for "%s" in cache (%s)' % (key, user))
     name = cache.get(key)
     if not name:
         log.debug('Name not found')
-
-        if len(user.get_full_name().strip()):
-            log.debug('Using full name')
-            name = user.get_full_name()
-        else:
-            log.debug('Using username')
-            name = user.username
+        name = _display_name(user)
 
         log.debug('Caching %s as "%s" for a while' % (key, name))
-        cache.set(key, name, 86400) #原来django里面自带了cache 我sb了 应该好好利用下的 看了下文档 和gae的使用相同
+        cache.set(key, name, USER_NAME_TIMEOUT) #原来django里面自带了cache 我sb了 应该好好利用下的 看了下文档 和gae的使用相同
 
     return name
 
+def cache_names(users):
+    """
+    Looks up the names of ``users`` with a single ``cache.get_many`` and keeps
+    them on the user objects, so ``get_name`` does not go back to the cache.
+    """
+
+    users = [user for user in users if user is not None]
+    found = cache.get_many(list(set(USER_NAME_KEY % user.id for user in users)))
+
+    missing = {}
+    for user in users:
+        key = USER_NAME_KEY % user.id
+        name = found.get(key) or missing.get(key)
+        if not name:
+            name = missing[key] = _display_name(user)
+        user._display_name = name
+
+    if missing:
+        cache.set_many(missing, USER_NAME_TIMEOUT)
+
+def chunked(items, size=None):
+    """Splits ``items`` into lists of at most ``size`` (CHUNK_SIZE)"""
+
+    size = size or CHUNK_SIZE
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def insert_new(model, objs, using=DEFAULT_DB):
+    """
+    Inserts ``objs`` with bulk inserts, skipping any that another process
+    inserted first (which breaks a unique constraint).  Returns the objects
+    which were inserted.
+    """
+
+    manager = model._default_manager.db_manager(using)
+    inserted = []
+    for chunk in chunked(objs):
+        if hasattr(manager, 'bulk_create'):
+            sid = transaction.savepoint(using=using)
+            try:
+                manager.bulk_create(chunk)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid, using=using)
+            else:
+                transaction.savepoint_commit(sid, using=using)
+                inserted.extend(chunk)
+                continue
+
+        # one at a time, to find the rows that are there already
+        for obj in chunk:
+            sid = transaction.savepoint(using=using)
+            try:
+                obj.save(using=using, force_insert=True)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid, using=using)
+            else:
+                transaction.savepoint_commit(sid, using=using)
+                inserted.append(obj)
+
+    return inserted
+
 #记得吗 直接给对象添加方法就下面这样简单
 #>>> class CC():
 #...  pass
@@ -94,10 +191,85 @@ def get_name(user):
 #hi
 User.get_name = get_name
 
+# auto-tag matchers built by this process, by database: (version, matcher)
+_tag_matchers = {}
+
+class TagManager(models.Manager):
+
+    def matcher(self, using=DEFAULT_DB):
+        """
+        Returns a TagMatcher over all tag names, mapping to tag ids.  It is
+        built once per process and rebuilt only after tags have changed.
+
+        Renames bump the cached version; the number of tags and the highest
+        id come from the database itself, so tags added or deleted by another
+        process, or rolled back, are noticed even when the cache is not
+        shared.
+        """
+
+        tags = self.get_query_set()
+        if hasattr(tags, 'using'):
+            tags = tags.using(using)
+        stats = tags.aggregate(count=Count('id'), last=Max('id'))
+        version = (tag_matcher_version(), stats['count'], stats['last'])
+
+        built = _tag_matchers.get(using)
+        if built is None or built[0] != version:
+            log.debug('Building the auto-tag matcher for "%s"' % (using,))
+            built = (version, TagMatcher(tags.values_list('id', 'name')))
+            _tag_matchers[using] = built
+
+        return built[1]
+
+    def cloud(self, scale=None):
+        """
+        Returns (name, slug, count, weight) tuples for every tag applied to a
+        live article.  The counts come from a single aggregate query and the
+        list is cached until a tag or an article changes, or for CACHE_TIMEOUT.
+        """
+
+        if (scale or TAG_CLOUD_SCALE) == 'log':
+            scale = 'log'
+        else:
+            scale = 'linear'
+        key = '%s_%s' % (TAG_CLOUD_KEY, scale)
+        tags = cache.get(key)
+        if tags is None:
+            counts = list(self.get_query_set()
+                              .filter(article__is_active=True,
+                                      article__status__is_live=True,
+                                      article__publish_date__lte=datetime.now())
+                              .values_list('name', 'slug')
+                              .annotate(count=Count('article'))
+                              .order_by('name'))
+
+            if scale == 'log':
+                measure = math.log
+            else:
+                measure = float
+
+            if counts:
+                low = measure(min(c[2] for c in counts))
+                high = measure(max(c[2] for c in counts))
+            else:
+                low = high = 0.0
+
+            # avoid dbz when every tag has the same count
+            _range = (high - low) or 1.0
+
+            tags = [(name, slug or Tag.clean_tag(name), count,
+                     int(TAG_CLOUD_MAX_WEIGHT * (measure(count) - low) / _range))
+                    for name, slug, count in counts]
+            cache.set(key, tags, CACHE_TIMEOUT)
+
+        return tags
+
 class Tag(models.Model):
     name = models.CharField(max_length=64, unique=True) #这个应该是博客标签的名字
     slug = models.CharField(max_length=64, unique=True, null=True, blank=True) #咋个slug也在里面
 
+    objects = TagManager()
+
     def __unicode__(self):
         return self.name
 
@@ -169,16 +341,76 @@ class ArticleManager(models.Manager):
 
     def active(self):
         """
-        Retrieves all active articles which have been published and have not
-        yet expired.
+        Retrieves all active articles which have been published.  Expired
+        articles are switched off by the ``expire_articles`` command, so this
+        does not need to compare expiration dates with the current time.
         """
-        now = datetime.now()
         return self.get_query_set().filter(
-                Q(expiration_date__isnull=True) |
-                Q(expiration_date__gte=now),
-                publish_date__lte=now,
+                publish_date__lte=datetime.now(),
+                is_active=True)
+
+    def expired(self):
+        """Retrieves all articles which are still active but have expired"""
+
+        return self.get_query_set().filter(
+                expiration_date__lte=datetime.now(),
                 is_active=True)
 
+    def expire(self):
+        """
+        Marks all expired articles inactive using a single UPDATE and drops
+        the cached listings they appeared in.  Returns a list of (id, title)
+        pairs for the articles that were changed.
+        """
+
+        expired = list(self.expired().values_list('id', 'title'))
+        if not expired:
+            return expired
+
+        ids = [pk for pk, title in expired]
+        self.get_query_set().filter(id__in=ids).update(is_active=False)
+        self.invalidate_caches(ids)
+
+        return expired
+
+    def attach_listing_data(self, articles):
+        """
+        Loads what list pages show about ``articles`` (a list) in bulk: the
+        tags of all of them with one query, and their authors' names with one
+        cache round trip.  Load the articles with ``select_related('author')``
+        so the authors come along too.
+        """
+
+        tags = dict((article.pk, []) for article in articles)
+        if tags:
+            rows = (Article.tags.through.objects.using(self.db)
+                    .filter(article__in=tags.keys())
+                    .select_related('tag')
+                    .order_by('tag__name'))
+            for row in rows:
+                tags[row.article_id].append(row.tag)
+
+        for article in articles:
+            article._tag_list = tags[article.pk]
+
+        cache_names([article.author for article in articles])
+
+    def invalidate_caches(self, ids):
+        """
+        Drops the cached listings and article counts that include the articles
+        ``ids`` (a list or a queryset).  Bulk updates skip the model signals,
+        so they call this instead.
+        """
+
+        listings = set()
+        for author_id, publish_date in self.get_query_set().filter(id__in=ids).values_list('author', 'publish_date'):
+            listings.update(article_listings(author_id, publish_date))
+
+        tags = list(Tag.objects.filter(article__id__in=ids).values_list('id', 'name').distinct())
+        listings.update(tag_listing(pk) for pk, name in tags)
+
+        invalidate_article_caches([name for pk, name in tags], listings)
+
     def live(self, user=None):
         """Retrieves all live articles"""
 
@@ -191,6 +423,91 @@ class ArticleManager(models.Manager):
             # only show live articles to regular users
             return qs.filter(status__is_live=True) #这个东西和is_active=True有啥区别????
 
+    def archives(self, user=None, with_counts=False):
+        """
+        Returns the months in which live articles were published as a list of
+        (year, months) pairs, most recent year first, where months is a tuple
+        of datetimes for the first of each month.  With ``with_counts`` each
+        month is a (datetime, article count) pair instead.
+
+        This runs a single date query (``dates()``, or a GROUP BY on the year
+        and month when counting) and is cached per audience until an article
+        changes, or for CACHE_TIMEOUT.
+        """
+
+        superuser = user is not None and user.is_superuser
+        key = archive_key(superuser, with_counts)
+        archives = cache.get(key)
+        if archives is None:
+            qs = self.live(user=user)
+            if with_counts:
+                column = '%s.%s' % (connection.ops.quote_name(Article._meta.db_table),
+                                    connection.ops.quote_name('publish_date'))
+                months = [(datetime(int(year), int(month), 1), count) for year, month, count in qs
+                          .extra(select={'year': connection.ops.date_extract_sql('year', column),
+                                         'month': connection.ops.date_extract_sql('month', column)})
+                          .values_list('year', 'month')
+                          .annotate(count=Count('id'))
+                          .order_by()]
+                months.sort()
+            else:
+                months = list(qs.dates('publish_date', 'month', order='ASC'))
+
+            by_year = {}
+            for month in months:
+                dt = with_counts and month[0] or month
+                by_year.setdefault(dt.year, []).append(month)
+
+            archives = [(year, tuple(by_year[year])) for year in sorted(by_year, reverse=True)]
+            cache.set(key, archives, CACHE_TIMEOUT)
+
+        return archives
+
+    def neighbours(self, article):
+        """
+        Finds the live articles right after and right before ``article`` in
+        (publish_date, id) order with a single query: a UNION ALL of two
+        keyset lookups that can each stop at the first row of an index on
+        publish_date.  Returns a (next, previous) tuple; missing neighbours
+        are None.  The articles only have the fields needed to link to them
+        loaded.
+        """
+
+        pd, pk = article.publish_date, article.pk
+        qs = self.live().only('id', 'title', 'slug', 'publish_date')
+        after = (qs.filter(Q(publish_date__gt=pd) | Q(publish_date=pd, id__gt=pk))
+                   .order_by('publish_date', 'id'))
+        before = (qs.filter(Q(publish_date__lt=pd) | Q(publish_date=pd, id__lt=pk))
+                    .order_by('-publish_date', '-id'))
+
+        parts, params = [], []
+        for direction, part in (('next', after), ('previous', before)):
+            part = part.extra(select={'direction': "'%s'" % direction})[:1]
+            sql, part_params = part.query.get_compiler(using=part.db).as_sql()
+            # wrapped, so that every database accepts ORDER BY/LIMIT in a UNION
+            parts.append('SELECT * FROM (%s) %s' % (sql, connection.ops.quote_name(direction)))
+            params.extend(part_params)
+
+        found = dict((a.direction, a) for a in self.raw(' UNION ALL '.join(parts), params))
+        return (found.get('next'), found.get('previous'))
+
+    def author_archives(self):
+        """
+        Returns (username, article count) pairs for every author with live
+        articles, computed with a single GROUP BY and cached until an article
+        changes, or for CACHE_TIMEOUT.
+        """
+
+        archives = cache.get(AUTHOR_ARCHIVE_KEY)
+        if archives is None:
+            archives = list(self.live()
+                                .values_list('author__username')
+                                .annotate(count=Count('id'))
+                                .order_by('author__username'))
+            cache.set(AUTHOR_ARCHIVE_KEY, archives, CACHE_TIMEOUT)
+
+        return archives
+
 #MARKUP_HELP = _("""Select the type of markup you are using in this article.
 #<ul>
 #<li><a href="http://daringfireball.net/projects/markdown/basics" target="_blank">Markdown Guide</a></li>
@@ -214,6 +531,13 @@ class Article(models.Model):
     content = RichTextField(verbose_name="内容")  #***********models.TextField() changed by bone
     rendered_content = models.TextField() #神马???是标记后的文档???经过markup模块处理后的???
 
+    # worked out from rendered_content when the article is saved
+    brush_files = models.TextField(blank=True, editable=False, help_text=_('Comma separated SyntaxHighlighter brush files used by the article.'))
+    highlight_theme = models.CharField(max_length=50, blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveIntegerField(default=0, editable=False, help_text=_('Estimated reading time in minutes.'))
+    teaser_html = models.TextField(blank=True, editable=False)
+
     tags = models.ManyToManyField(Tag, help_text=_('Tags that describe this article'), blank=True) #标签 
     auto_tag = models.BooleanField(default=AUTO_TAG, blank=True, help_text=_('Check this if you want to automatically assign any existing tags to this article based on its content.')) #默认值是true 如何自动tag
     followup_for = models.ManyToManyField('self', symmetrical=False, blank=True, help_text=_('Select any other articles that this article follows up on.'), related_name='followups') #与本文相关的文章 进行followup
@@ -243,6 +567,9 @@ class Article(models.Model):
         },
         mode='SPH_MATCH_EXTENDED', #扩展查询模式中可以使用如下特殊操作符
         rankmode='SPH_RANK_PROXIMITY_BM25', #目前只在 SPH_MATCH_EXTENDED2 这个匹配模式中提供 这个效果最好
+        passages=SEARCH_PASSAGES,
+        passages_fields=SEARCH_PASSAGES_FIELDS,
+        passages_opts=SEARCH_PASSAGES_OPTS,
     )
     #增量模式
     #searchdelta = SphinxSearch(
@@ -260,47 +587,68 @@ class Article(models.Model):
     objects = ArticleManager()
 
     def __init__(self, *args, **kwargs):
-        """Makes sure that we have some rendered content to use"""
+        """
+        Loading an article never writes to the database.  Expired articles are
+        deactivated by the ``expire_articles`` command and missing rendered
+        content is filled in by ``backfill_articles``.
+        """
 
         super(Article, self).__init__(*args, **kwargs)
 
-        self._next = None
-        self._previous = None
-        self._teaser = None
-
-        if self.id:
-            # mark the article as inactive if it's expired and still active
-            if self.expiration_date and self.expiration_date <= datetime.now() and self.is_active:
-                self.is_active = False
-                self.save() #为啥在初始化的时候就save这个对象到数据库???--这里貌似是已经存了的,立即又存,我也不懂
-
-            if not self.rendered_content or not len(self.rendered_content.strip()):
-                self.save()
+        self._navigation = None
+        self._remember_saved_state()
 
     def __unicode__(self):
         return self.title
 
+    def _slug_source(self):
+        """
+        The values the slug is derived from, and the slug itself so that an
+        edited slug is checked again; deferred fields count as unknown
+        """
+
+        publish_date = self.__dict__.get('publish_date')
+        return (self.__dict__.get('title'), getattr(publish_date, 'year', None), self.__dict__.get('slug'))
+
+    def _listings(self):
+        """The listings the article shows up in, apart from its tags'"""
+
+        return article_listings(self.__dict__.get('author_id'), self.__dict__.get('publish_date'))
+
+    def _remember_saved_state(self):
+        """Remembers what the stored row says, to tell what a save changes"""
+
+        self._saved_slug_source = self._slug_source()
+        self._saved_listings = self._listings()
+
     def save(self, *args, **kwargs):
-        """Renders the article using the appropriate markup language."""
+        """
+        Renders the article and fills in every derived column before the one
+        INSERT or UPDATE.  Only keywords built from the tags need the article
+        to have an ID, and they are written with a targeted UPDATE when they
+        change.
+        """
 
-        using = kwargs.get('using', DEFAULT_DB)
+        # Manager.create() passes using=None along with force_insert
+        using = kwargs.get('using') or DEFAULT_DB
 
         ###self.do_render_markup() #delete by bone
         self.rendered_content = self.content #add by bone
+        self.do_render_metadata()
         self.do_addthis_button()
         self.do_meta_description()
         self.do_unique_slug(using)
-
         super(Article, self).save(*args, **kwargs)
+        self._remember_saved_state()
 
         # do some things that require an ID first
-        requires_save = self.do_auto_tag(using)
-        requires_save |= self.do_tags_to_keywords()
-        requires_save |= self.do_default_site(using)
+        self.do_auto_tag(using)
+        self.do_default_site(using)
+        if self.do_tags_to_keywords():
+            Article.objects.using(using).filter(pk=self.pk).update(keywords=self.keywords)
 
-        if requires_save:
-            # bypass the other processing
-            super(Article, self).save()
+        self.do_queue_link_titles(using)
+        ArticleTerm.objects.index(self, using)
     
     #delete this function
     #def do_render_markup(self):
@@ -321,6 +669,19 @@ class Article(models.Model):
         #self.rendered_content = self.content #to add highlight javascript
         #return (self.rendered_content != original)
 
+    def do_render_metadata(self):
+        """
+        Works out everything the pages need to know about the rendered content,
+        so that they never have to parse it.
+        """
+
+        html = self.rendered_content
+        self.brush_files = ','.join(rendering.brush_files(html))
+        self.highlight_theme = rendering.highlight_theme(html)
+        self.word_count = rendering.word_count(html)
+        self.reading_time = rendering.reading_time(self.word_count)
+        self.teaser_html = rendering.teaser(html, self.description)
+
     def do_addthis_button(self):
         """Sets the AddThis username for this post"""
 
@@ -335,32 +696,31 @@ class Article(models.Model):
     def do_unique_slug(self, using=DEFAULT_DB):
         """
         Ensures that the slug is always unique for the year this article was
-        posted
+        posted.  The slug is only worked out again when the title, the year or
+        the slug itself changed since the article was loaded or last saved.
+
+        Returns True if the slug was (re)computed, False otherwise.
         """
         # Changed by Spark.
-        if not self.id:
-            # make sure we have a slug first
-            #if not len(self.slug.strip()):
-            #    self.slug = slugify(self.title)
-            self.slug = "-".join(self.title.strip().split())
-            self.slug = self.get_unique_slug(self.slug, using)
-            
-            return True
-        else :
-            self.slug = "-".join(self.title.strip().split())
-            self.slug = self.get_unique_slug(self.slug, using)       
+        if self.id and self.slug and self._slug_source() == self._saved_slug_source:
             return False
 
+        self.slug = "-".join(self.title.strip().split())
+        self.slug = self.get_unique_slug(self.slug, using)
+        return True
+
     def do_tags_to_keywords(self):
         """
         If meta keywords is empty, sets them using the article tags.
 
-        Returns True if an additional save is required, False otherwise.
+        Returns True if the keywords changed, False otherwise.
         """
 
         if len(self.keywords.strip()) == 0:
-            self.keywords = ', '.join([t.name for t in self.tags.all()])
-            return True
+            keywords = ', '.join(self.tags.values_list('name', flat=True))
+            if keywords != self.keywords:
+                self.keywords = keywords
+                return True
 
         return False
 
@@ -368,7 +728,7 @@ class Article(models.Model):
         """
         If meta description is empty, sets it to the article's teaser.
 
-        Returns True if an additional save is required, False otherwise.
+        Returns True if the description changed, False otherwise.
         """
 
         if len(self.description.strip()) == 0:
@@ -383,7 +743,7 @@ class Article(models.Model):
         """
         Performs the auto-tagging work if necessary.
 
-        Returns True if an additional save is required, False otherwise.
+        Returns True if any tags were added, False otherwise.
         """
 
         if not self.auto_tag:
@@ -391,22 +751,23 @@ class Article(models.Model):
             return False
 
         # don't clobber any existing tags!
-        existing_ids = [t.id for t in self.tags.all()]
+        existing_ids = set(self.tags.values_list('id', flat=True))
         log.debug('Article %s already has these tags: %s' % (self.pk, existing_ids))
 
-        unused = Tag.objects.all()
-        if hasattr(unused, 'using'):
-            unused = unused.using(using)
-        unused = unused.exclude(id__in=existing_ids)
+        # separate the fields so that a tag can't match across two of them
+        to_search = u'\n'.join(force_unicode(text) for text in
+                               (self.content, self.title, self.description, self.keywords))
+        new_ids = Tag.objects.matcher(using).find(to_search) - existing_ids
+
+        if new_ids:
+            # a tag may have gone since the matcher was built
+            new_ids = set(Tag.objects.using(using).filter(pk__in=new_ids).values_list('id', flat=True))
 
         found = False
-        to_search = (self.content, self.title, self.description, self.keywords)
-        for tag in unused:
-            regex = re.compile(r'\b%s\b' % tag.name, re.I)
-            if any(regex.search(text) for text in to_search):
-                log.debug('Applying Tag "%s" (%s) to Article %s' % (tag, tag.pk, self.pk))
-                self.tags.add(tag)
-                found = True
+        if new_ids:
+            log.debug('Applying Tags %s to Article %s' % (sorted(new_ids), self.pk))
+            self.tags.add(*new_ids)
+            found = True
 
         return found
 
@@ -415,105 +776,82 @@ class Article(models.Model):
         If no site was selected, selects the site used to create the article
         as the default site.
 
-        Returns True if an additional save is required, False otherwise.
+        Returns True if the site was added, False otherwise.
         """
 
-        if not len(self.sites.all()):
-            sites = Site.objects.all()
-            if hasattr(sites, 'using'):
-                sites = sites.using(using)
-            self.sites.add(sites.get(pk=settings.SITE_ID))
+        if not self.sites.exists():
+            self.sites.add(settings.SITE_ID)
             return True
 
         return False
 
     def get_unique_slug(self, slug, using=DEFAULT_DB):
-        """Iterates until a unique slug is found"""
+        """
+        Picks the first free slug of ``slug``, ``slug-1``, ``slug-2``... for
+        the year this article was posted, fetching every colliding slug in a
+        single query.
+        """
 
         # we need a publish date before we can do anything meaningful
         if type(self.publish_date) is not datetime:
             return slug
 
+        taken = Article.objects.all()
+        if hasattr(taken, 'using'):
+            taken = taken.using(using)
+        taken = taken.filter(publish_date__year=self.publish_date.year, slug__startswith=slug)
+        if self.pk:
+            taken = taken.exclude(pk=self.pk)
+        taken = set(taken.values_list('slug', flat=True))
+
         orig_slug = slug
-        year = self.publish_date.year
         counter = 1
-
-        while True:
-            not_unique = Article.objects.all()
-            if hasattr(not_unique, 'using'):
-                not_unique = not_unique.using(using)
-            not_unique = not_unique.filter(publish_date__year=year, slug=slug)
-
-            if len(not_unique) == 0:
-                return slug
-
+        while slug in taken:
             slug = '%s-%s' % (orig_slug, counter)
             counter += 1
+
+        return slug
     
-    #此函数可以找到一篇文章里面所有的链接 晕死 他还去爬人家的网页 获取网页的title之类的 是不是浪费了点
-    def _get_article_links(self):
-        """
-        Find all links in this article.  When a link is encountered in the
-        article text, this will attempt to discover the title of the page it
-        links to.  If there is a problem with the target page, or there is no
-        title (ie it's an image or other binary file), the text of the link is
-        used as the title.  Once a title is determined, it is cached for a week
-        before it will be requested again.
-        """
+    def _find_links(self):
+        """Returns (url, link text) pairs for every distinct link in the article"""
 
         links = []
-
-        # find all links in the article
-        log.debug('Locating links in article: %s' % (self,))
         for link in LINK_RE.finditer(self.rendered_content):
             url = link.group(1)
-            log.debug('Do we have a title for "%s"?' % (url,))
-            key = 'href_title_' + sha1(url).hexdigest()
-
-            # look in the cache for the link target's title
-            title = cache.get(key)
-            if title is None:
-                log.debug('Nope... Getting it and caching it.')
-                title = link.group(2)
-
-                if LOOKUP_LINK_TITLE:
-                    try:
-                        log.debug('Looking up title for URL: %s' % (url,))
-                        # open the URL
-                        c = urllib.urlopen(url)
-                        html = c.read()
-                        c.close()
-
-                        # try to determine the title of the target
-                        title_m = TITLE_RE.search(html)
-                        if title_m:
-                            title = title_m.group(1)
-                            log.debug('Found title: %s' % (title,))
-                    except:
-                        # if anything goes wrong (ie IOError), use the link's text
-                        log.warn('Failed to retrieve the title for "%s"; using link text "%s"' % (url, title))
-
-                # cache the page title for a week
-#                log.debug('Using "%s" as title for "%s"' % (title, url))
-                cache.set(key, title, 604800)
-
-            # add it to the list of links and titles
             if url not in (l[0] for l in links):
-                links.append((url, title))
+                links.append((url, link.group(2)))
 
-        return tuple(links)
-    links = property(_get_article_links)
+        return links
+
+    def do_queue_link_titles(self, using=DEFAULT_DB):
+        """
+        Makes sure every link in the article has an entry in the link title
+        store.  The titles themselves are fetched in the background by the
+        ``resolve_link_titles`` command.
+        """
+
+        if not LOOKUP_LINK_TITLE:
+            return False
 
-    #对于统计汉字个数无效 需要修改
-    def _get_word_count(self):
-        """Stupid word counter for an article."""
+        urls = [url for url, text in self._find_links()]
+        return LinkTitle.objects.queue(urls, using) > 0
 
-        import re
-        cjkReg = re.compile(u'[\u1100-\uFFFDh]+?')
-        inputString = striptags(self.rendered_content)
-        trimedCJK = cjkReg.sub( ' a ', inputString, 0)
-        return len(trimedCJK.split())
-    word_count = property(_get_word_count)
+    def _get_article_links(self):
+        """
+        Find all links in this article, along with the title of the page each
+        one points to.  Titles are read from the link title store only; links
+        whose title has not been resolved (yet) use the text of the link.
+        """
+
+        links = self._find_links()
+        if not links:
+            return ()
+
+        log.debug('Looking up titles for %s links in article: %s' % (len(links), self.pk))
+        titles = LinkTitle.objects.titles(url for url, text in links)
+
+        return tuple((url, titles.get(url) or text) for url, text in links)
+    links = property(_get_article_links)
 
     @models.permalink
     def get_absolute_url(self):
@@ -523,41 +861,64 @@ class Article(models.Model):
         """
         Retrieve some part of the article or the article's description.
         """
-        if not self._teaser:
-            if len(self.description.strip()):
-                self._teaser = self.description
-            else:
-                self._teaser = truncate_html_words(self.rendered_content, WORD_LIMIT)
+        if not self.teaser_html:
+            # not saved since the teaser started being stored
+            return rendering.teaser(self.rendered_content, self.description)
 
-        return self._teaser
+        return self.teaser_html
     teaser = property(_get_teaser)
+
+    # the plain text search passages are built from; the highlighting is the
+    # only markup in them, so templates can show them as they are
+    def get_title_passage_text(self):
+        return escape(self.title)
+
+    def get_description_passage_text(self):
+        return escape(rendering.plain_text(self.description))
+
+    def get_content_passage_text(self):
+        # content, not rendered_content: it is what the index was built from
+        return escape(rendering.plain_text(self.content))
+
+    def _get_brush_file_list(self):
+        return [f for f in self.brush_files.split(',') if f]
+    brush_file_list = property(_get_brush_file_list)
+
+    def _get_tag_list(self):
+        """The article's tags; list pages load them in bulk (see ``attach_listing_data``)"""
+
+        tags = getattr(self, '_tag_list', None)
+        if tags is None:
+            return list(self.tags.all())
+        return tags
+    tag_list = property(_get_tag_list)
     
-    #由此看获取上下一篇文章均是根据出版日期来的 并且还是显示第一篇文章和最后一篇文章 是不是bug???
+    def get_navigation(self):
+        """
+        Returns the (next, previous) live articles, by publish date and then
+        id, either of which may be None.  Both come from one query, which is
+        cached until any article changes, or for CACHE_TIMEOUT.
+        """
+
+        if self._navigation is None:
+            key = navigation_key(self.pk)
+            navigation = cache.get(key)
+            if navigation is None:
+                navigation = Article.objects.neighbours(self)
+                cache.set(key, navigation, CACHE_TIMEOUT)
+            self._navigation = navigation
+
+        return self._navigation
+
     def get_next_article(self):
         """Determines the next live article"""
 
-        if not self._next:
-            try:
-                qs = Article.objects.live().exclude(id__exact=self.id)
-                article = qs.filter(publish_date__gte=self.publish_date).order_by('publish_date')[0]
-            except (Article.DoesNotExist, IndexError):
-                article = None
-            self._next = article
-
-        return self._next
+        return self.get_navigation()[0]
 
     def get_previous_article(self):
         """Determines the previous live article"""
 
-        if not self._previous:
-            try:
-                qs = Article.objects.live().exclude(id__exact=self.id) #排除文章在filter里面 学到!!!
-                article = qs.filter(publish_date__lte=self.publish_date).order_by('-publish_date')[0]
-            except (Article.DoesNotExist, IndexError):
-                article = None
-            self._previous = article
-
-        return self._previous
+        return self.get_navigation()[1]
 
     class Meta:
         ordering = ('-publish_date', 'title')
@@ -591,3 +952,153 @@ class Attachment(models.Model):
 
         return content_type
 
+
+class LinkTitleManager(models.Manager):
+
+    def queue(self, urls, using=DEFAULT_DB):
+        """
+        Adds the URLs which are not in the store yet, so that their titles get
+        resolved.  Returns the number of URLs added.
+        """
+
+        by_hash = dict((LinkTitle.hash_url(url), url) for url in urls)
+        if not by_hash:
+            return 0
+
+        qs = self.get_query_set()
+        if hasattr(qs, 'using'):
+            qs = qs.using(using)
+        known = set(qs.filter(url_hash__in=by_hash.keys()).values_list('url_hash', flat=True))
+
+        added = 0
+        for url_hash, url in by_hash.items():
+            if url_hash in known:
+                continue
+
+            sid = transaction.savepoint(using=using)
+            try:
+                LinkTitle(url_hash=url_hash, url=url).save(using=using, force_insert=True)
+            except IntegrityError:
+                # another article linking to it was saved since we looked
+                transaction.savepoint_rollback(sid, using=using)
+            else:
+                transaction.savepoint_commit(sid, using=using)
+                added += 1
+
+        return added
+
+    def titles(self, urls):
+        """Returns a dict mapping each of ``urls`` that has a resolved title to it"""
+
+        by_hash = dict((LinkTitle.hash_url(url), url) for url in urls)
+        if not by_hash:
+            return {}
+
+        resolved = self.get_query_set().filter(url_hash__in=by_hash.keys(),
+                                               status=LinkTitle.RESOLVED)
+        return dict((by_hash[url_hash], title)
+                    for url_hash, title in resolved.values_list('url_hash', 'title'))
+
+    def due(self):
+        """Retrieves the links whose title should be (re)tried now"""
+
+        return self.get_query_set().filter(status=LinkTitle.PENDING,
+                                           next_attempt__lte=datetime.now())
+
+class LinkTitle(models.Model):
+    """
+    The title of a page an article links to, resolved in the background by
+    the ``resolve_link_titles`` command.
+    """
+    PENDING = 'p'
+    RESOLVED = 'r'
+    FAILED = 'f'
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (RESOLVED, _('Resolved')),
+        (FAILED, _('Failed')),
+    )
+
+    url_hash = models.CharField(max_length=40, unique=True)
+    url = models.TextField()
+    title = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=datetime.now, db_index=True)
+    last_error = models.CharField(max_length=255, blank=True)
+
+    objects = LinkTitleManager()
+
+    class Meta:
+        ordering = ('next_attempt',)
+
+    def __unicode__(self):
+        return self.url
+
+    @staticmethod
+    def hash_url(url):
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        return sha1(url).hexdigest()
+
+class ArticleTermManager(models.Manager):
+
+    def index(self, article, using=DEFAULT_DB):
+        """Brings the terms indexed for ``article`` up to date"""
+
+        terms = tokenize(u'\n'.join(force_unicode(text) for text in
+                                    (article.title, article.description, article.keywords, article.content)))
+
+        qs = self.get_query_set()
+        if hasattr(qs, 'using'):
+            qs = qs.using(using)
+        qs = qs.filter(article=article)
+
+        indexed = set(qs.values_list('term', flat=True))
+        removed = indexed - terms
+        added = terms - indexed
+
+        for terms in chunked(removed):
+            qs.filter(term__in=terms).delete()
+
+        # the article may be indexed by another process at the same time
+        insert_new(self.model, [self.model(term=term, article_id=article.pk) for term in added], using)
+
+        log.debug('Indexed article %s: %s terms added, %s removed' % (article.pk, len(added), len(removed)))
+
+    def candidates(self, name, using=DEFAULT_DB):
+        """
+        Returns the ids of the auto-tagged articles which contain every term
+        of ``name``, or None when the name has no terms to look up.
+        """
+
+        terms = tokenize(name)
+        if not terms:
+            return None
+
+        qs = self.get_query_set()
+        if hasattr(qs, 'using'):
+            qs = qs.using(using)
+
+        return [row['article'] for row in qs
+                .filter(term__in=terms, article__auto_tag=True)
+                .values('article')
+                .annotate(matched=Count('term'))
+                .filter(matched=len(terms))
+                .order_by()]
+
+class ArticleTerm(models.Model):
+    """
+    Inverted index of the words (and CJK characters) in each article, used to
+    find the articles a new tag applies to without scanning them all.
+    """
+    term = models.CharField(max_length=64)
+    article = models.ForeignKey(Article, related_name='terms')
+
+    objects = ArticleTermManager()
+
+    class Meta:
+        unique_together = (('term', 'article'),)
+
+    def __unicode__(self):
+        return self.term
@@ -0,0 +1,158 @@
+"""
+Paginators for article listings.
+
+``CachedCountPaginator`` is Django's paginator with the total kept in the
+cache, so paging through a listing does not count it again on every page.
+
+``django.core.paginator.Paginator`` counts the whole listing and then has the
+database skip ``(page - 1) * per_page`` rows, so deep pages get slower the
+deeper they are.  ``CursorPaginator`` instead remembers the (publish_date, id)
+of the last article shown and asks for the articles right after it, which
+costs the same on every page.
+
+Cursors are plain strings such as ``n20120315101500000000-42``: the direction
+(``n`` for the articles after, ``p`` for the articles before), then the
+publish date and id of the article the page starts from.  They only depend on
+that article, so the URLs built from them stay the same as long as it exists.
+"""
+from datetime import datetime
+import math
+import re
+
+from django.core.cache import cache
+from django.core.paginator import Paginator, InvalidPage, EmptyPage
+from django.db.models import Q
+
+__all__ = ('CachedCountPaginator', 'CursorPaginator', 'CursorPage', 'InvalidCursor',
+           'encode_cursor', 'decode_cursor')
+
+NEXT, PREVIOUS = 'n', 'p'
+DATE_FORMAT = '%Y%m%d%H%M%S%f'
+CURSOR_RE = re.compile(r'^([np])(\d{20})-(\d+)$')
+
+class InvalidCursor(InvalidPage):
+    pass
+
+def encode_cursor(article, direction=NEXT):
+    return '%s%s-%s' % (direction, article.publish_date.strftime(DATE_FORMAT), article.pk)
+
+def decode_cursor(cursor):
+    """Returns the (direction, publish_date, id) stored in ``cursor``"""
+
+    match = CURSOR_RE.match(cursor or '')
+    if match is None:
+        raise InvalidCursor('That cursor is not valid')
+
+    direction, date, pk = match.groups()
+    try:
+        return direction, datetime.strptime(date, DATE_FORMAT), int(pk)
+    except ValueError:
+        raise InvalidCursor('That cursor is not valid')
+
+class CachedCountMixin(object):
+    """
+    Keeps the total number of objects under ``count_key`` in the cache for
+    ``count_timeout`` seconds.  Whoever changes the listing is expected to
+    delete the key (see ``caching.listing_count_key``).
+    """
+    count_key = None
+    count_timeout = 300
+
+    def _get_count(self):
+        if self._count is None:
+            if self.count_key:
+                self._count = cache.get(self.count_key)
+            if self._count is None:
+                self._count = self.object_list.count()
+                if self.count_key:
+                    cache.set(self.count_key, self._count, self.count_timeout)
+        return self._count
+    count = property(_get_count)
+
+class CachedCountPaginator(CachedCountMixin, Paginator):
+
+    def __init__(self, object_list, per_page, count_key=None, count_timeout=300, **kwargs):
+        super(CachedCountPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.count_timeout = count_timeout
+
+class CursorPaginator(CachedCountMixin):
+    """
+    Pages through ``object_list`` newest first, by (publish_date, id).  The
+    total is only worked out when something asks for it.
+    """
+    cursor_mode = True
+
+    def __init__(self, object_list, per_page, count_key=None, count_timeout=300):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.count_key = count_key
+        self.count_timeout = count_timeout
+        self._count = None
+
+    def page(self, cursor=None):
+        """Returns the page ``cursor`` points at, or the first one"""
+
+        if not cursor:
+            return self._page(self.object_list.order_by('-publish_date', '-id'), None)
+
+        direction, date, pk = decode_cursor(cursor)
+        if direction == NEXT:
+            qs = self.object_list.filter(Q(publish_date__lt=date) | Q(publish_date=date, id__lt=pk))
+            return self._page(qs.order_by('-publish_date', '-id'), NEXT)
+
+        qs = self.object_list.filter(Q(publish_date__gt=date) | Q(publish_date=date, id__gt=pk))
+        return self._page(qs.order_by('publish_date', 'id'), PREVIOUS)
+
+    def _page(self, qs, direction):
+        # one extra row tells whether there is anything beyond this page
+        objects = list(qs[:self.per_page + 1])
+        more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+
+        if direction == PREVIOUS:
+            objects.reverse()
+            return CursorPage(objects, self, has_previous=more, has_next=True)
+
+        if not objects and direction is not None:
+            raise EmptyPage('That page contains no results')
+        return CursorPage(objects, self, has_previous=direction is not None, has_next=more)
+
+    def _get_num_pages(self):
+        return max(int(math.ceil(self.count / float(self.per_page))), 1)
+    num_pages = property(_get_num_pages)
+
+class CursorPage(object):
+    # cursor pages have no number; page links use the cursors instead
+    number = None
+
+    def __init__(self, object_list, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next and bool(object_list)
+
+    def __repr__(self):
+        return '<Page %s>' % (self.object_list and encode_cursor(self.object_list[0], NEXT) or 'empty')
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_cursor(self):
+        if self.has_next():
+            return encode_cursor(self.object_list[-1], NEXT)
+        return ''
+
+    def previous_cursor(self):
+        if self.has_previous():
+            return encode_cursor(self.object_list[0], PREVIOUS)
+        return ''
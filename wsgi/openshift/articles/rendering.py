@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Metadata derived from an article's rendered HTML.  ``Article.save()`` stores
+the results, so pages never have to parse the content of an article.
+"""
+from HTMLParser import HTMLParser
+import math
+import re
+
+from django.conf import settings
+from django.utils.encoding import force_unicode
+from django.utils.text import truncate_html_words
+
+WORD_LIMIT = getattr(settings, 'ARTICLES_TEASER_LIMIT', 75)
+# words (or CJK characters) read per minute, for the reading time estimate
+READING_SPEED = getattr(settings, 'ARTICLES_READING_SPEED', 200)
+
+#add by bone
+#Brush aliases and his File name(for sytax highlight)
+BRUSH_JSFILE={
+  "as3":"shBrushAS3.js","actionscript3":"shBrushAS3.js",
+  "bash":"shBrushBash.js","shell":"shBrushBash.js",
+  "cf":"shBrushColdFusion.js","coldfusion":"shBrushColdFusion.js",
+  "c-sharp":"shBrushCSharp.js","csharp":"shBrushCSharp.js",
+  "cpp":"shBrushCpp.js","c":"shBrushCpp.js",
+  "css":"shBrushCss.js",
+  "delphi":"shBrushDelphi.js","pas":"shBrushDelphi.js","pascal":"shBrushDelphi.js",
+  "diff":"shBrushDiff.js","patch":"shBrushDiff.js",
+  "erl":"shBrushErlang.js","erlang":"shBrushErlang.js",
+  "groovy":"shBrushGroovy.js",
+  "js":"shBrushJScript.js","jscript":"shBrushJScript.js","javascript":"shBrushJScript.js",
+  "java":"shBrushJava.js",
+  "jfx":"shBrushJavaFX.js","javafx":"shBrushJavaFX.js",
+  "perl":"shBrushPerl.js","pl":"shBrushPerl.js",
+  "php":"shBrushPhp.js",
+  "plain":"shBrushPlain.js","text":"shBrushPlain.js",
+  "ps":"shBrushPowerShell.js","powershell":"shBrushPowerShell.js",
+  "py":"shBrushPython.js","python":"shBrushPython.js",
+  "rails":"shBrushRuby.js","ror":"shBrushRuby.js","ruby":"shBrushRuby.js",
+  "scala":"shBrushScala.js",
+  "sql":"shBrushSql.js",
+  "vb":"shBrushVb.js","vbnet":"shBrushVb.js",
+  "xml":"shBrushXml.js","xhtml":"shBrushXml.js","xslt":"shBrushXml.js","html":"shBrushXml.js",
+}
+#sytax highlight style
+HIGHLIGHT_STYLE={
+  "Default":"shThemeDefault.css",
+  "Django":"shThemeDjango.css",
+  "Eclipse":"shThemeEclipse.css",
+  "Emacs":"shThemeEmacs.css",
+  "FadeToGrey":"shThemeFadeToGrey.css",
+  "Midnight":"shThemeMidnight.css",
+  "RDark":"shThemeRDark.css",
+}
+#add over
+
+#<pre class="brush:python;">
+#<pre class="brush:python;collapse:true;ruler:true;wrap-lines:false;">
+BRUSH_RE = re.compile(r'<pre class="brush:([\w-]+);')
+THEME_RE = re.compile(r'<!--\s*code_highlight_theme:\s*(\w+)\s*-->')
+CJK_RE = re.compile(u'[\u1100-\ufffd]+?')
+# striptags() would run the text of neighbouring blocks together
+TAG_RE = re.compile(r'<[^>]*>')
+
+def brush_files(html):
+    """The SyntaxHighlighter brush files needed by the code blocks in ``html``"""
+
+    files = []
+    for brush in BRUSH_RE.findall(html):
+        jsfile = BRUSH_JSFILE.get(brush.lower())
+        if jsfile and jsfile not in files:
+            files.append(jsfile)
+
+    return files
+
+def highlight_theme(html):
+    """The stylesheet of the last theme picked in ``html``, or the default one"""
+
+    for style in reversed(THEME_RE.findall(html)):
+        for name, stylesheet in HIGHLIGHT_STYLE.items():
+            if name.lower() == style.lower():
+                return stylesheet
+
+    return HIGHLIGHT_STYLE['Default']
+
+def word_count(html):
+    """Counts the words of ``html``; every CJK character counts as a word"""
+
+    return len(CJK_RE.sub(' a ', TAG_RE.sub(' ', html)).split())
+
+def reading_time(words):
+    """Minutes it takes to read ``words`` words, rounded up"""
+
+    return int(math.ceil(words / float(max(READING_SPEED, 1))))
+
+def plain_text(html):
+    """
+    The text of ``html`` on one line, with its entities unescaped, e.g. to
+    build search passages from.  It is not safe to output as HTML.
+    """
+
+    return u' '.join(HTMLParser().unescape(TAG_RE.sub(u' ', force_unicode(html))).split())
+
+def teaser(html, description=''):
+    """The article's description, or the beginning of its content"""
+
+    if len(description.strip()):
+        return description
+
+    return truncate_html_words(html, WORD_LIMIT)
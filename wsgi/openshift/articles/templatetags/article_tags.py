@@ -1,10 +1,7 @@
 # -*- coding: utf-8 -*-
 from django import template
-from django.core.cache import cache
 from django.core.urlresolvers import resolve, reverse, Resolver404
-from django.db.models import Count
 from articles.models import Article, Tag
-from datetime import datetime
 import math
 
 register = template.Library()
@@ -113,58 +110,48 @@ class GetArticleArchivesNode(template.Node):
     """
     Retrieves a list of years and months in which articles have been posted.
     """
-    def __init__(self, varname):
+    def __init__(self, varname, with_counts=False):
         self.varname = varname
+        self.with_counts = with_counts
 
     def render(self, context):
-        cache_key = 'article_archive_list'
-        dt_archives = cache.get(cache_key)
-        if dt_archives is None:
-            archives = {}
-            user = context.get('user', None)
-
-            # iterate over all live articles
-            for article in Article.objects.live(user=user).select_related():
-                pub = article.publish_date
-
-                # see if we already have an article in this year
-                if not archives.has_key(pub.year):
-                    # if not, initialize a dict for the year
-                    archives[pub.year] = {}
-
-                # make sure we know that we have an article posted in this month/year
-                archives[pub.year][pub.month] = True
-
-            dt_archives = []
-
-            # now sort the years, so they don't appear randomly on the page
-            years = list(int(k) for k in archives.keys())
-            years.sort()
+        user = context.get('user', None)
 
-            # more recent years will appear first in the resulting collection
-            years.reverse()
+        # put our collection into the context
+        context[self.varname] = Article.objects.archives(user=user, with_counts=self.with_counts)
+        return ''
 
-            # iterate over all years
-            for year in years:
-                # sort the months of this year in which articles were posted
-                m = list(int(k) for k in archives[year].keys())
-                m.sort()
+def get_article_archives(parser, token):
+    """
+    Retrieves a list of years and months in which articles have been posted.
+    Add ``with_counts`` to get (month, article count) pairs instead of months.
+    """
+    args = token.split_contents()
+    argc = len(args)
 
-                # now create a list of datetime objects for each month/year
-                months = [datetime(year, month, 1) for month in m]
+    try:
+        assert (argc == 3 or (argc == 4 and args[3] == 'with_counts')) and args[1] == 'as'
+    except AssertionError:
+        raise template.TemplateSyntaxError('get_article_archives syntax: {% get_article_archives as varname [with_counts] %}')
 
-                # append this list to our final collection
-                dt_archives.append( ( year, tuple(months) ) )
+    return GetArticleArchivesNode(args[2], with_counts=(argc == 4))
 
-            cache.set(cache_key, dt_archives)
+class GetAuthorArchivesNode(template.Node):
+    """
+    Retrieves a list of (username, article count) pairs for authors with live
+    articles.
+    """
+    def __init__(self, varname):
+        self.varname = varname
 
-        # put our collection into the context
-        context[self.varname] = dt_archives
+    def render(self, context):
+        context[self.varname] = Article.objects.author_archives()
         return ''
 
-def get_article_archives(parser, token):
+def get_author_archives(parser, token):
     """
-    Retrieves a list of years and months in which articles have been posted.
+    Retrieves a list of (username, article count) pairs for authors with live
+    articles.
     """
     args = token.split_contents()
     argc = len(args)
@@ -172,9 +159,9 @@ def get_article_archives(parser, token):
     try:
         assert argc == 3 and args[1] == 'as'
     except AssertionError:
-        raise template.TemplateSyntaxError('get_article_archives syntax: {% get_article_archives as varname %}')
+        raise template.TemplateSyntaxError('get_author_archives syntax: {% get_author_archives as varname %}')
 
-    return GetArticleArchivesNode(args[2])
+    return GetAuthorArchivesNode(args[2])
 
 class DivideObjectListByNode(template.Node):
     """
@@ -217,7 +204,8 @@ def divide_object_list(parser, token):
 class GetPageURLNode(template.Node):
     """
     Determines the URL of a pagination page link based on the page from which
-    this tag is called.
+    this tag is called.  A page number links to that page; a cursor (or an
+    empty string, for the first page) links to a page of a cursor listing.
     """
     def __init__(self, page_num, varname=None):
         self.page_num = template.Variable(page_num)
@@ -235,11 +223,23 @@ class GetPageURLNode(template.Node):
         except (Resolver404, KeyError):
             raise ValueError('Invalid pagination page.')
         else:
-            # set the page parameter for this view
-            kwargs['page'] = page_num
+            # keep the rest of the query string, e.g. the search terms
+            params = context['request'].GET.copy()
+            params.pop('cursor', None)
+
+            if isinstance(page_num, (int, long)):
+                # set the page parameter for this view
+                kwargs['page'] = page_num
+            else:
+                # cursor pages all live at the listing's first page
+                kwargs.pop('page', None)
+                if page_num:
+                    params['cursor'] = page_num
 
             # get the new URL from Django
             url = reverse(view, args=args, kwargs=kwargs)
+            if params:
+                url = '%s?%s' % (url, params.urlencode())
 
         if self.varname:
             # if we have a varname, put the URL into the context and return nothing
@@ -261,51 +261,26 @@ def get_page_url(parser, token):
     try:
         assert argc in (2, 4)
     except AssertionError:
-        raise template.TemplateSyntaxError('get_page_url syntax: {% get_page_url page_num as varname %}')
+        raise template.TemplateSyntaxError('get_page_url syntax: {% get_page_url page_num_or_cursor as varname %}')
 
     if argc == 4: varname = args[3]
 
     return GetPageURLNode(args[1], varname)
 
-def tag_cloud():
-    """Provides the tags with a "weight" attribute to build a tag cloud"""
-    #猜想:此函数是不是在计算tag的个数
-    #如果多个文章里面出现了同一标签 则显示tag的时候就大点 否则就正常显示???
-    #没错就是这样--Spark
-    cache_key = 'tag_cloud_tags'
-    tags = cache.get(cache_key)
-    if tags is None:
-        MAX_WEIGHT = 7
-        tags = Tag.objects.annotate(count=Count('article'))
-
-        if len(tags) == 0:
-            # go no further
-            return {}
-
-        min_count = max_count = tags[0].article_set.count()
-        for tag in tags:
-            if tag.count < min_count:
-                min_count = tag.count
-            if max_count < tag.count:
-                max_count = tag.count
-
-        # calculate count range, and avoid dbz
-        _range = float(max_count - min_count)
-        if _range == 0.0:
-            _range = 1.0
-
-        # calculate tag weights
-        for tag in tags:
-            tag.weight = int(MAX_WEIGHT * (tag.count - min_count) / _range)
-
-        cache.set(cache_key, tags)
-
-    return {'tags': tags}
+def tag_cloud(scale=None):
+    """
+    Provides (name, slug, count, weight) tuples for the tags applied to live
+    articles, to build a tag cloud.  ``scale`` is 'linear' or 'log' and
+    defaults to the ARTICLES_TAG_CLOUD_SCALE setting.
+    """
+    #如果多个文章里面出现了同一标签 则显示tag的时候就大点 否则就正常显示
+    return {'tags': Tag.objects.cloud(scale)}
 
 # register dem tags!
 register.tag(get_articles)
 register.tag(get_article_tags)
 register.tag(get_article_archives)
+register.tag(get_author_archives)
 register.tag(divide_object_list)
 register.tag(get_page_url)
 register.inclusion_tag('articles/_tag_cloud.html')(tag_cloud)
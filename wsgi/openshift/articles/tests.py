@@ -1,13 +1,37 @@
 # -*- coding: utf-8 -*-
 
 from datetime import datetime, timedelta
+import BaseHTTPServer
+import re
+import SocketServer
+from StringIO import StringIO
+import sys
+import threading
+import time
 
 from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.paginator import InvalidPage
 from django.core.urlresolvers import reverse
+from django.db import connection, reset_queries
+from django.db.models import signals
 from django.test import TestCase
 from django.test.client import Client
 
-from models import Article, ArticleStatus, Tag, get_name, MARKUP_HTML, MARKUP_MARKDOWN, MARKUP_REST, MARKUP_TEXTILE
+from caching import LATEST_ARTICLES_KEY, ALL_LISTING, listing_count_key, month_listing, tag_articles_key, tag_listing
+from linktitles import resolve_pending
+from paginator import CursorPaginator
+import models
+import views
+from djangosphinx import models as sphinx_models
+from djangosphinx.fakesearchd import ResultSet
+from djangosphinx.models import SphinxQuerySet
+from djangosphinx.resultcache import index_generation
+from djangosphinx.tests import FakeSearchdTestCase
+from models import Article, ArticleStatus, ArticleTerm, LinkTitle, Tag, get_name, insert_new, MARKUP_HTML, MARKUP_MARKDOWN, MARKUP_REST, MARKUP_TEXTILE
+
+LISTING_COUNT_RE = re.compile(r'^SELECT COUNT\(\*\) FROM [`"]?articles_article[`"]?( |$)', re.I)
 
 class ArticleUtilMixin(object):
 
@@ -33,6 +57,19 @@ class ArticleUtilMixin(object):
 
         return a
 
+    def capture_queries(self, func, *args, **kwargs):
+        """Calls ``func`` and returns the SQL it sent to the database"""
+
+        old_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        # requests made through the test client reset the log when they start
+        reset_queries()
+        try:
+            func(*args, **kwargs)
+            return [q['sql'] for q in connection.queries]
+        finally:
+            connection.use_debug_cursor = old_debug_cursor
+
 class TagTestCase(TestCase):
     fixtures = ['tags']
 
@@ -94,6 +131,64 @@ class ArticleTestCase(TestCase, ArticleUtilMixin):
 
         self.assertNotEqual(a1.slug, a2.slug)
 
+    def test_unique_slug_single_query(self):
+        """The next free slug is found with one query however many collide"""
+
+        for i in range(4):
+            a = self.new_article('Same Slug', 'Some content')
+        self.assertEqual(a.slug, 'Same-Slug-3')
+
+        # an article never collides with itself
+        self.assertEqual(a.get_unique_slug('Same-Slug-3'), 'Same-Slug-3')
+
+        b = Article(title='Same Slug', content='More', author=self.superuser)
+        queries = self.capture_queries(b.get_unique_slug, 'Same-Slug')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(b.get_unique_slug('Same-Slug'), 'Same-Slug-4')
+
+    def test_create_on_database(self):
+        """Manager.create() passes using along with force_insert"""
+
+        a = Article.objects.create(title='Created', content='Some content', author=self.superuser)
+        self.assertEqual(a.slug, 'Created')
+        b = Article.objects.using('default').create(title='Created', content='More', author=self.superuser)
+        self.assertEqual(b.slug, 'Created-1')
+
+    def test_save_writes_once(self):
+        """Saving an article writes its row once, and only re-slugs on title changes"""
+
+        article_writes = lambda queries: [q for q in queries
+                                          if q.startswith('INSERT INTO "articles_article"')
+                                          or q.startswith('UPDATE "articles_article"')]
+        slug_lookups = lambda queries: [q for q in queries
+                                        if q.startswith('SELECT') and '"articles_article"."slug" LIKE' in q]
+
+        t = Tag.objects.create(name='Django')
+        a = Article(title='Writes', content='All about Django', author=self.superuser)
+        queries = self.capture_queries(a.save)
+        # the INSERT, plus the keywords taken from the auto-applied tag
+        self.assertEqual(len(article_writes(queries)), 2)
+        self.assertEqual(a.keywords, 'Django')
+
+        a = Article.objects.get(pk=a.pk)
+        a.content = 'Still all about Django'
+        queries = self.capture_queries(a.save)
+        self.assertEqual(len(article_writes(queries)), 1)
+        self.assertEqual(slug_lookups(queries), [])
+
+        a.title = 'Writes Again'
+        queries = self.capture_queries(a.save)
+        self.assertEqual(len(article_writes(queries)), 1)
+        self.assertTrue(slug_lookups(queries))
+        self.assertEqual(a.slug, 'Writes-Again')
+
+        # a slug edited by hand is checked again
+        other = self.new_article('Taken', 'Content')
+        a.slug = other.slug
+        queries = self.capture_queries(a.save)
+        self.assertTrue(slug_lookups(queries))
+        self.assertNotEqual(a.slug, other.slug)
+
     def test_active_articles(self):
         """Active articles"""
 
@@ -153,9 +248,261 @@ class ArticleTestCase(TestCase, ArticleUtilMixin):
 
         self.assertTrue(a.is_active)
 
+        # loading an expired article must not flip it on its own
+        b = Article.objects.latest()
+        self.assertTrue(b.is_active)
+
+        call_command('expire_articles', verbosity=0)
+
         b = Article.objects.latest()
         self.assertFalse(b.is_active)
 
+    def test_expire_invalidates_caches(self):
+        """The expiry sweep reports what it changed and drops stale listings"""
+
+        t = Tag.objects.create(name='expiring')
+        one_second_ago = datetime.now() - timedelta(seconds=1)
+        a = self.new_article('Expiring Article', 'Expired', tags=[t], expiration_date=one_second_ago)
+        self.new_article('Fresh Article', 'Still here')
+
+        cache.set(LATEST_ARTICLES_KEY, ['stale'])
+        cache.set(tag_articles_key(t.name), ['stale'])
+
+        self.assertEqual(Article.objects.expire(), [(a.pk, a.title)])
+        self.assertEqual(cache.get(LATEST_ARTICLES_KEY), None)
+        self.assertEqual(cache.get(tag_articles_key(t.name)), None)
+        self.assertEqual(Article.objects.active().count(), 1)
+
+        # nothing left to do the second time around
+        self.assertEqual(Article.objects.expire(), [])
+
+    def test_author_archives(self):
+        """Author archive counts live articles with one cached query"""
+
+        live_status = ArticleStatus.objects.filter(is_live=True)[0]
+        draft = ArticleStatus.objects.filter(is_live=False)[0]
+        joe = User.objects.create_user('joe', 'joe@bob.com', 'bob')
+        for i in range(3):
+            self.new_article('Article %s' % (i,), 'Content', status=live_status)
+        self.new_article('Joe', 'Content', author=joe, status=live_status)
+        self.new_article('Draft', 'Content', author=joe, status=draft)
+
+        cache.clear()
+        queries = self.capture_queries(Article.objects.author_archives)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(Article.objects.author_archives(),
+                         [('joe', 1), (self.superuser.username, 3)])
+
+        # served from the cache until an article changes
+        self.assertEqual(self.capture_queries(Article.objects.author_archives), [])
+        self.new_article('Joe again', 'Content', author=joe, status=live_status)
+        self.assertEqual(Article.objects.author_archives(),
+                         [('joe', 2), (self.superuser.username, 3)])
+
+    def test_archives(self):
+        """Month archives come from one date query, cached per audience"""
+
+        live_status = ArticleStatus.objects.filter(is_live=True)[0]
+        draft = ArticleStatus.objects.filter(is_live=False)[0]
+        self.new_article('March', 'Content', status=live_status, publish_date=datetime(2011, 3, 5))
+        self.new_article('March again', 'Content', status=live_status, publish_date=datetime(2011, 3, 20))
+        self.new_article('January', 'Content', status=live_status, publish_date=datetime(2012, 1, 2))
+        self.new_article('Draft', 'Content', status=draft, publish_date=datetime(2010, 7, 1))
+
+        cache.clear()
+        queries = self.capture_queries(Article.objects.archives)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(Article.objects.archives(), [
+            (2012, (datetime(2012, 1, 1),)),
+            (2011, (datetime(2011, 3, 1),)),
+        ])
+        self.assertEqual(Article.objects.archives(with_counts=True), [
+            (2012, ((datetime(2012, 1, 1), 1),)),
+            (2011, ((datetime(2011, 3, 1), 2),)),
+        ])
+
+        # superusers see the draft too, without polluting the public copy
+        self.assertEqual(len(Article.objects.archives(user=self.superuser)), 3)
+        self.assertEqual(len(Article.objects.archives()), 2)
+
+    def test_load_does_not_write(self):
+        """Loading expired or unrendered articles never saves them"""
+
+        one_second_ago = datetime.now() - timedelta(seconds=1)
+        self.new_article('Expiring Article', 'Expired', expiration_date=one_second_ago)
+        a = self.new_article('Unrendered', 'Not rendered yet')
+        Article.objects.filter(pk=a.pk).update(rendered_content='')
+
+        queries = self.capture_queries(list, Article.objects.all())
+        self.assertEqual(len(queries), 1)
+
+        call_command('backfill_articles', verbosity=0)
+        self.assertEqual(Article.objects.get(pk=a.pk).rendered_content, 'Not rendered yet')
+
+    def test_list_page_does_not_write(self):
+        """Article list pages make no UPDATE queries"""
+
+        live_status = ArticleStatus.objects.filter(is_live=True)[0]
+        one_second_ago = datetime.now() - timedelta(seconds=1)
+        for i in range(5):
+            self.new_article('Article %s' % (i,), 'Content for article %s' % (i,), status=live_status)
+        self.new_article('Expiring Article', 'Expired', status=live_status, expiration_date=one_second_ago)
+        Article.objects.update(rendered_content='')
+
+        client = Client()
+        queries = self.capture_queries(client.get, reverse('articles_archive'))
+        self.assertTrue(queries)
+        self.assertFalse([q for q in queries if q.lstrip().upper().startswith('UPDATE')])
+
+    def test_list_page_queries(self):
+        """List pages load tags and authors for the whole page at once"""
+
+        live_status = ArticleStatus.objects.filter(is_live=True)[0]
+        tags = [Tag.objects.create(name='Listed %s' % (i,)) for i in range(3)]
+        for i in range(6):
+            self.new_article('Article %s' % (i,), 'Content', status=live_status, tags=tags[:i % 4])
+
+        client = Client()
+        client.get(reverse('articles_archive'))
+        queries = self.capture_queries(client.get, reverse('articles_archive'))
+        self.assertEqual(len([q for q in queries if '"articles_article_tags"' in q]), 1)
+        self.assertEqual([q for q in queries if 'FROM "auth_user"' in q], [])
+
+        articles = list(Article.objects.live().select_related('author'))
+        Article.objects.attach_listing_data(articles)
+        self.assertEqual(self.capture_queries(lambda: [(a.tag_list, a.author.get_name()) for a in articles]), [])
+        self.assertEqual(sorted(len(a.tag_list) for a in articles), [0, 0, 1, 1, 2, 3])
+
+    def test_navigation(self):
+        """Next/previous come from one cached query, which remembers missing ones"""
+
+        live_status = ArticleStatus.objects.filter(is_live=True)[0]
+        same_time = datetime(2012, 2, 1, 12, 0)
+        a = self.new_article('First', 'Content', status=live_status, publish_date=datetime(2012, 1, 1))
+        b = self.new_article('Second', 'Content', status=live_status, publish_date=same_time)
+        c = self.new_article('Third', 'Content', status=live_status, publish_date=same_time)
+        self.new_article('Draft', 'Content', publish_date=datetime(2012, 3, 1))
+
+        b = Article.objects.get(pk=b.pk)
+        queries = self.capture_queries(b.get_navigation)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([x.pk for x in b.get_navigation()], [c.pk, a.pk])
+        self.assertEqual(b.get_next_article().get_absolute_url(), c.get_absolute_url())
+
+        # the newest article has no next one, and that is remembered too
+        c = Article.objects.get(pk=c.pk)
+        self.assertEqual(c.get_next_article(), None)
+        c = Article.objects.get(pk=c.pk)
+        self.assertEqual(self.capture_queries(c.get_next_article), [])
+
+        # publishing a newer article changes the answer
+        d = self.new_article('Fourth', 'Content', status=live_status, publish_date=datetime(2012, 2, 2))
+        c = Article.objects.get(pk=c.pk)
+        self.assertEqual(c.get_next_article().pk, d.pk)
+
+    def test_cursor_pagination(self):
+        """Cursor pages follow (publish_date, id) and link both ways"""
+
+        live_status = ArticleStatus.objects.filter(is_live=True)[0]
+        same_time = datetime(2012, 2, 1, 12, 0)
+        articles = [self.new_article('Article %s' % (i,), 'Content', status=live_status,
+                                     publish_date=i % 2 and same_time or datetime(2012, 1, i + 1))
+                    for i in range(5)]
+        expected = [a.pk for a in sorted(articles, key=lambda a: (a.publish_date, a.pk), reverse=True)]
+
+        paginator = CursorPaginator(Article.objects.live(), 2)
+        first = paginator.page()
+        self.assertFalse(first.has_previous())
+        second = paginator.page(first.next_cursor())
+        third = paginator.page(second.next_cursor())
+        self.assertEqual([a.pk for page in (first, second, third) for a in page.object_list], expected)
+        self.assertFalse(third.has_next())
+        self.assertEqual([a.pk for a in paginator.page(third.previous_cursor()).object_list], expected[2:4])
+        self.assertEqual(paginator.count, 5)
+        self.assertRaises(InvalidPage, paginator.page, 'bogus')
+
+        old_mode = views.ARTICLE_PAGINATION_MODE
+        views.ARTICLE_PAGINATION_MODE = 'cursor'
+        try:
+            client = Client()
+            response = client.get(reverse('articles_archive'), {'cursor': first.next_cursor()})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([a.pk for a in response.context['page_obj'].object_list][:2], expected[2:4])
+            self.assertEqual(client.get(reverse('articles_archive'), {'cursor': 'bogus'}).status_code, 404)
+        finally:
+            views.ARTICLE_PAGINATION_MODE = old_mode
+
+    def test_listing_counts(self):
+        """Listing totals are cached, and dropped when their articles change"""
+
+        cache.clear()
+        live_status = ArticleStatus.objects.filter(is_live=True)[0]
+        # not in the article, so it is not tagged automatically
+        t = Tag.objects.create(name='Tallied')
+        a = self.new_article('Counted', 'Content', status=live_status, publish_date=datetime(2012, 1, 5))
+        # only the listing totals; the sidebar aggregates count too
+        counts = lambda queries: [q for q in queries if LISTING_COUNT_RE.match(q)]
+
+        client = Client()
+        self.assertEqual(len(counts(self.capture_queries(client.get, reverse('articles_archive')))), 1)
+        self.assertEqual(counts(self.capture_queries(client.get, reverse('articles_archive'))), [])
+        self.assertEqual(cache.get(listing_count_key(ALL_LISTING, False)), 1)
+
+        month_url = reverse('articles_in_month', kwargs={'year': 2012, 'month': 1})
+        client.get(month_url)
+        client.get(t.get_absolute_url())
+        self.assertEqual(cache.get(listing_count_key(month_listing(2012, 1), False)), 1)
+        self.assertEqual(cache.get(listing_count_key(tag_listing(t.pk), False)), 0)
+
+        # tagging only touches the tag's total
+        a.tags.add(t)
+        self.assertEqual(cache.get(listing_count_key(tag_listing(t.pk), False)), None)
+        self.assertEqual(cache.get(listing_count_key(ALL_LISTING, False)), 1)
+
+        # moving the article to another month drops both months
+        client.get(t.get_absolute_url())
+        a.publish_date = datetime(2012, 2, 5)
+        a.save()
+        for listing in (ALL_LISTING, month_listing(2012, 1), month_listing(2012, 2), tag_listing(t.pk)):
+            self.assertEqual(cache.get(listing_count_key(listing, False)), None)
+        self.assertEqual(client.get(month_url).context['paginator'].count, 0)
+
+    def test_render_metadata(self):
+        """Brushes, theme, word count, reading time and teaser are stored on save"""
+
+        a = self.new_article(u'Code', u'<!-- code_highlight_theme: midnight -->'
+                                      u'<p>开源 is fun</p><pre class="brush:python;">print 1</pre>'
+                                      u'<pre class="brush:py;">print 2</pre><pre class="brush:sql;">select</pre>')
+
+        a = Article.objects.get(pk=a.pk)
+        self.assertEqual(a.brush_file_list, ['shBrushPython.js', 'shBrushSql.js'])
+        self.assertEqual(a.highlight_theme, 'shThemeMidnight.css')
+        self.assertEqual(a.word_count, 9)
+        self.assertEqual(a.reading_time, 1)
+        self.assertTrue(a.teaser_html)
+
+        # older rows get their metadata from the backfill command
+        Article.objects.filter(pk=a.pk).update(brush_files='', highlight_theme='', word_count=0,
+                                               reading_time=0, teaser_html='')
+        call_command('backfill_articles', verbosity=0)
+        b = Article.objects.get(pk=a.pk)
+        self.assertEqual((b.brush_files, b.word_count, b.teaser_html), (a.brush_files, a.word_count, a.teaser_html))
+
+    def test_search_passage_text(self):
+        """Search passages are built from the articles' text, without markup"""
+
+        a = self.new_article('Fish & <Chips>', '<p>Some <em>fried</em>\n fish</p>')
+        a.description = '<p>Crispy</p>'
+        self.assertEqual(a.get_title_passage_text(), 'Fish &amp; &lt;Chips&gt;')
+        self.assertEqual(a.get_description_passage_text(), 'Crispy')
+        self.assertEqual(a.get_content_passage_text(), 'Some fried fish')
+
+        # the text is escaped again after the tags are gone
+        a.description = '<p>if a &lt; b</p><p>and b&gt;c</p>'
+        a.content = 'if a<b &amp; c'
+        self.assertEqual(a.get_description_passage_text(), 'if a &lt; b and b&gt;c')
+        self.assertEqual(a.get_content_passage_text(), 'if a&lt;b &amp; c')
+
     def test_markup_markdown(self):
         """Makes sure markdown works"""
 
@@ -218,6 +565,30 @@ regular paragraph.</p>'''
         a.do_render_markup()
         self.assertEqual(html, a.rendered_content)
 
+    def test_tag_cloud(self):
+        """Tag cloud counts live articles only and weights them"""
+
+        live_status = ArticleStatus.objects.filter(is_live=True)[0]
+        draft = ArticleStatus.objects.filter(is_live=False)[0]
+        common = Tag.objects.create(name='common')
+        rare = Tag.objects.create(name='rare')
+        unused = Tag.objects.create(name='unused')
+        for i in range(4):
+            self.new_article('Common %s' % (i,), 'Content', status=live_status, tags=[common], auto_tag=False)
+        self.new_article('Rare', 'Content', status=live_status, tags=[common, rare], auto_tag=False)
+        self.new_article('Draft', 'Content', status=draft, tags=[rare, unused], auto_tag=False)
+
+        cache.clear()
+        queries = self.capture_queries(Tag.objects.cloud)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(Tag.objects.cloud('linear'), [('common', 'common', 5, 7), ('rare', 'rare', 1, 0)])
+        self.assertEqual(Tag.objects.cloud('log'), [('common', 'common', 5, 7), ('rare', 'rare', 1, 0)])
+
+        # renaming a tag drops the cached cloud
+        rare.name = 'scarce'
+        rare.save()
+        self.assertEqual(Tag.objects.cloud()[1][0], 'scarce')
+
 class ArticleAdminTestCase(TestCase, ArticleUtilMixin):
     fixtures = ['users']
 
@@ -408,6 +779,381 @@ class ListenerTestCase(TestCase, ArticleUtilMixin):
         # make sure the tags were actually applied to our new article
         self.assertEqual(a.tags.count(), 3)
 
+    def test_search_generation_bumped(self):
+        """Saving or deleting an article drops the cached search results"""
+
+        index = Article.search.get_index()
+        generation = index_generation(index)
+        a = self.new_article('Searched', 'Content')
+        self.assertNotEqual(index_generation(index), generation)
+
+        generation = index_generation(index)
+        a.delete()
+        self.assertNotEqual(index_generation(index), generation)
+
+    def test_apply_new_tag_without_saving(self):
+        """New tags are attached through the term index, without re-saving articles"""
+
+        a = self.new_article(u'开源', u'我们喜欢开源软件 and Django', auto_tag=True)
+        b = self.new_article('Nope', 'Nothing to see here', auto_tag=True)
+        c = self.new_article('Manual', 'Django, but not auto-tagged', auto_tag=False)
+
+        queries = self.capture_queries(Tag.objects.create, name='Django')
+        self.assertFalse([q for q in queries if q.startswith('UPDATE') and 'title' in q])
+
+        Tag.objects.create(name=u'开源软件')
+        self.assertEqual([t.name for t in a.tags.all()], ['Django', u'开源软件'])
+        self.assertEqual(b.tags.count(), 0)
+        self.assertEqual(c.tags.count(), 0)
+
+        # the index follows edits
+        b = Article.objects.get(pk=b.pk)
+        b.content = u'Now about 开源软件'
+        b.save()
+        Tag.objects.create(name=u'软件')
+        self.assertEqual(set(t.name for t in b.tags.all()), set([u'开源软件', u'软件']))
+
+    def test_apply_new_tag_chunks(self):
+        """Lookups and inserts are split up, so many articles don't hit the backend's limits"""
+
+        articles = [self.new_article('Chunk %s' % (i,), 'All about Django', auto_tag=True) for i in range(5)]
+        articles[0].tags.add(Tag.objects.create(name='Unrelated'))
+
+        chunk_size, models.CHUNK_SIZE = models.CHUNK_SIZE, 2
+        try:
+            queries = self.capture_queries(Tag.objects.create, name='Django')
+        finally:
+            models.CHUNK_SIZE = chunk_size
+
+        self.assertEqual([t.name for t in articles[0].tags.all()], ['Django', 'Unrelated'])
+        for a in articles[1:]:
+            self.assertEqual([t.name for t in a.tags.all()], ['Django'])
+        # 5 candidates in chunks of 2
+        self.assertEqual(len([q for q in queries if q.startswith('INSERT INTO "articles_article_tags"')]), 3)
+
+    def test_insert_new(self):
+        """Rows another process inserted first are skipped, not an error"""
+
+        a = self.new_article('First', 'Content')
+        b = self.new_article('Second', 'Content')
+        tag = Tag.objects.create(name='Raced')
+        through = Article.tags.through
+        a.tags.add(tag)
+
+        rows = insert_new(through, [through(article_id=a.pk, tag_id=tag.pk), through(article_id=b.pk, tag_id=tag.pk)])
+        self.assertEqual([row.article_id for row in rows], [b.pk])
+        self.assertEqual(sorted(tag.article_set.values_list('id', flat=True)), [a.pk, b.pk])
+
+        # and the same for the term index
+        term = ArticleTerm.objects.filter(article=a)[0]
+        rows = insert_new(ArticleTerm, [ArticleTerm(term=term.term, article=a), ArticleTerm(term='raced', article=a)])
+        self.assertEqual([row.term for row in rows], ['raced'])
+
+class LinkTitleHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Stands in for the sites articles link to"""
+
+    def do_GET(self):
+        if self.path == '/missing':
+            self.send_error(404)
+            return
+
+        if self.path == '/slow':
+            time.sleep(1)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.end_headers()
+        self.wfile.write('<html><head><title>\n  A Page &amp; More </title></head></html>')
+
+    def log_message(self, *args):
+        pass
+
+class LinkTitleServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class LinkTitleTestCase(TestCase, ArticleUtilMixin):
+    fixtures = ['users']
+
+    def setUp(self):
+        self.server = LinkTitleServer(('127.0.0.1', 0), LinkTitleHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+        self.base = 'http://127.0.0.1:%s' % (self.server.server_address[1],)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_resolve_link_titles(self):
+        """Link titles are fetched in the background, never while rendering"""
+
+        page, missing, slow = [self.base + path for path in ('/page', '/missing', '/slow')]
+        a = self.new_article('Links', 'See <a href="%s">this</a>, <a href="%s">that</a>, '
+                                      '<a href="%s">and this</a> or <a href="%s">this again</a>'
+                                      % (page, missing, slow, page))
+
+        self.assertEqual(LinkTitle.objects.count(), 3)
+        self.assertEqual(a.links, ((page, 'this'), (missing, 'that'), (slow, 'and this')))
+
+        self.assertEqual(resolve_pending(timeout=0.3), (1, 2))
+        self.assertEqual(a.links, ((page, 'A Page & More'), (missing, 'that'), (slow, 'and this')))
+
+        # client errors are final, timeouts are retried later
+        self.assertEqual(LinkTitle.objects.get(url=missing).status, LinkTitle.FAILED)
+        retry = LinkTitle.objects.get(url=slow)
+        self.assertEqual((retry.status, retry.attempts), (LinkTitle.PENDING, 1))
+        self.assertTrue(retry.next_attempt > datetime.now())
+        self.assertEqual(resolve_pending(timeout=0.3), (0, 0))
+
+    def test_max_bytes(self):
+        """Titles beyond the byte limit are not found"""
+
+        self.new_article('Links', '<a href="%s/page">page</a>' % (self.base,))
+        self.assertEqual(resolve_pending(max_bytes=10), (0, 1))
+        self.assertEqual(LinkTitle.objects.get().status, LinkTitle.FAILED)
+
+    def test_concurrent_queue(self):
+        """A link queued by someone else between the lookup and the insert is skipped"""
+
+        url = self.base + '/page'
+        def queue_first(sender, instance, **kwargs):
+            signals.pre_save.disconnect(queue_first, sender=LinkTitle)
+            LinkTitle.objects.create(url_hash=instance.url_hash, url=instance.url)
+
+        signals.pre_save.connect(queue_first, sender=LinkTitle)
+        try:
+            self.assertEqual(LinkTitle.objects.queue([url, self.base + '/missing']), 1)
+        finally:
+            signals.pre_save.disconnect(queue_first, sender=LinkTitle)
+        self.assertEqual(LinkTitle.objects.count(), 2)
+
+class AutoTagTestCase(TestCase, ArticleUtilMixin):
+    fixtures = ['users']
+
+    def test_word_boundaries(self):
+        """ASCII tags need word boundaries, CJK tags don't"""
+
+        go = Tag.objects.create(name='go')
+        cpp = Tag.objects.create(name='c++')
+        oss = Tag.objects.create(name=u'开源')
+
+        a = self.new_article(u'Good news', u'Written in C++ for 开源软件', auto_tag=True)
+        self.assertEqual(set(a.tags.all()), set([cpp, oss]))
+
+    def test_matcher_rebuilt_on_tag_change(self):
+        """New tags are picked up by the next save"""
+
+        self.assertEqual(Tag.objects.matcher().find(u'django'), set())
+        t = Tag.objects.create(name='Django')
+        self.assertEqual(Tag.objects.matcher().find(u'I like DJANGO.'), set([t.pk]))
+
+        t.delete()
+        self.assertEqual(Tag.objects.matcher().find(u'I like DJANGO.'), set())
+
+class SearchBenchmarkTestCase(TestCase, ArticleUtilMixin):
+    fixtures = ['users']
+
+    def test_benchmark_sphinx(self):
+        """benchmark_sphinx runs against its fake searchd"""
+
+        for i in range(5):
+            self.new_article('Benchmarked %s' % (i,), 'Some content')
+
+        out = StringIO()
+        # the throughput threads can't see the in-memory test database
+        call_command('benchmark_sphinx', 'articles.Article', queries=3, limit=2,
+                     concurrency='', stdout=out, verbosity=0)
+        output = out.getvalue()
+        self.assertTrue('articles.Article: 5 rows' in output)
+        self.assertTrue('searchd saw:' in output)
+
+    def test_benchmark_articles(self):
+        """benchmark_articles seeds its scratch database and explains the queries"""
+
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            call_command('benchmark_articles', articles=30, tags=5, repeat=1)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertTrue('Seeded 30 articles' in output)
+        self.assertTrue('=== with 2 composite indexes ===' in output)
+        self.assertTrue('list page:' in output)
+
+class ArticleSearchTestCase(FakeSearchdTestCase, ArticleUtilMixin):
+    fixtures = ['users']
+
+    def get_results(self):
+        # the matches follow whatever articles the test has created
+        return lambda request: ResultSet.generate(0, ids=self.ids)
+
+    def setUp(self):
+        super(ArticleSearchTestCase, self).setUp()
+        self.articles = []
+        for i in range(4):
+            a = self.new_article('Fish %s' % (i,), '<p>Fish content %s</p>' % (i,))
+            a.description = 'Fish description %s' % (i,)
+            a.save()
+            self.articles.append(a)
+        # searchd's order is not the primary key order
+        self.articles.reverse()
+        self.ids = [a.pk for a in self.articles]
+        self.searchd.record = True
+        self.saved_packet = sphinx_models.SPHINX_EXCERPTS_MAX_PACKET
+        cache.clear()
+
+    def tearDown(self):
+        sphinx_models.SPHINX_EXCERPTS_MAX_PACKET = self.saved_packet
+        super(ArticleSearchTestCase, self).tearDown()
+
+    def search(self, query='fish'):
+        # without passages, which need the text fields loaded
+        return SphinxQuerySet(model=Article, index='blog_indexer').query(query)
+
+    def test_hydrate_single_query(self):
+        """A page of matches is loaded with one query, in searchd's order"""
+
+        qs = self.search().select_related('author')
+        with self.assertNumQueries(1):
+            results = list(qs)
+            [a.author.username for a in results]
+        self.assertEqual([a.pk for a in results], self.ids)
+
+    def test_hydrate_deleted(self):
+        """Matches whose rows are gone are skipped"""
+
+        Article.objects.filter(pk=self.ids[1]).delete()
+        self.assertEqual([a.pk for a in self.search()], self.ids[:1] + self.ids[2:])
+
+    def test_hydrate_defer(self):
+        """Deferred fields are not loaded, unless passages are built from them"""
+
+        for a in self.search().defer('content', 'rendered_content'):
+            loaded = a._current_object.__dict__
+            self.assertFalse('content' in loaded or 'rendered_content' in loaded)
+            self.assertTrue('title' in loaded)
+
+        for a in Article.search.query('fish').defer('content', 'rendered_content'):
+            loaded = a._current_object.__dict__
+            self.assertTrue('content' in loaded)
+            self.assertFalse('rendered_content' in loaded)
+
+    def test_result_cache(self):
+        """Cached results are dropped when an article is saved or the index rotated"""
+
+        sphinx_models.RESULT_CACHE_TIMEOUT = 300
+        list(self.search())
+        list(self.search())
+        self.assertEqual(self.searchd.stats['search'], 1)
+
+        self.articles[0].save()
+        list(self.search())
+        self.assertEqual(self.searchd.stats['search'], 2)
+
+        call_command('bump_sphinx_generation', verbosity=0)
+        list(self.search())
+        list(self.search())
+        self.assertEqual(self.searchd.stats['search'], 3)
+
+    def excerpt_requests(self):
+        return [request for command, request in self.searchd.requests if command == 'excerpt']
+
+    def assertPassages(self, results):
+        highlight = '<strong class="highlight">Fish</strong>'
+        self.assertEqual([a.pk for a in results], self.ids)
+        for a in results:
+            number = a.title.split()[-1]
+            self.assertEqual(a._sphinx['passages'], {
+                'title': '%s %s' % (highlight, number),
+                'description': '%s description %s' % (highlight, number),
+                'content': '%s content %s' % (highlight, number),
+            })
+
+    def test_passages_single_request(self):
+        """The passages of every match and field are built with one request"""
+
+        results = list(Article.search.query('fish'))
+        self.assertEqual(self.searchd.stats['excerpt'], 1)
+
+        # field by field across the matches, in searchd's order
+        docs = self.excerpt_requests()[0]['docs']
+        self.assertEqual(docs, ['Fish %s' % a.title.split()[-1] for a in self.articles] +
+                               [a.description for a in self.articles] +
+                               ['Fish content %s' % a.title.split()[-1] for a in self.articles])
+        self.assertPassages(results)
+
+    def test_passages_packets(self):
+        """Docs go in more requests when they don't fit in one packet"""
+
+        sphinx_models.SPHINX_EXCERPTS_MAX_PACKET = 64
+        results = list(Article.search.query('fish'))
+
+        requests = self.excerpt_requests()
+        self.assertTrue(len(requests) > 1)
+        self.assertEqual(self.searchd.stats['excerpt'], len(requests))
+        for request in requests:
+            self.assertTrue(sum(len(doc) + 4 for doc in request['docs']) <= 64)
+        self.assertEqual(sum(len(request['docs']) for request in requests), 12)
+        self.assertPassages(results)
+
+    def test_passages_short_reply(self):
+        """A reply with passages missing leaves every match without any"""
+
+        self.searchd.excerpts = lambda request: request['docs'][:-1]
+        results = list(Article.search.query('fish'))
+        self.assertEqual([a.pk for a in results], self.ids)
+        self.assertFalse([a for a in results if 'passages' in a._sphinx])
+        # the rest of that reply is never read, so the connection is dropped
+        self.assertEqual(len(self.pool), 0)
+
+    def test_passages_failed_reply(self):
+        """A failed request leaves every match without passages"""
+
+        def fail(request):
+            raise ValueError('no such index')
+        self.searchd.excerpts = fail
+        sphinx_models.SPHINX_EXCERPTS_MAX_PACKET = 64
+
+        results = list(Article.search.query('fish'))
+        self.assertEqual([a.pk for a in results], self.ids)
+        self.assertFalse([a for a in results if 'passages' in a._sphinx])
+        # it stopped at the first failed packet
+        self.assertEqual(self.searchd.stats['excerpt'], 1)
+
+        self.searchd.excerpts = None
+        cache.clear()
+        self.assertPassages(list(Article.search.query('fish')))
+
+class SearchPageTestCase(FakeSearchdTestCase, ArticleUtilMixin):
+    fixtures = ['users']
+
+    def get_results(self):
+        # the matches follow whatever articles the test has created
+        return lambda request: ResultSet.generate(0, ids=self.ids)
+
+    def setUp(self):
+        super(SearchPageTestCase, self).setUp()
+        authors = list(User.objects.all())
+        articles = [self.new_article('Found %s' % (i,), '<p>Found it</p>', author=authors[i % len(authors)])
+                    for i in range(6)]
+        self.ids = [a.pk for a in articles]
+        cache.clear()
+
+    def test_search_page_queries(self):
+        """The search page loads the page's articles with their authors in one query"""
+
+        url = reverse('search_article')
+        # the sidebar's listings are cached by the first request
+        self.client.get(url, {'query': 'found'})
+
+        # the articles with their authors, the tags of all of them and the
+        # sidebar's latest articles; no query per author
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'query': 'found'})
+        self.assertEqual([a.pk for a in response.context['articles']], self.ids)
+        self.assertEqual(self.searchd.stats['search'], 2)
+
 class MiscTestCase(TestCase):
     fixtures = ['users',]
 
@@ -20,6 +20,7 @@ urlpatterns += patterns('',
     url(r'^page/(?P<page>\d+)/$', views.display_blog_page, name='articles_archive_page'),   
 
     url(r'^/search/$', views.search_article, name='search_article'),    #sphinx search
+    url(r'^/search/page/(?P<page>\d+)/$', views.search_article, name='search_article_page'),
     
     url(r'^tag/(?P<tag>.*)/page/(?P<page>\d+)/$', views.display_blog_page, name='articles_display_tag_page'),
     url(r'^tag/(?P<tag>.*)/$', views.display_blog_page, name='articles_display_tag'),
@@ -4,55 +4,25 @@ import logging
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import cache
-from django.core.paginator import Paginator, EmptyPage
+from django.core.paginator import InvalidPage
 from django.core.urlresolvers import reverse
 from django.http import HttpResponsePermanentRedirect, Http404, HttpResponseRedirect, HttpResponse
 from django.shortcuts import render_to_response, get_object_or_404
 from django.template import RequestContext
+from django.utils.http import urlencode
 from articles.models import Article, Tag
+from articles.caching import listing_count_key, author_listing, month_listing, tag_listing, ALL_LISTING
+from articles.paginator import CachedCountPaginator, CursorPaginator
+from djangosphinx.paginator import SphinxPaginator
 from datetime import datetime
-from re import findall
 
 ARTICLE_PAGINATION = getattr(settings, 'ARTICLE_PAGINATION', 20)
-
-#add by bone
-#Brush aliases and his File name(for sytax highlight)
-BRUSH_JSFILE={
-  "as3":"shBrushAS3.js","actionscript3":"shBrushAS3.js",
-  "bash":"shBrushBash.js","shell":"shBrushBash.js",
-  "cf":"shBrushColdFusion.js","coldfusion":"shBrushColdFusion.js",
-  "c-sharp":"shBrushCSharp.js","csharp":"shBrushCSharp.js",
-  "cpp":"shBrushCpp.js","c":"shBrushCpp.js",
-  "css":"shBrushCss.js",
-  "delphi":"shBrushDelphi.js","pas":"shBrushDelphi.js","pascal":"shBrushDelphi.js",
-  "diff":"shBrushDiff.js","patch":"shBrushDiff.js",
-  "erl":"shBrushErlang.js","erlang":"shBrushErlang.js",
-  "groovy":"shBrushGroovy.js",
-  "js":"shBrushJScript.js","jscript":"shBrushJScript.js","javascript":"shBrushJScript.js",
-  "java":"shBrushJava.js",
-  "jfx":"shBrushJavaFX.js","javafx":"shBrushJavaFX.js",
-  "perl":"shBrushPerl.js","pl":"shBrushPerl.js",
-  "php":"shBrushPhp.js",
-  "plain":"shBrushPlain.js","text":"shBrushPlain.js",
-  "ps":"shBrushPowerShell.js","powershell":"shBrushPowerShell.js",
-  "py":"shBrushPython.js","python":"shBrushPython.js",
-  "rails":"shBrushRuby.js","ror":"shBrushRuby.js","ruby":"shBrushRuby.js",
-  "scala":"shBrushScala.js",
-  "sql":"shBrushSql.js",
-  "vb":"shBrushVb.js","vbnet":"shBrushVb.js",
-  "xml":"shBrushXml.js","xhtml":"shBrushXml.js","xslt":"shBrushXml.js","html":"shBrushXml.js","xhtml":"shBrushXml.js",  
-}
-#sytax highlight style
-HIGHLIGHT_STYLE={
-  "Default":"shThemeDefault.css",
-  "Django":"shThemeDjango.css",
-  "Eclipse":"shThemeEclipse.css",
-  "Emacs":"shThemeEmacs.css",
-  "FadeToGrey":"shThemeFadeToGrey.css",
-  "Midnight":"shThemeMidnight.css",
-  "RDark":"shThemeRDark.css",
-}
-#add over
+# 'page' numbers the pages of a listing; 'cursor' links each page to the
+# articles right after the previous one, which stays fast on deep pages
+ARTICLE_PAGINATION_MODE = getattr(settings, 'ARTICLE_PAGINATION_MODE', 'page')
+# listing totals are dropped whenever their articles change; this bounds how
+# long a scheduled article can be missing from them once its time comes
+ARTICLE_PAGINATION_COUNT_TIMEOUT = getattr(settings, 'ARTICLE_PAGINATION_COUNT_TIMEOUT', 300)
 
 log = logging.getLogger('articles.views')
 
@@ -65,20 +35,7 @@ def display_blog_page(request, tag=None, username=None, year=None, month=None, p
     than duplicate a bunch of code.  I'll probably revisit this in the future.
     """
     
-    authorMap = {}
-    authorArchives = []
-    res = Article.objects.all()
-    for r in res :
-        if authorMap.has_key(r.author.username) == False :
-            authorMap[r.author.username] = 1
-        else :
-            authorMap[r.author.username] = authorMap[r.author.username] + 1
-    
-    authorMap.keys().sort()
-    for k in authorMap.keys() :
-        authorArchives.append((k, authorMap[k]))
-        
-    context = {'request': request, 'authorArchives': authorArchives}
+    context = {'request': request}
     if tag:
         try:
             tag = get_object_or_404(Tag, slug__iexact=tag) #from articles.models import Article, Tag 看来是在Tag的模型里面去找
@@ -89,13 +46,15 @@ def display_blog_page(request, tag=None, username=None, year=None, month=None, p
         articles = tag.article_set.live(user=request.user).select_related() #ArticleManager里面有live这个方法 但是article里面没有这个方法啊 objects = ArticleManager()???奇怪
         template = 'articles/display_tag.html'
         context['tag'] = tag
+        listing = tag_listing(tag.pk)
 
     elif username:
         # listing articles by a particular author
         user = get_object_or_404(User, username=username)
-        articles = user.article_set.live(user=request.user)
+        articles = user.article_set.live(user=request.user).select_related('author')
         template = 'articles/by_author.html'
         context['author'] = user
+        listing = author_listing(user.pk)
 
     elif year and month:
         # listing articles in a given month and year
@@ -104,20 +63,34 @@ def display_blog_page(request, tag=None, username=None, year=None, month=None, p
         articles = Article.objects.live(user=request.user).select_related().filter(publish_date__year=year, publish_date__month=month) #select_related()可以缓存查询
         template = 'articles/in_month.html'
         context['month'] = datetime(year, month, 1)
+        listing = month_listing(year, month)
 
     else:
         # listing articles with no particular filtering
-        articles = Article.objects.live(user=request.user)
+        articles = Article.objects.live(user=request.user).select_related('author')
         template = 'articles/article_list.html'
-
-    # paginate the articles
-    paginator = Paginator(articles, ARTICLE_PAGINATION,
-                          orphans=int(ARTICLE_PAGINATION / 4))
+        listing = ALL_LISTING
+
+    # paginate the articles; numbered page URLs keep working in cursor mode
+    count_key = listing_count_key(listing, request.user.is_superuser)
+    if ARTICLE_PAGINATION_MODE == 'cursor' and int(page) == 1:
+        paginator = CursorPaginator(articles, ARTICLE_PAGINATION, count_key=count_key,
+                                    count_timeout=ARTICLE_PAGINATION_COUNT_TIMEOUT)
+        page = request.GET.get('cursor')
+    else:
+        paginator = CachedCountPaginator(articles, ARTICLE_PAGINATION,
+                                         orphans=int(ARTICLE_PAGINATION / 4),
+                                         count_key=count_key,
+                                         count_timeout=ARTICLE_PAGINATION_COUNT_TIMEOUT)
     try:
         page = paginator.page(page)
-    except EmptyPage:
+    except InvalidPage:
         raise Http404
 
+    # tags and author names for the whole page at once
+    page.object_list = list(page.object_list)
+    Article.objects.attach_listing_data(page.object_list)
+
     context.update({'paginator': paginator,
                     'page_obj': page})
     variables = RequestContext(request, context)
@@ -127,35 +100,39 @@ def display_blog_page(request, tag=None, username=None, year=None, month=None, p
 
 def search_article(request,page=1):
     if request.method == 'POST':
-        query=request.POST.get('query',None)
-        if query==None:
-            template = 'articles/article_list.html'
-        else:    
-            #return HttpResponse("you search "+query)  
-            r=Article.search.query(query)     
-            #listing articles with no particular filtering
-            articles = list(r)
-            context={'articles':articles,'query':query,'search_meta':r._sphinx}
-            template = 'articles/article_search.html'
-               
-        # paginate the articles
-        paginator = Paginator(articles, ARTICLE_PAGINATION,
-                              orphans=int(ARTICLE_PAGINATION / 4))
-        try:
-            page = paginator.page(page)
-        except EmptyPage:
-            raise Http404
+        # send the search form on to a URL the page links can build on
+        query = request.POST.get('query', '')
+        return HttpResponseRedirect('%s?%s' % (reverse('search_article'), urlencode({'query': query})))
 
-        context.update({'paginator': paginator,
-                        'page_obj': page})
-        variables = RequestContext(request, context)
-        response = render_to_response(template, variables)
+    query = request.GET.get('query', None)
+    if query is None:
+        raise Http404
+
+    # the result list never shows the article bodies; the passages are built
+    # from content, which is loaded anyway while they are on
+    r=Article.search.query(query).select_related('author').defer('content', 'rendered_content')
+
+    # paginate the matches; only the page's window is fetched from searchd and
+    # hydrated, and its reply carries the total
+    paginator = SphinxPaginator(r, ARTICLE_PAGINATION,
+                                orphans=int(ARTICLE_PAGINATION / 4))
+    try:
+        page = paginator.page(page)
+    except InvalidPage:
+        raise Http404
+
+    Article.objects.attach_listing_data(page.object_list)
+
+    context = {'articles': page.object_list,
+               'query': query,
+               'search_meta': r._sphinx,
+               'paginator': paginator,
+               'page_obj': page}
+    variables = RequestContext(request, context)
+    response = render_to_response('articles/article_search.html', variables)
+
+    return response
 
-        return response
-    else:
-        #return HttpResponse("fuck off")
-        raise Http404  
-    
 def display_article(request, year, slug, template='articles/article_detail.html'):
     """Displays a single article."""
 
@@ -168,26 +145,12 @@ def display_article(request, year, slug, template='articles/article_detail.html'
     if article.login_required and not request.user.is_authenticated():
         return HttpResponseRedirect(reverse('auth_login') + '?next=' + request.path)
 
-    #add by bone if this article needs to code highlight then use syntaxhighlighter
-    #<pre class="brush:python;">
-    #<pre class="brush:python;collapse:true;ruler:true;wrap-lines:false;">
-    #maybe should be stronger
-    brushes=findall(r'<pre class="brush:(\w+);',article.rendered_content)     
-    jsfile2load=list(set([BRUSH_JSFILE[brush] for brush in brushes]))   #avoid to multi load js files    
-    #style=findall(r'theme:(\w+)',article.rendered_content) 
-    style=findall(r'<!--\s*code_highlight_theme:\s*(\w+)\s*-->',article.rendered_content)
-    highlight_style=HIGHLIGHT_STYLE['Default'] #default highlight style
-    last_style_index=len(style)-1
-    if last_style_index>=0 and style[last_style_index].capitalize() in HIGHLIGHT_STYLE.keys():
-        highlight_style=HIGHLIGHT_STYLE[style[last_style_index].capitalize()] #choose only one style
-    print "highlight_style:",highlight_style    
-    #add over
-    
     variables = RequestContext(request, {
         'article': article,
         'disqus_forum': getattr(settings, 'DISQUS_FORUM_SHORTNAME', None),
-        'jsfile2load':jsfile2load, #load SyntaxHighlighter js file
-        'highlight_style':highlight_style,
+        # worked out when the article was saved
+        'jsfile2load': article.brush_file_list, #load SyntaxHighlighter js file
+        'highlight_style': article.highlight_theme,
     })
     response = render_to_response(template, variables)
 
@@ -28,6 +28,9 @@ default settings.py values
 <code>
     SPHINX_SERVER = 'localhost'
     SPHINX_PORT = 3312
+    SPHINX_PERSISTENT = True
+    SPHINX_POOL_SIZE = 5
+    SPHINX_POOL_IDLE_TIMEOUT = 60
 </code>
 """
 import warnings
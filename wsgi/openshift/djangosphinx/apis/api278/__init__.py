@@ -18,6 +18,7 @@ import select
 import socket
 import re
 from struct import *
+from struct import error as StructError
 
 
 # known searchd commands
@@ -95,6 +96,158 @@ SPH_GROUPBY_ATTR		= 4
 SPH_GROUPBY_ATTRPAIR	= 5
 
 
+# precompiled wire formats used by the response parser
+_UINT			= Struct('>L')
+_UINT2			= Struct('>2L')
+_UINT4			= Struct('>4L')
+_MATCH_HEAD64	= Struct('>QL')
+_MATCH_HEAD32	= Struct('>2L')
+_ATTR_MVA		= SPH_ATTR_MULTI | SPH_ATTR_INTEGER
+_ATTR_FORMATS	= { SPH_ATTR_FLOAT:'f', SPH_ATTR_BIGINT:'q' }
+
+
+def _ReadString (buf, p):
+	"""
+	INTERNAL METHOD, DO NOT CALL. Reads a length-prefixed string at offset p.
+	Returns (string, new offset).
+	"""
+	length = _UINT.unpack_from(buf, p)[0]
+	p += 4
+	return buf[p:p+length].tobytes(), p+length
+
+
+def _MakeMatchDecoder (attrs, id64):
+	"""
+	INTERNAL METHOD, DO NOT CALL. Compiles the attribute schema of a result set
+	into a function decoding one match at a given offset.
+	Returns a callable (buf, p) -> (match, new offset).
+	"""
+	names = [ attr[0] for attr in attrs ]
+	if id64:
+		head = _MATCH_HEAD64
+	else:
+		head = _MATCH_HEAD32
+
+	if _ATTR_MVA not in [ attr[1] for attr in attrs ]:
+		# fixed-width rows, decode a whole match with a single unpack
+		row = Struct ( '>' + head.format[1:] + ''.join([ _ATTR_FORMATS.get(attr[1], 'L') for attr in attrs ]) )
+		size = row.size
+		unpack_row = row.unpack_from
+
+		def decode (buf, p):
+			values = unpack_row(buf, p)
+			return { 'id':values[0], 'weight':values[1], 'attrs':dict(zip(names, values[2:])) }, p+size
+
+		return decode
+
+	# variable-width rows: decode runs of fixed-width attributes with one
+	# unpack each, and multi-value attributes (count-prefixed) in between
+	segments = []
+	run = []
+	for name, type_ in attrs + [ ( None, _ATTR_MVA ) ]:
+		if type_ != _ATTR_MVA:
+			run.append ( ( name, type_ ) )
+			continue
+		if run:
+			struct_ = Struct ( '>' + ''.join([ _ATTR_FORMATS.get(t, 'L') for n, t in run ]) )
+			segments.append ( ( [ n for n, t in run ], struct_.unpack_from, struct_.size ) )
+			run = []
+		if name is not None:
+			segments.append ( ( name, None, 0 ) )
+
+	def decode (buf, p):
+		doc, weight = head.unpack_from(buf, p)
+		p += head.size
+		values = {}
+		for names_, unpack_run, size in segments:
+			if unpack_run is None:
+				nvals = _UINT.unpack_from(buf, p)[0]
+				p += 4
+				values[names_] = list(unpack_from('>%dL' % nvals, buf, p))
+				p += 4*nvals
+			else:
+				values.update(zip(names_, unpack_run(buf, p)))
+				p += size
+		return { 'id':doc, 'weight':weight, 'attrs':values }, p
+
+	return decode
+
+
+def _ParseSearchResponse (response, nreqs):
+	"""
+	INTERNAL METHOD, DO NOT CALL. Parses the reply to a batch of nreqs search
+	queries into a list of result set hashes.
+	Reads the reply in place, without slicing it up per field.
+	"""
+	buf = memoryview(response)
+	p = 0
+
+	results = []
+	for i in xrange(nreqs):
+		result = { 'error':'', 'warning':'' }
+		results.append(result)
+
+		status = _UINT.unpack_from(buf, p)[0]
+		p += 4
+		result['status'] = status
+		if status != SEARCHD_OK:
+			message, p = _ReadString(buf, p)
+
+			if status == SEARCHD_WARNING:
+				result['warning'] = message
+			else:
+				result['error'] = message
+				continue
+
+		# read schema
+		fields = []
+		nfields = _UINT.unpack_from(buf, p)[0]
+		p += 4
+		for j in xrange(nfields):
+			field, p = _ReadString(buf, p)
+			fields.append(field)
+
+		result['fields'] = fields
+
+		attrs = []
+		nattrs = _UINT.unpack_from(buf, p)[0]
+		p += 4
+		for j in xrange(nattrs):
+			attr, p = _ReadString(buf, p)
+			type_ = _UINT.unpack_from(buf, p)[0]
+			p += 4
+			attrs.append([attr,type_])
+
+		result['attrs'] = attrs
+
+		# read match count
+		count, id64 = _UINT2.unpack_from(buf, p)
+		p += 8
+
+		# read matches
+		decode = _MakeMatchDecoder(attrs, id64)
+		matches = []
+		for j in xrange(count):
+			match, p = decode(buf, p)
+			matches.append(match)
+
+		result['matches'] = matches
+
+		result['total'], result['total_found'], time_, words = _UINT4.unpack_from(buf, p)
+		result['time'] = '%.3f' % (time_/1000.0)
+		p += 16
+
+		result['words'] = []
+		for j in xrange(words):
+			word, p = _ReadString(buf, p)
+			docs, hits = _UINT2.unpack_from(buf, p)
+			p += 8
+
+			result['words'].append({'word':word, 'docs':docs, 'hits':hits})
+
+	return results
+
+
 class SphinxClient:
 	def __init__ (self):
 		"""
@@ -609,119 +762,13 @@ class SphinxClient:
 			return None
 
 		nreqs = len(self._reqs)
-
-		# parse response
-		max_ = len(response)
-		p = 0
-
-		results = []
-		for i in range(0,nreqs,1):
-			result = {}
-			results.append(result)
-
-			result['error'] = ''
-			result['warning'] = ''
-			status = unpack('>L', response[p:p+4])[0]
-			p += 4
-			result['status'] = status
-			if status != SEARCHD_OK:
-				length = unpack('>L', response[p:p+4])[0]
-				p += 4
-				message = response[p:p+length]
-				p += length
-
-				if status == SEARCHD_WARNING:
-					result['warning'] = message
-				else:
-					result['error'] = message
-					continue
-
-			# read schema
-			fields = []
-			attrs = []
-
-			nfields = unpack('>L', response[p:p+4])[0]
-			p += 4
-			while nfields>0 and p<max_:
-				nfields -= 1
-				length = unpack('>L', response[p:p+4])[0]
-				p += 4
-				fields.append(response[p:p+length])
-				p += length
-
-			result['fields'] = fields
-
-			nattrs = unpack('>L', response[p:p+4])[0]
-			p += 4
-			while nattrs>0 and p<max_:
-				nattrs -= 1
-				length = unpack('>L', response[p:p+4])[0]
-				p += 4
-				attr = response[p:p+length]
-				p += length
-				type_ = unpack('>L', response[p:p+4])[0]
-				p += 4
-				attrs.append([attr,type_])
-
-			result['attrs'] = attrs
-
-			# read match count
-			count = unpack('>L', response[p:p+4])[0]
-			p += 4
-			id64 = unpack('>L', response[p:p+4])[0]
-			p += 4
-		
-			# read matches
-			result['matches'] = []
-			while count>0 and p<max_:
-				count -= 1
-				if id64:
-					doc, weight = unpack('>QL', response[p:p+12])
-					p += 12
-				else:
-					doc, weight = unpack('>2L', response[p:p+8])
-					p += 8
-
-				match = { 'id':doc, 'weight':weight, 'attrs':{} }
-				for i in range(len(attrs)):
-					if attrs[i][1] == SPH_ATTR_FLOAT:
-						match['attrs'][attrs[i][0]] = unpack('>f', response[p:p+4])[0]
-					elif attrs[i][1] == SPH_ATTR_BIGINT:
-						match['attrs'][attrs[i][0]] = unpack('>q', response[p:p+8])[0]
-						p += 4
-					elif attrs[i][1] == (SPH_ATTR_MULTI | SPH_ATTR_INTEGER):
-						match['attrs'][attrs[i][0]] = []
-						nvals = unpack('>L', response[p:p+4])[0]
-						p += 4
-						for n in range(0,nvals,1):
-							match['attrs'][attrs[i][0]].append(unpack('>L', response[p:p+4])[0])
-							p += 4
-						p -= 4
-					else:
-						match['attrs'][attrs[i][0]] = unpack('>L', response[p:p+4])[0]
-					p += 4
-
-				result['matches'].append ( match )
-
-			result['total'], result['total_found'], result['time'], words = unpack('>4L', response[p:p+16])
-
-			result['time'] = '%.3f' % (result['time']/1000.0)
-			p += 16
-
-			result['words'] = []
-			while words>0:
-				words -= 1
-				length = unpack('>L', response[p:p+4])[0]
-				p += 4
-				word = response[p:p+length]
-				p += length
-				docs, hits = unpack('>2L', response[p:p+8])
-				p += 8
-
-				result['words'].append({'word':word, 'docs':docs, 'hits':hits})
-		
 		self._reqs = []
-		return results
+
+		try:
+			return _ParseSearchResponse(response, nreqs)
+		except StructError:
+			self._error = 'incomplete reply'
+			return None
 	
 
 	def BuildExcerpts (self, docs, index, words, opts=None):
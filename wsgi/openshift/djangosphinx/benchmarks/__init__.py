@@ -0,0 +1,8 @@
+"""
+Micro-benchmarks for djangosphinx.
+
+Each module can be run on its own from the project directory, e.g.
+<code>
+    python -m djangosphinx.benchmarks.parser
+</code>
+"""
@@ -0,0 +1,176 @@
+"""
+Compares the searchd response parser against the original slicing parser.
+
+<code>
+    python -m djangosphinx.benchmarks.parser [--matches 1000] [--attrs 12] [--mva]
+    python -m djangosphinx.benchmarks.parser --requests 1 recorded_reply.bin
+</code>
+
+Recorded replies are the raw body of a SEARCH reply (without the 8 byte
+header), as read by SphinxClient._GetResponse().
+"""
+from optparse import OptionParser
+from struct import unpack
+import timeit
+
+from djangosphinx.apis.api278 import _ParseSearchResponse, SEARCHD_OK, \
+     SEARCHD_WARNING, SPH_ATTR_FLOAT, SPH_ATTR_BIGINT, SPH_ATTR_MULTI, \
+     SPH_ATTR_INTEGER
+from djangosphinx.protocol import encode_search_result, \
+     encode_search_response, generate_attrs, generate_matches
+
+def legacy_parse(response, nreqs):
+    """The parser RunQueries() used before, kept verbatim for comparison."""
+    max_ = len(response)
+    p = 0
+
+    results = []
+    for i in range(0,nreqs,1):
+        result = {}
+        results.append(result)
+
+        result['error'] = ''
+        result['warning'] = ''
+        status = unpack('>L', response[p:p+4])[0]
+        p += 4
+        result['status'] = status
+        if status != SEARCHD_OK:
+            length = unpack('>L', response[p:p+4])[0]
+            p += 4
+            message = response[p:p+length]
+            p += length
+
+            if status == SEARCHD_WARNING:
+                result['warning'] = message
+            else:
+                result['error'] = message
+                continue
+
+        fields = []
+        attrs = []
+
+        nfields = unpack('>L', response[p:p+4])[0]
+        p += 4
+        while nfields>0 and p<max_:
+            nfields -= 1
+            length = unpack('>L', response[p:p+4])[0]
+            p += 4
+            fields.append(response[p:p+length])
+            p += length
+
+        result['fields'] = fields
+
+        nattrs = unpack('>L', response[p:p+4])[0]
+        p += 4
+        while nattrs>0 and p<max_:
+            nattrs -= 1
+            length = unpack('>L', response[p:p+4])[0]
+            p += 4
+            attr = response[p:p+length]
+            p += length
+            type_ = unpack('>L', response[p:p+4])[0]
+            p += 4
+            attrs.append([attr,type_])
+
+        result['attrs'] = attrs
+
+        count = unpack('>L', response[p:p+4])[0]
+        p += 4
+        id64 = unpack('>L', response[p:p+4])[0]
+        p += 4
+
+        result['matches'] = []
+        while count>0 and p<max_:
+            count -= 1
+            if id64:
+                doc, weight = unpack('>QL', response[p:p+12])
+                p += 12
+            else:
+                doc, weight = unpack('>2L', response[p:p+8])
+                p += 8
+
+            match = { 'id':doc, 'weight':weight, 'attrs':{} }
+            for i in range(len(attrs)):
+                if attrs[i][1] == SPH_ATTR_FLOAT:
+                    match['attrs'][attrs[i][0]] = unpack('>f', response[p:p+4])[0]
+                elif attrs[i][1] == SPH_ATTR_BIGINT:
+                    match['attrs'][attrs[i][0]] = unpack('>q', response[p:p+8])[0]
+                    p += 4
+                elif attrs[i][1] == (SPH_ATTR_MULTI | SPH_ATTR_INTEGER):
+                    match['attrs'][attrs[i][0]] = []
+                    nvals = unpack('>L', response[p:p+4])[0]
+                    p += 4
+                    for n in range(0,nvals,1):
+                        match['attrs'][attrs[i][0]].append(unpack('>L', response[p:p+4])[0])
+                        p += 4
+                    p -= 4
+                else:
+                    match['attrs'][attrs[i][0]] = unpack('>L', response[p:p+4])[0]
+                p += 4
+
+            result['matches'].append ( match )
+
+        result['total'], result['total_found'], result['time'], words = unpack('>4L', response[p:p+16])
+
+        result['time'] = '%.3f' % (result['time']/1000.0)
+        p += 16
+
+        result['words'] = []
+        while words>0:
+            words -= 1
+            length = unpack('>L', response[p:p+4])[0]
+            p += 4
+            word = response[p:p+length]
+            p += length
+            docs, hits = unpack('>2L', response[p:p+8])
+            p += 8
+
+            result['words'].append({'word':word, 'docs':docs, 'hits':hits})
+
+    return results
+
+def build_response(matches=1000, attrs=12, mva=False, requests=1):
+    schema = generate_attrs(attrs, mva)
+    fields = ['title', 'keywords', 'description', 'content']
+    words = [{'word': 'django', 'docs': matches, 'hits': matches * 3}]
+    return encode_search_response([
+        encode_search_result(fields, schema, generate_matches(matches, schema, seed=i),
+                             total_found=matches * 10, time=12, words=words)
+        for i in range(requests)])
+
+def run(response, nreqs, number):
+    expected = legacy_parse(response, nreqs)
+    assert _ParseSearchResponse(response, nreqs) == expected, 'parsers disagree'
+
+    legacy = min(timeit.repeat(lambda: legacy_parse(response, nreqs), number=number, repeat=3))
+    current = min(timeit.repeat(lambda: _ParseSearchResponse(response, nreqs), number=number, repeat=3))
+
+    matches = sum([len(r.get('matches', [])) for r in expected])
+    print '%d bytes, %d request(s), %d matches' % (len(response), nreqs, matches)
+    print '  legacy:  %8.3f ms per reply' % (legacy * 1000 / number)
+    print '  current: %8.3f ms per reply (%.2fx)' % (current * 1000 / number, legacy / current)
+
+def main():
+    parser = OptionParser(usage='%prog [options] [recorded_reply ...]')
+    parser.add_option('--matches', type='int', default=1000)
+    parser.add_option('--attrs', type='int', default=12)
+    parser.add_option('--mva', action='store_true', default=False)
+    parser.add_option('--requests', type='int', default=1)
+    parser.add_option('--number', type='int', default=20)
+    options, args = parser.parse_args()
+
+    if args:
+        for path in args:
+            fh = open(path, 'rb')
+            try:
+                response = fh.read()
+            finally:
+                fh.close()
+            print path
+            run(response, options.requests, options.number)
+    else:
+        run(build_response(options.matches, options.attrs, False, options.requests), options.requests, options.number)
+        run(build_response(options.matches, options.attrs, True, options.requests), options.requests, options.number)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+A pure-Python stand-in for searchd.
+
+Speaks the searchd binary protocol (API 0x116) over TCP or a unix socket and
+answers SEARCH, EXCERPT, UPDATE, KEYWORDS and PERSIST commands from canned or
+generated result sets, so djangosphinx can be exercised without a real index.
+
+<code>
+    from djangosphinx.fakesearchd import FakeSearchd, ResultSet
+
+    server = FakeSearchd(results=ResultSet.generate(1000), latency=0.002)
+    server.start()
+    client.SetServer(*server.address)
+    ...
+    server.stop()
+</code>
+
+``results`` is either a single ResultSet used for every query, a dict mapping
+query strings to ResultSets, or a callable receiving the decoded request and
+returning a ResultSet.
+"""
+import logging
+import os
+import re
+import socket
+import SocketServer
+import threading
+import time
+from struct import pack, unpack
+
+from djangosphinx.apis.api278 import SEARCHD_COMMAND_SEARCH, \
+     SEARCHD_COMMAND_EXCERPT, SEARCHD_COMMAND_UPDATE, \
+     SEARCHD_COMMAND_KEYWORDS, SEARCHD_COMMAND_PERSIST, VER_COMMAND_SEARCH, \
+     VER_COMMAND_EXCERPT, VER_COMMAND_UPDATE, VER_COMMAND_KEYWORDS, \
+     SEARCHD_ERROR
+from djangosphinx.protocol import RequestReader, encode_header, \
+     encode_search_result, encode_search_response, encode_excerpts, \
+     encode_keywords, encode_update, pack_string, decode_search_request, \
+     decode_excerpts_request, decode_update_request, \
+     decode_keywords_request, generate_attrs, generate_matches
+
+__all__ = ('FakeSearchd', 'ResultSet')
+
+log = logging.getLogger('djangosphinx.fakesearchd')
+
+DEFAULT_FIELDS = ['title', 'keywords', 'description', 'content']
+
+class ResultSet(object):
+    """All matches for a query; searches get the offset/limit window of it."""
+
+    def __init__(self, matches, attrs=(), fields=DEFAULT_FIELDS, words=None):
+        self.matches = list(matches)
+        self.attrs = list(attrs)
+        self.fields = list(fields)
+        self.words = words
+
+    @classmethod
+    def generate(cls, count, attrs=None, ids=None, **kwargs):
+        """
+        Generates ``count`` matches, or one match per document id in ``ids``
+        (handy to line results up with real database rows).
+        """
+        if attrs is None:
+            attrs = generate_attrs(4)
+        matches = generate_matches(ids is None and count or len(ids), attrs, seed=0)
+        if ids is not None:
+            for match, doc in zip(matches, ids):
+                match['id'] = doc
+        return cls(matches, attrs, **kwargs)
+
+    def encode(self, request):
+        offset = request['offset']
+        window = self.matches[offset:offset + request['limit']]
+        words = self.words
+        if words is None:
+            words = [{'word': w, 'docs': len(self.matches), 'hits': len(self.matches)}
+                     for w in request['query'].split()]
+        total = min(len(self.matches), request['maxmatches'])
+        return encode_search_result(self.fields, self.attrs, window, total=total,
+                                    total_found=len(self.matches), words=words)
+
+class SearchdHandler(SocketServer.BaseRequestHandler):
+
+    def recv_exactly(self, length):
+        chunks = []
+        while length > 0:
+            chunk = self.request.recv(length)
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            length -= len(chunk)
+        return ''.join(chunks)
+
+    def setup(self):
+        self.server.searchd.connection_opened(self.request)
+
+    def finish(self):
+        self.server.searchd.connection_closed(self.request)
+
+    def handle(self):
+        server = self.server.searchd
+        server.count('connections')
+
+        # protocol version handshake
+        self.request.sendall(pack('>L', 1))
+        if self.recv_exactly(4) is None:
+            return
+
+        persistent = False
+        while True:
+            header = self.recv_exactly(8)
+            if header is None:
+                return
+            command, version, length = unpack('>2HL', header)
+            body = self.recv_exactly(length)
+            if body is None:
+                return
+
+            if command == SEARCHD_COMMAND_PERSIST:
+                server.count('persist')
+                persistent = bool(unpack('>L', body)[0])
+                continue
+
+            if server.latency:
+                time.sleep(server.latency)
+
+            try:
+                reply = server.dispatch(command, body)
+            except Exception, e:
+                log.exception('Fake searchd failed to answer command %s', command)
+                reply = encode_header(pack_string(str(e)), version, SEARCHD_ERROR)
+            self.request.sendall(reply)
+
+            if not persistent:
+                return
+
+class ThreadingTCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class ThreadingUnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+class FakeSearchd(object):
+
+    def __init__(self, host='127.0.0.1', port=0, path=None, results=None,
+                 latency=0, excerpts=None, keywords=None, record=False):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.results = results is None and ResultSet.generate(1000) or results
+        self.latency = latency
+        self.excerpts = excerpts
+        self.keywords = keywords
+        self.record = record
+        self.requests = []
+        self.stats = {}
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def address(self):
+        """(host, port) or (path, None), as SphinxClient.SetServer() takes them."""
+        if self.path:
+            return (self.path, None)
+        return (self.host, self._server and self._server.server_address[1] or self.port)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + amount
+
+    def connection_opened(self, sock):
+        with self._lock:
+            self._connections.add(sock)
+
+    def connection_closed(self, sock):
+        with self._lock:
+            self._connections.discard(sock)
+
+    def start(self):
+        if self.path:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self._server = ThreadingUnixServer(self.path, SearchdHandler)
+        else:
+            self._server = ThreadingTCPServer((self.host, self.port), SearchdHandler)
+        self._server.searchd = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        # drop persistent connections too, like a searchd restart would
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for sock in connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def dispatch(self, command, body):
+        reader = RequestReader(body)
+        if command == SEARCHD_COMMAND_SEARCH:
+            return encode_header(self.search(reader), VER_COMMAND_SEARCH)
+        elif command == SEARCHD_COMMAND_EXCERPT:
+            return encode_header(self.excerpt(reader), VER_COMMAND_EXCERPT)
+        elif command == SEARCHD_COMMAND_UPDATE:
+            return encode_header(self.update(reader), VER_COMMAND_UPDATE)
+        elif command == SEARCHD_COMMAND_KEYWORDS:
+            return encode_header(self.keyword(reader), VER_COMMAND_KEYWORDS)
+        raise ValueError('unknown command %s' % command)
+
+    def log_request(self, command, request):
+        if self.record:
+            with self._lock:
+                self.requests.append((command, request))
+
+    def get_result_set(self, request):
+        if callable(self.results):
+            return self.results(request)
+        elif isinstance(self.results, dict):
+            return self.results.get(request['query']) or ResultSet([])
+        return self.results
+
+    def search(self, reader):
+        nreqs = reader.uint()
+        self.count('search')
+        self.count('queries', nreqs)
+        replies = []
+        for i in xrange(nreqs):
+            request = decode_search_request(reader)
+            self.log_request('search', request)
+            replies.append(self.get_result_set(request).encode(request))
+        return encode_search_response(replies)
+
+    def excerpt(self, reader):
+        request = decode_excerpts_request(reader)
+        self.count('excerpt')
+        self.log_request('excerpt', request)
+        if self.excerpts is not None:
+            return encode_excerpts(self.excerpts(request))
+
+        words = [re.escape(w) for w in request['words'].split() if w]
+        if not words:
+            return encode_excerpts(request['docs'])
+        regex = re.compile('(%s)' % '|'.join(words), re.I)
+        highlight = r'%s\1%s' % (request['before_match'].replace('\\', r'\\'),
+                                 request['after_match'].replace('\\', r'\\'))
+        return encode_excerpts([regex.sub(highlight, doc) for doc in request['docs']])
+
+    def update(self, reader):
+        request = decode_update_request(reader)
+        self.count('update')
+        self.log_request('update', request)
+        return encode_update(len(request['values']))
+
+    def keyword(self, reader):
+        request = decode_keywords_request(reader)
+        self.count('keywords')
+        self.log_request('keywords', request)
+        if self.keywords is not None:
+            return encode_keywords(self.keywords(request), request['hits'])
+        words = [{'tokenized': w, 'normalized': w.lower(), 'docs': 1, 'hits': 1}
+                 for w in request['query'].split()]
+        return encode_keywords(words, request['hits'])
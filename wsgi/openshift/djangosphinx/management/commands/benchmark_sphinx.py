@@ -0,0 +1,172 @@
+from optparse import make_option
+import operator
+import os.path
+import threading
+import time
+
+from django.core.management.base import LabelCommand, CommandError
+from django.db import models
+from django.db.models import Q
+
+from djangosphinx import models as sphinx_models
+from djangosphinx.fakesearchd import FakeSearchd, ResultSet
+
+def percentile(timings, pct):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * pct / 100.0))]
+
+def legacy_hydrate(queryset, matches):
+    """The OR chain _get_results() used to load matches with, kept for comparison."""
+    pks = getattr(queryset.model._meta, 'pks', [queryset.model._meta.pk])
+    q = reduce(operator.or_, [reduce(operator.and_, [Q(**{p.name: r['attrs'][p.column]}) for p in pks]) for r in matches])
+    return dict([(', '.join([unicode(getattr(o, p.attname)) for p in pks]), o) for o in queryset.filter(q)])
+
+class Command(LabelCommand):
+    help = """Benchmarks SphinxQuerySet against a local fake searchd.
+
+Matches are generated from the primary keys of the model's rows, so the
+numbers include hydration from the database.
+
+    ./manage.py benchmark_sphinx articles.Article"""
+    args = '<app_label.ModelName ...>'
+    label = 'model'
+
+    option_list = LabelCommand.option_list + (
+        make_option('--queries', dest='queries', type='int', default=200, help='Queries per measurement'),
+        make_option('--limit', dest='limit', type='int', default=20, help='Matches per query'),
+        make_option('--latency', dest='latency', type='float', default=0, help='Simulated searchd latency in milliseconds'),
+        make_option('--concurrency', dest='concurrency', default='1,2,4,8', help='Comma separated thread counts for the throughput test; empty skips it'),
+        make_option('--socket', dest='socket', default=None, help='Serve on this unix socket instead of TCP'),
+        make_option('--no-pool', action='store_false', dest='pool', default=True, help='Disable persistent connections'),
+        make_option('--result-cache', action='store_true', dest='result_cache', default=False, help='Keep the cross-request result cache on'),
+        make_option('--passages', action='store_true', dest='passages', default=False, help='Build passages for every page of matches'),
+        make_option('--defer', dest='defer', default='', help='Comma separated fields to leave out of hydration, e.g. content,rendered_content'),
+    )
+
+    def handle_label(self, label, **options):
+        try:
+            app_label, model_name = label.split('.')
+        except ValueError:
+            raise CommandError('Models are given as app_label.ModelName')
+        model = models.get_model(app_label, model_name)
+        if model is None:
+            raise CommandError('Unknown model: %s' % label)
+
+        indexes = getattr(model, '__sphinx_indexes__', None)
+        if not indexes:
+            raise CommandError('%s has no SphinxSearch manager' % label)
+        manager = [v for v in model.__dict__.values() if isinstance(v, sphinx_models.SphinxModelManager)][0]
+
+        ids = list(model._default_manager.values_list('pk', flat=True)[:1000])
+        if not ids:
+            raise CommandError('%s has no rows to hydrate' % label)
+
+        path = options['socket'] and os.path.abspath(options['socket'])
+        # the model's text columns stand in for the indexed fields passages are built from
+        fields = [f.attname for f in model._meta.fields if f.get_internal_type() in ('CharField', 'TextField')]
+        server = FakeSearchd(path=path, results=ResultSet.generate(len(ids), ids=ids, fields=fields),
+                             latency=options['latency'] / 1000.0)
+        server.start()
+
+        pool = sphinx_models.connection_pool
+        saved = (pool.server, pool.port, pool.persistent)
+        saved_timeout = sphinx_models.RESULT_CACHE_TIMEOUT
+        if not options['result_cache']:
+            # otherwise every query after the first is answered by the cache
+            sphinx_models.RESULT_CACHE_TIMEOUT = 0
+        pool.clear()
+        pool.server, pool.port = server.address
+        pool.persistent = options['pool']
+        try:
+            self.stdout.write('%s: %s rows, %s matches per query, %s\n' % (
+                label, len(ids), options['limit'], options['socket'] and 'unix socket' or 'tcp'))
+            self.latency(manager, options)
+            self.hydration(manager, options)
+            self.hydration_paths(manager, model, ids, options)
+            for threads in [int(c) for c in options['concurrency'].split(',') if c.strip()]:
+                self.throughput(manager, options, threads)
+            self.stdout.write('searchd saw: %s\n' % (server.stats,))
+        finally:
+            pool.clear()
+            pool.server, pool.port, pool.persistent = saved
+            sphinx_models.RESULT_CACHE_TIMEOUT = saved_timeout
+            server.stop()
+
+    def search(self, manager, options):
+        qs = manager.query('benchmark')
+        if options['defer']:
+            qs = qs.defer(*options['defer'].split(','))
+        if options['passages']:
+            qs = qs._clone(_passages=True)
+        return qs
+
+    def query(self, manager, options):
+        return self.search(manager, options)[0:options['limit']]
+
+    def latency(self, manager, options):
+        timings = []
+        for i in xrange(options['queries']):
+            start = time.time()
+            self.query(manager, options)
+            timings.append(time.time() - start)
+        self.stdout.write('end-to-end latency: mean %.2f ms, p50 %.2f ms, p95 %.2f ms\n' % (
+            1000 * sum(timings) / len(timings), 1000 * percentile(timings, 50), 1000 * percentile(timings, 95)))
+
+    def hydration(self, manager, options):
+        search = hydrate = 0.0
+        for i in xrange(options['queries']):
+            qs = self.search(manager, options)
+            qs._limit = options['limit']
+
+            start = time.time()
+            results = qs._get_sphinx_results()
+            search += time.time() - start
+
+            start = time.time()
+            qs._get_results(results)
+            hydrate += time.time() - start
+        n = options['queries']
+        self.stdout.write('searchd round trip %.2f ms, hydration %.2f ms per query\n' % (
+            1000 * search / n, 1000 * hydrate / n))
+
+    def hydration_paths(self, manager, model, ids, options):
+        """Loads matches carrying the pk attribute with the old OR chain and with pk__in"""
+        qs = self.search(manager, options)
+        runs = max(1, min(options['queries'], 50))
+        for size in sorted(set([options['limit'], 100, len(ids)])):
+            if size > len(ids):
+                continue
+            matches = [{'id': pk, 'weight': 1, 'attrs': {model._meta.pk.column: pk}} for pk in ids[:size]]
+            timings = {}
+            for name, hydrate in (('or chain', lambda: legacy_hydrate(qs.get_query_set(model), matches)),
+                                  ('pk__in', lambda: qs._hydrate(qs.get_query_set(model), matches))):
+                start = time.time()
+                try:
+                    for i in xrange(runs):
+                        hydrate()
+                except Exception, e:
+                    timings[name] = 'failed (%s)' % (e.__class__.__name__,)
+                else:
+                    timings[name] = '%.2f ms' % (1000 * (time.time() - start) / runs,)
+            self.stdout.write('hydrating %4d matches: or chain %s, pk__in %s\n' % (
+                size, timings['or chain'], timings['pk__in']))
+
+    def throughput(self, manager, options, threads):
+        per_thread = max(1, options['queries'] / threads)
+
+        def worker():
+            from django.db import connection
+            try:
+                for i in xrange(per_thread):
+                    self.query(manager, options)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for i in range(threads)]
+        start = time.time()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.time() - start
+        self.stdout.write('%2d threads: %.1f queries/s\n' % (threads, per_thread * threads / elapsed))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from djangosphinx.resultcache import bump_index_generation
+
+class Command(BaseCommand):
+    help = """Drops the cached search results of the given Sphinx indexes, or of
+every index a model searches.  Run it once `indexer --rotate` has finished:
+
+    indexer --all --rotate && ./manage.py bump_sphinx_generation"""
+    args = '[index ...]'
+
+    def handle(self, *indexes, **options):
+        if not indexes:
+            indexes = []
+            for model in models.get_models():
+                for index in getattr(model, '__sphinx_indexes__', None) or []:
+                    if index not in indexes:
+                        indexes.append(index)
+
+        bump_index_generation(*indexes)
+        if int(options.get('verbosity', 1)) > 0:
+            print 'Bumped the generation of: %s' % (', '.join(indexes) or 'no indexes',)
@@ -4,9 +4,10 @@ import socket
 import time
 import struct
 import warnings
-import operator
 import apis.current as sphinxapi
 import logging
+from pool import ConnectionPool
+from resultcache import RESULT_CACHE_TIMEOUT, PASSAGES_CACHE_TIMEOUT, result_key, passages_key
 import re
 try:
     import decimal
@@ -15,6 +16,8 @@ except ImportError:
 
 from django.db.models.query import QuerySet, Q
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import smart_str
 
 __all__ = ('SearchError', 'ConnectionError', 'SphinxSearch', 'SphinxRelation', 'SphinxQuerySet')
 
@@ -29,6 +32,18 @@ SPHINX_PORT             = int(getattr(settings, 'SPHINX_PORT', 3312))
 SPHINX_RETRIES          = int(getattr(settings, 'SPHINX_RETRIES', 0))
 SPHINX_RETRIES_DELAY    = int(getattr(settings, 'SPHINX_RETRIES_DELAY', 5))
 
+# persistent connection pooling (requires searchd 0.9.9)
+SPHINX_PERSISTENT       = getattr(settings, 'SPHINX_PERSISTENT', True)
+SPHINX_POOL_SIZE        = int(getattr(settings, 'SPHINX_POOL_SIZE', 5))
+SPHINX_POOL_IDLE_TIMEOUT = int(getattr(settings, 'SPHINX_POOL_IDLE_TIMEOUT', 60))
+
+# result windows (slices) each queryset keeps around
+SPHINX_WINDOW_CACHE_SIZE = int(getattr(settings, 'SPHINX_WINDOW_CACHE_SIZE', 8))
+
+# passages for a page are built in as few EXCERPT requests as fit in this many
+# bytes of documents; keep it under searchd's max_packet_size (8M by default)
+SPHINX_EXCERPTS_MAX_PACKET = int(getattr(settings, 'SPHINX_EXCERPTS_MAX_PACKET', 4 * 1024 * 1024))
+
 MAX_INT = int(2**31-1)
 
 EMPTY_RESULT_SET = dict(
@@ -41,9 +56,65 @@ EMPTY_RESULT_SET = dict(
 
 UNDEFINED = object()
 
+connection_pool = ConnectionPool(SPHINX_SERVER, SPHINX_PORT,
+                                 size=SPHINX_POOL_SIZE,
+                                 idle_timeout=SPHINX_POOL_IDLE_TIMEOUT,
+                                 persistent=SPHINX_PERSISTENT and hasattr(sphinxapi, 'SEARCHD_COMMAND_PERSIST'))
+
 class SearchError(Exception): pass
 class ConnectionError(Exception): pass
 
+def _excerpt_packets(docs, max_size):
+    """
+    Splits ``docs`` into runs that fit in ``max_size`` bytes; a doc larger than
+    that still goes, on its own.
+    """
+    packet, size = [], 0
+    for doc in docs:
+        # every doc is sent with its 4 byte length
+        if packet and size + len(doc) + 4 > max_size:
+            yield packet
+            packet, size = [], 0
+        packet.append(doc)
+        size += len(doc) + 4
+    if packet:
+        yield packet
+
+class WindowCache(object):
+    """
+    A small LRU of result windows keyed by (offset, limit), so moving back and
+    forth between pages of a search does not go back to searchd.
+    """
+    def __init__(self, size=SPHINX_WINDOW_CACHE_SIZE):
+        self.size = max(size, 1)
+        self._windows = {}
+        self._order = []
+
+    def __len__(self):
+        return len(self._order)
+
+    def _touch(self, key):
+        self._order.remove(key)
+        self._order.append(key)
+
+    def get(self, offset, limit):
+        """Returns the cached rows offset..offset+limit, or None"""
+        for key in reversed(self._order):
+            start, length = key
+            if start <= offset and offset + limit <= start + length:
+                self._touch(key)
+                return self._windows[key][offset - start:offset - start + limit]
+        return None
+
+    def put(self, offset, limit, results):
+        key = (offset, limit)
+        if key in self._windows:
+            self._order.remove(key)
+        self._windows[key] = results
+        self._order.append(key)
+        while len(self._order) > self.size:
+            del self._windows[self._order.pop(0)]
+
 class SphinxProxy(object):
     """
     Acts exactly like a normal instance of an object except that
@@ -192,7 +263,7 @@ def to_sphinx(value):
     return int(value)
 
 class SphinxQuerySet(object):
-    available_kwargs = ('rankmode', 'mode', 'weights', 'maxmatches', 'passages', 'passages_opts')
+    available_kwargs = ('rankmode', 'mode', 'weights', 'maxmatches', 'passages', 'passages_opts', 'passages_fields', 'defer')
     
     def __init__(self, model=None, using=None, **kwargs):
         self._select_related        = False
@@ -201,6 +272,7 @@ class SphinxQuerySet(object):
         self._filters               = {}
         self._excludes              = {}
         self._extra                 = {}
+        self._defer                 = ()
         self._query                 = ''
         self.__metadata             = None
         self._offset                = 0
@@ -212,8 +284,11 @@ class SphinxQuerySet(object):
 
         self._passages              = False
         self._passages_opts         = {}
+        self._passages_fields       = None
         self._maxmatches            = 1000
         self._result_cache          = None
+        self._error                 = None
+        self._windows               = WindowCache()
         self._mode                  = sphinxapi.SPH_MATCH_ALL
         self._rankmode              = getattr(sphinxapi, 'SPH_RANK_PROXIMITY_BM25', None)
         self.model                  = model
@@ -238,7 +313,10 @@ class SphinxQuerySet(object):
             return '<%s instance>' % (self.__class__.__name__,)
 
     def __len__(self):
-        return self.count()
+        # the fetched window, like a QuerySet; list() asks for it before
+        # iterating, so counting here would cost a round trip of its own.
+        # count() is the number of matches
+        return len(self._get_data())
         
     def __iter__(self):
         return iter(self._get_data())
@@ -249,29 +327,17 @@ class SphinxQuerySet(object):
         assert (not isinstance(k, slice) and (k >= 0)) \
             or (isinstance(k, slice) and (k.start is None or k.start >= 0) and (k.stop is None or k.stop >= 0)), \
             "Negative indexing is not supported."
-        if self._result_cache is not None:
-            # Check to see if this is a portion of an already existing result cache
-            if type(k) == slice:
-                start = k.start
-                stop = k.stop-k.start
-                if start < self._offset or k.stop > self._limit:
-                    self._result_cache = None
-                else:
-                    start = start-self._offset
-                    return self._get_data()[start:k.stop]
-            else:
-                if k not in range(self._offset, self._limit+self._offset):
-                    self._result_cache = None
-                else:
-                    return self._get_data()[k-self._offset]
         if type(k) == slice:
-            self._offset = k.start
-            self._limit = k.stop-k.start
-            return self._get_data()
+            start = k.start or 0
+            stop = k.stop
+            if stop is None or stop > self._maxmatches:
+                stop = self._maxmatches
+            return self._get_window(start, stop - start)
         else:
-            self._offset = k
-            self._limit = 1
-            return self._get_data()[0]
+            window = self._get_window(k, 1)
+            if not window:
+                raise IndexError('list index out of range')
+            return window[0]
 
     def _format_options(self, **kwargs):
         kwargs['rankmode'] = getattr(sphinxapi, kwargs.get('rankmode', 'SPH_RANK_NONE'), None)
@@ -336,6 +402,15 @@ class SphinxQuerySet(object):
         c = EmptySphinxQuerySet()
         c.__dict__.update(self.__dict__.copy())
         return c
+
+    def window(self, start, stop):
+        """
+        A lazy ``qs[start:stop]``: slicing runs the search right away, this
+        returns a queryset which only fetches those matches when it is used
+        (or when it goes through ``batch()``).
+        """
+        stop = min(stop, self._maxmatches)
+        return self._clone(_offset=start, _limit=max(stop - start, 0))
         
     # only works on attributes
     def exclude(self, **kwargs):
@@ -389,17 +464,35 @@ class SphinxQuerySet(object):
         extra.update(kwargs)
         return self._clone(_extra=extra)
 
+    # large columns the results are shown without, e.g. defer('content');
+    # fields needed for passages are loaded anyway
+    def defer(self, *fields):
+        return self._clone(_defer=tuple(self._defer) + fields)
+
     def count(self):
-        return min(self._sphinx.get('total_found', 0), self._maxmatches)
+        """
+        The number of matches, up to maxmatches.  Unless a window was fetched
+        already, this asks searchd for a single match and loads no objects.
+        """
+        if not self.__metadata:
+            results = self._clone(_offset=0, _limit=1)._get_sphinx_results() or EMPTY_RESULT_SET
+            self.__metadata = {
+                'total': results['total'],
+                'total_found': results['total_found'],
+                'words': results['words'],
+            }
+        return min(self.__metadata.get('total_found', 0), self._maxmatches)
 
     def reset(self):
         return self.__class__(self.model, self._index)
 
     # Internal methods
     def _get_sphinx_client(self):
-        client = sphinxapi.SphinxClient()
-        client.SetServer(SPHINX_SERVER, SPHINX_PORT) #--------------bug------------There should be support a way to enable unix socket usage!!!
-        return client
+        # SetServer() treats paths starting with '/' or 'unix://' as unix sockets
+        return connection_pool.get_client()
+
+    def _release_sphinx_client(self, client, discard=False):
+        connection_pool.release(client, discard)
 
     def _clone(self, **kwargs):
         # Clones the queryset passing any changed args
@@ -407,6 +500,11 @@ class SphinxQuerySet(object):
         c.__dict__.update(self.__dict__.copy())
         for k, v in kwargs.iteritems():
             setattr(c, k, v)
+        # results belong to the queryset that fetched them
+        c._result_cache = None
+        c._error = None
+        c.__metadata = {}
+        c._windows = WindowCache()
         return c
     
     def _sphinx(self):
@@ -419,15 +517,35 @@ class SphinxQuerySet(object):
     def _get_data(self):
         assert(self._index)
         # need to find a way to make this work yet
+        if self._error is not None:
+            # batch() ran this search and it failed; don't silently run it again
+            raise self._error
         if self._result_cache is None:
             self._result_cache = list(self._get_results())
+            self._windows.put(self._offset, self._limit, self._result_cache)
         return self._result_cache
 
-    def _get_sphinx_results(self):
-        assert(self._offset + self._limit <= self._maxmatches)
-
-        client = self._get_sphinx_client()
-
+    def _get_window(self, offset, limit):
+        """
+        Returns matches offset..offset+limit, fetching (and hydrating) only
+        those unless a cached window holds them already.
+        """
+        limit = min(limit, self._maxmatches - offset)
+        if limit <= 0:
+            return []
+        window = self._windows.get(offset, limit)
+        if window is not None:
+            return window
+        self._offset, self._limit = offset, limit
+        self._result_cache = None
+        self._error = None
+        return self._get_data()
+
+    def _setup_sphinx_client(self, client):
+        """
+        Applies the options of this queryset to ``client``. Returns a list of
+        the options used, for logging.
+        """
         params = []
 
         if self._sort:
@@ -514,10 +632,6 @@ class SphinxQuerySet(object):
             params.append('rankmode=%s' % (self._rankmode,))
             client.SetRankingMode(self._rankmode)
 
-        if not self._limit > 0:
-            # Fix for Sphinx throwing an assertion error when you pass it an empty limiter
-            return EMPTY_RESULT_SET
-        
         if sphinxapi.VER_COMMAND_SEARCH >= 0x113:
             client.SetRetries(SPHINX_RETRIES, SPHINX_RETRIES_DELAY)
         
@@ -526,24 +640,162 @@ class SphinxQuerySet(object):
         # To avoid modifying the Sphinx API, we solve unicode indexes here
         if isinstance(self._index, unicode):
             self._index = self._index.encode('utf-8')
-        
-        results = client.Query(self._query, self._index)
-        
-        # The Sphinx API doesn't raise exceptions
 
+        return params
+
+    def _handle_sphinx_results(self, results, error='', warning='', params=()):
+        # The Sphinx API doesn't raise exceptions
         if not results:
-            if client.GetLastError():
-                raise SearchError, client.GetLastError()
-            elif client.GetLastWarning():
-                raise SearchError, client.GetLastWarning()
+            if error:
+                raise SearchError, error
+            elif warning:
+                raise SearchError, warning
             else:
                 results = EMPTY_RESULT_SET
         elif not results['matches']:
-            results = EMPTY_RESULT_SET
+            # keep the totals: a window past the last match still knows them
+            results = dict(EMPTY_RESULT_SET, total=results['total'],
+                           total_found=results['total_found'], words=results['words'])
         
         logging.debug('Found %s results for search query %s on %s with params: %s', results['total'], self._query, self._index, ', '.join(params))
         
         return results
+
+    def _get_cache_key(self):
+        """
+        Key of this search in the result cache: a hash of everything that
+        goes into the searchd request, behind the generation of its indexes.
+        """
+        if not RESULT_CACHE_TIMEOUT:
+            return None
+
+        def canonical(filters):
+            return sorted([(k, sorted(v)) for k, v in filters.iteritems()])
+
+        if isinstance(self._weights, dict):
+            weights = sorted(self._weights.items())
+        else:
+            weights = list(self._weights)
+        index = self._index
+        if isinstance(index, unicode):
+            index = index.encode('utf-8')
+
+        signature = repr((index, self._query, self._mode, self._rankmode, weights,
+                          canonical(self._filters), canonical(self._excludes), self._sort,
+                          self._groupby, getattr(self, '_groupfunc', None), getattr(self, '_groupsort', None),
+                          self._anchor, self._offset, self._limit, self._maxmatches))
+        return result_key(index, signature)
+
+    def _get_sphinx_results(self):
+        assert(self._offset + self._limit <= self._maxmatches)
+
+        if not self._limit > 0:
+            # Fix for Sphinx throwing an assertion error when you pass it an empty limiter
+            return EMPTY_RESULT_SET
+
+        key = self._get_cache_key()
+        if key:
+            results = cache.get(key)
+            if results is not None:
+                return results
+
+        client = self._get_sphinx_client()
+        try:
+            params = self._setup_sphinx_client(client)
+            results = client.Query(self._query, self._index)
+        except:
+            # the reply may be half read; never hand the socket out again
+            self._release_sphinx_client(client, discard=True)
+            raise
+        self._release_sphinx_client(client)
+
+        results = self._handle_sphinx_results(results, client.GetLastError(), client.GetLastWarning(), params)
+        if key:
+            # only what searchd sent: ids, weights, attributes and totals
+            cache.set(key, results, RESULT_CACHE_TIMEOUT)
+        return results
+
+    @staticmethod
+    def batch(*querysets):
+        """
+        Runs several querysets in a single searchd round trip using
+        AddQuery/RunQueries, filling in their result caches and metadata.
+        Use ``window()`` rather than slicing, which runs the search at once.
+
+        <code>
+            qs = MyModel.search.query('hello')
+            results, per_tag = SphinxQuerySet.batch(qs.window(0, 20), qs.group_by('tag_id', SPH_GROUPBY_ATTR))
+        </code>
+
+        If some of the searches fail, the others still get their results,
+        the failed ones raise their SearchError again when used, and the
+        first error is raised once every queryset has been filled in.
+        """
+        assert sphinxapi.VER_COMMAND_SEARCH >= 0x113, "You must upgrade sphinxapi to version 0.98 to use batched queries."
+
+        pending = []
+        keys = []
+        for qs in querysets:
+            if qs._result_cache is not None:
+                continue
+            if isinstance(qs, EmptySphinxQuerySet) or not qs._limit > 0:
+                # these never reach searchd
+                qs._get_data()
+                continue
+            assert(qs._offset + qs._limit <= qs._maxmatches)
+            key = qs._get_cache_key()
+            cached = key and cache.get(key)
+            if cached:
+                qs._result_cache = list(qs._get_results(cached))
+                qs._windows.put(qs._offset, qs._limit, qs._result_cache)
+                continue
+            pending.append(qs)
+            keys.append(key)
+
+        if not pending:
+            return querysets
+
+        client = pending[0]._get_sphinx_client()
+        try:
+            params = []
+            for qs in pending:
+                # SphinxClient keeps its settings between AddQuery() calls, so
+                # each request is built on a scratch client and only the
+                # serialized request is queued on the connected one
+                builder = sphinxapi.SphinxClient()
+                params.append(qs._setup_sphinx_client(builder))
+                builder.AddQuery(qs._query, qs._index)
+                client._reqs.extend(builder._reqs)
+            results = client.RunQueries()
+        except:
+            client._reqs = []
+            pending[0]._release_sphinx_client(client, discard=True)
+            raise
+        client._reqs = []
+        pending[0]._release_sphinx_client(client)
+
+        if not results:
+            raise SearchError, client.GetLastError()
+
+        errors = []
+        for qs, key, result, qs_params in zip(pending, keys, results, params):
+            data = result
+            if result['status'] == sphinxapi.SEARCHD_ERROR:
+                data = None
+            try:
+                data = qs._handle_sphinx_results(data, result['error'], result['warning'], qs_params)
+            except SearchError, e:
+                qs._error = e
+                errors.append(e)
+                continue
+            if key:
+                cache.set(key, data, RESULT_CACHE_TIMEOUT)
+            qs._result_cache = list(qs._get_results(data))
+            qs._windows.put(qs._offset, qs._limit, qs._result_cache)
+
+        if errors:
+            raise errors[0]
+        return querysets
     
     def get(self, **kwargs):
         """Hack to support ModelAdmin"""
@@ -554,8 +806,9 @@ class SphinxQuerySet(object):
             queryset = queryset.extra(**self._extra)
         return queryset.get(**kwargs)
 
-    def _get_results(self):
-        results = self._get_sphinx_results()
+    def _get_results(self, results=UNDEFINED):
+        if results is UNDEFINED:
+            results = self._get_sphinx_results()
         if not results:
             results = EMPTY_RESULT_SET
         self.__metadata = {
@@ -568,6 +821,8 @@ class SphinxQuerySet(object):
             # XXX: The passages implementation has a potential gotcha if your id
             # column is not actually your primary key
             words = ' '.join([w['word'] for w in results['words']])
+            # passages_fields picks some of the index fields; all of them by default
+            fields = self._passages_fields or results['fields']
             
         if self.model:
             if results['matches']:
@@ -576,33 +831,18 @@ class SphinxQuerySet(object):
                     queryset = queryset.select_related(*self._select_related_fields, **self._select_related_args)
                 if self._extra:
                     queryset = queryset.extra(**self._extra)
+                # passages are built from the fields, so those have to be loaded
+                defer = [f for f in self._defer if not (self._passages and f in fields)]
+                if defer:
+                    queryset = queryset.defer(*defer)
 
-                # django-sphinx supports the compositepks branch
-                # as well as custom id columns in your sphinx configuration
-                # but all primary key columns still need to be present in the field list
-                pks = getattr(self.model._meta, 'pks', [self.model._meta.pk])
-                if results['matches'][0]['attrs'].get(pks[0].column):
-                    
-                    # XXX: Sometimes attrs is empty and we cannot have custom primary key attributes
-                    for r in results['matches']:
-                        r['id'] = ', '.join([unicode(r['attrs'][p.column]) for p in pks])
-            
-                    # Join our Q objects to get a where clause which
-                    # matches all primary keys, even across multiple columns
-                    q = reduce(operator.or_, [reduce(operator.and_, [Q(**{p.name: r['attrs'][p.column]}) for p in pks]) for r in results['matches']])
-                    queryset = queryset.filter(q)
-                else:
-                    for r in results['matches']:
-                        r['id'] = unicode(r['id'])
-                    queryset = queryset.filter(pk__in=[r['id'] for r in results['matches']])
-                queryset = dict([(', '.join([unicode(getattr(o, p.attname)) for p in pks]), o) for o in queryset])
+                queryset = self._hydrate(queryset, results['matches'])
 
                 if self._passages:
-                    # TODO: clean this up
-                    for r in results['matches']:
-                        if r['id'] in queryset:
-                            r['passages'] = self._get_passages(queryset[r['id']], results['fields'], words)
+                    self._get_passages([(r, queryset[r['id']]) for r in results['matches'] if r['id'] in queryset],
+                                       fields, words)
                 
+                # the matches keep searchd's order; objects missing from the database are skipped
                 results = [SphinxProxy(queryset[r['id']], r) for r in results['matches'] if r['id'] in queryset]
             else:
                 results = []
@@ -611,58 +851,146 @@ class SphinxQuerySet(object):
             results['attrs'] = dict(results['attrs'])
             if 'content_type' in results['attrs']:
                 "Now we have to do one query per content_type"
-                objcache = {}
+                by_type = {}
                 for r in results['matches']:
-                    ct = r['attrs']['content_type']
-                    r['id'] = unicode(r['id'])
-                    objcache.setdefault(ct, {})[r['id']] = None
-                for ct in objcache:
+                    by_type.setdefault(r['attrs']['content_type'], []).append(r)
+                objcache = {}
+                for ct, matches in by_type.iteritems():
                     model_class = ContentType.objects.get(pk=ct).model_class()
-                    pks = getattr(model_class._meta, 'pks', [model_class._meta.pk])
-                    
-                    if results['matches'][0]['attrs'].get(pks[0].column):
-                        for r in results['matches']:
-                            if r['attrs']['content_type'] == ct:
-                                val = ', '.join([unicode(r['attrs'][p.column]) for p in pks])
-                                objcache[ct][r['id']] = r['id'] = val
-                    
-                        q = reduce(operator.or_, [reduce(operator.and_, [Q(**{p.name: r['attrs'][p.column]}) for p in pks]) for r in results['matches'] if r['attrs']['content_type'] == ct])
-                        queryset = self.get_query_set(model_class).filter(q)
-                    else:
-                        queryset = self.get_query_set(model_class).filter(pk__in=[r['id'] for r in results['matches'] if r['attrs']['content_type'] == ct])
-
-                    for o in queryset:
-                        objcache[ct][', '.join([unicode(getattr(o, p.name)) for p in pks])] = o
+                    objcache[ct] = self._hydrate(self.get_query_set(model_class), matches)
                 
                 if self._passages:
-                    for r in results['matches']:
-                        ct = r['attrs']['content_type']
-                        if r['id'] in objcache[ct]:
-                            r['passages'] = self._get_passages(objcache[ct][r['id']], results['fields'], words)
+                    self._get_passages([(r, objcache[r['attrs']['content_type']][r['id']]) for r in results['matches']
+                                        if r['id'] in objcache[r['attrs']['content_type']]],
+                                       fields, words)
                 results = [SphinxProxy(objcache[r['attrs']['content_type']][r['id']], r) for r in results['matches'] if r['id'] in objcache[r['attrs']['content_type']]]
             else:
                 results = results['matches']
         self._result_cache = results
         return results
 
-    def _get_passages(self, instance, fields, words):
-        client = self._get_sphinx_client()
+    def _hydrate(self, queryset, matches):
+        """
+        Loads the objects behind ``matches`` from ``queryset`` with a single
+        query, and returns them in a dict keyed by match id.  Sets r['id'] on
+        every match along the way.
+
+        The rows are looked up with one ``pk__in`` list, never with an OR of
+        one clause per match, which makes huge SQL that databases plan badly.
+        With a composite primary key (the compositepks branch) every column
+        gets its own ``__in`` list and the exact rows are picked out here.
+        """
+        model = queryset.model
+        # django-sphinx supports the compositepks branch
+        # as well as custom id columns in your sphinx configuration
+        # but all primary key columns still need to be present in the field list
+        pks = getattr(model._meta, 'pks', [model._meta.pk])
+        if matches[0]['attrs'].get(pks[0].column):
+            # XXX: Sometimes attrs is empty and we cannot have custom primary key attributes
+            for r in matches:
+                r['id'] = ', '.join([unicode(r['attrs'][p.column]) for p in pks])
+            lookups = [(p.name, set(r['attrs'][p.column] for r in matches)) for p in pks]
+        else:
+            for r in matches:
+                r['id'] = unicode(r['id'])
+            lookups = [('pk', set(r['id'] for r in matches))]
+
+        if len(lookups) == 1:
+            queryset = queryset.filter(pk__in=lookups[0][1])
+        else:
+            queryset = queryset.filter(**dict(('%s__in' % (name,), values) for name, values in lookups))
+
+        # the order comes from the matches, so don't make the database sort
+        objects = dict([(', '.join([unicode(getattr(o, p.attname)) for p in pks]), o) for o in queryset.order_by()])
+        if len(lookups) > 1:
+            # the __in lists may pick up other combinations of the same values
+            wanted = set(r['id'] for r in matches)
+            objects = dict((k, o) for k, o in objects.iteritems() if k in wanted)
+        return objects
+
+    def _get_passage_text(self, instance, field):
+        """
+        The text passages of ``field`` are built from: what the model's
+        ``get_<field>_passage_text()`` returns if it has one (to strip markup,
+        say), or else the attribute itself.
+        """
+        method = getattr(instance, 'get_%s_passage_text' % (field,), None)
+        if method is not None:
+            doc = method()
+        else:
+            doc = getattr(instance, field)
+        return doc is not None and smart_str(doc) or ''
+
+    def _get_passages(self, matches, fields, words):
+        """
+        Builds the passages of ``matches``, a list of (match, instance) pairs,
+        and stores them as r['passages'].
+
+        Passages already cached for the same words and text are reused.  For
+        the rest, BuildExcerpts takes a list of docs, so rather than a request
+        per match the docs go field by field across all the matches (every
+        title, then every body, ...) in as few requests as
+        SPHINX_EXCERPTS_MAX_PACKET allows, over one connection, and the
+        replies are split back per match.
+        """
+        if not matches:
+            return
 
-        docs = [getattr(instance, f) for f in fields]
         if isinstance(self._passages_opts, dict):
             opts = self._passages_opts
         else:
             opts = {}
         if isinstance(self._index, unicode):
             self._index = self._index.encode('utf-8')
-        passages_list = client.BuildExcerpts(docs, self._index, words, opts)
-        
-        passages = {}
-        c = 0
-        for f in fields:
-            passages[f] = passages_list[c]
-            c += 1
-        return passages
+        words = smart_str(words)
+
+        texts = [[self._get_passage_text(instance, f) for f in fields] for r, instance in matches]
+        keys = []
+        if PASSAGES_CACHE_TIMEOUT:
+            keys = [passages_key(self._index, words, opts, fields, docs) for docs in texts]
+            cached = cache.get_many(keys)
+            for key, (r, instance) in zip(keys, matches):
+                if key in cached:
+                    r['passages'] = cached[key]
+        missing = [i for i, (r, instance) in enumerate(matches) if 'passages' not in r]
+        if not missing:
+            return
+
+        docs = []
+        for j in range(len(fields)):
+            for i in missing:
+                docs.append(texts[i][j])
+
+        excerpts = []
+        client = self._get_sphinx_client()
+        try:
+            for packet in _excerpt_packets(docs, SPHINX_EXCERPTS_MAX_PACKET):
+                # BuildExcerpts fills its defaults into the opts it is given
+                built = client.BuildExcerpts(packet, self._index, words, dict(opts))
+                if not built or len(built) != len(packet):
+                    break
+                excerpts.extend(built)
+        except struct.error:
+            # a truncated reply, which is as good as a short one
+            pass
+        except:
+            self._release_sphinx_client(client, discard=True)
+            raise
+        # after a failed or short reply the stream can't be trusted either
+        self._release_sphinx_client(client, discard=len(excerpts) != len(docs))
+        if len(excerpts) != len(docs):
+            logging.warning('Could not build passages on %s: %s', self._index, client.GetLastError())
+            return
+
+        count = len(missing)
+        built = {}
+        for n, i in enumerate(missing):
+            passages = dict([(f, excerpts[j * count + n]) for j, f in enumerate(fields)])
+            matches[i][0]['passages'] = passages
+            if keys:
+                built[keys[i]] = passages
+        if built:
+            cache.set_many(built, PASSAGES_CACHE_TIMEOUT)
 
 class EmptySphinxQuerySet(SphinxQuerySet):
     def _get_sphinx_results(self):
@@ -698,6 +1026,9 @@ class SphinxModelManager(object):
     def geoanchor(self, *args, **kwargs):
         return self._get_query_set().geoanchor(*args, **kwargs)
 
+    def multi(self, *querysets):
+        return SphinxQuerySet.batch(*querysets)
+
 class SphinxInstanceManager(object):
     """Collection of tools useful for objects which are in a Sphinx index."""
     # TODO: deletion support
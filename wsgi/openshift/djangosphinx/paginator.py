@@ -0,0 +1,29 @@
+from django.core.paginator import Paginator, Page, PageNotAnInteger, EmptyPage
+
+__all__ = ('SphinxPaginator',)
+
+class SphinxPaginator(Paginator):
+    """
+    Paginates a SphinxQuerySet with one searchd round trip per page.
+
+    Django's Paginator counts first and then slices.  This fetches the page's
+    window first; the reply carries total_found, so the count comes free.
+    Only the matches of the page are hydrated.
+    """
+    def page(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+
+        bottom = (number - 1) * self.per_page
+        # orphans may end up on this page if it is the last one
+        window = list(self.object_list[bottom:bottom + self.per_page + self.orphans])
+
+        number = self.validate_number(number)
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        return Page(window[:top - bottom], number, self)
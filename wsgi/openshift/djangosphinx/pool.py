@@ -0,0 +1,147 @@
+"""
+Per-process pool of persistent searchd connections.
+
+Every ``SphinxClient`` normally connects, exchanges protocol versions and
+disconnects for each command.  The pool keeps sockets which have been switched
+to persistent mode (``SEARCHD_COMMAND_PERSIST``) around between queries so that
+only the first query of a process pays for the handshake.
+
+<code>
+    client = pool.get_client()
+    try:
+        results = client.Query('hello', 'my_index')
+    except:
+        # the reply may be half read
+        pool.release(client, discard=True)
+        raise
+    pool.release(client)
+</code>
+
+default settings.py values
+<code>
+    SPHINX_PERSISTENT = True
+    SPHINX_POOL_SIZE = 5
+    SPHINX_POOL_IDLE_TIMEOUT = 60
+</code>
+"""
+import logging
+import os
+import select
+import socket
+import threading
+import time
+
+import apis.current as sphinxapi
+
+__all__ = ('ConnectionPool',)
+
+log = logging.getLogger('djangosphinx.pool')
+
+def is_alive(sock):
+    """
+    Checks whether a pooled socket is still usable.  A healthy idle searchd
+    connection is writable and has nothing to read; anything readable means
+    the server closed it (or sent garbage we never asked for).
+    """
+    try:
+        readable, writable, _ = select.select([sock], [sock], [], 0)
+    except (select.error, socket.error, ValueError):
+        return False
+    return len(readable) == 0 and len(writable) == 1
+
+class ConnectionPool(object):
+    """
+    Hands out ``SphinxClient`` instances which share persistent sockets.
+
+    Clients are created fresh for every checkout so that no query state
+    (filters, limits, group-by...) leaks between queries; only the socket is
+    reused.
+    """
+    def __init__(self, server, port, size=5, idle_timeout=60, persistent=True):
+        self.server = server
+        self.port = port
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.persistent = persistent
+        self._lock = threading.Lock()
+        self._idle = []
+        self._pid = os.getpid()
+
+    def _new_client(self):
+        client = sphinxapi.SphinxClient()
+        client.SetServer(self.server, self.port)
+        return client
+
+    def _checkout_socket(self):
+        """Pops the most recently used live socket, dropping stale ones."""
+        now = time.time()
+        with self._lock:
+            if self._pid != os.getpid():
+                # we have been forked; the sockets belong to our parent
+                self._idle = []
+                self._pid = os.getpid()
+
+            while self._idle:
+                sock, last_used = self._idle.pop()
+                if self.idle_timeout and now - last_used > self.idle_timeout:
+                    log.debug('Closing searchd connection idle for %.1f seconds', now - last_used)
+                    sock.close()
+                elif not is_alive(sock):
+                    log.debug('Dropping dead searchd connection')
+                    sock.close()
+                else:
+                    return sock
+        return None
+
+    def get_client(self):
+        """
+        Returns a client bound to a pooled persistent connection when possible.
+        If the connection cannot be made persistent a regular, per-command
+        client is returned so errors surface the usual way from ``Query``.
+        """
+        client = self._new_client()
+        if not self.persistent:
+            return client
+
+        sock = self._checkout_socket()
+        if sock is not None:
+            client._socket = sock
+            return client
+
+        client.Open()
+        if not client._socket:
+            log.warning('Unable to open a persistent searchd connection: %s', client.GetLastError())
+            client = self._new_client()
+        return client
+
+    def release(self, client, discard=False):
+        """
+        Returns the client's socket to the pool.  Sockets of clients which hit
+        an error are closed, since the stream may be left mid-response.
+        """
+        sock = client._socket
+        if sock is None:
+            return
+
+        # detach the socket so SphinxClient.__del__ does not close it
+        client._socket = None
+
+        if discard or client.GetLastError():
+            sock.close()
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.size:
+                self._idle.append((sock, time.time()))
+                return
+        sock.close()
+
+    def clear(self):
+        """Closes every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for sock, last_used in idle:
+            sock.close()
+
+    def __len__(self):
+        return len(self._idle)
@@ -0,0 +1,232 @@
+"""
+Server side of the searchd binary protocol (API 0x116 / Sphinx 0.9.9).
+
+These helpers build the byte strings searchd would send back, so replies can
+be recorded, generated and replayed without a running searchd.
+"""
+import random
+from struct import pack, unpack_from, calcsize
+
+from djangosphinx.apis.api278 import SEARCHD_OK, SEARCHD_WARNING, \
+     SPH_ATTR_INTEGER, SPH_ATTR_TIMESTAMP, SPH_ATTR_FLOAT, SPH_ATTR_BIGINT, \
+     SPH_ATTR_MULTI, SPH_FILTER_VALUES, SPH_FILTER_RANGE, SPH_FILTER_FLOATRANGE
+
+__all__ = ('pack_string', 'encode_header', 'encode_search_result',
+           'encode_search_response', 'encode_excerpts', 'encode_keywords',
+           'encode_update', 'generate_attrs', 'generate_matches',
+           'RequestReader', 'decode_search_request', 'decode_excerpts_request',
+           'decode_update_request', 'decode_keywords_request')
+
+ATTR_MVA = SPH_ATTR_MULTI | SPH_ATTR_INTEGER
+
+def pack_string(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return pack('>L', len(value)) + value
+
+def encode_header(body, version, status=SEARCHD_OK):
+    """Prefixes a reply body with the (status, version, length) header."""
+    return pack('>2HL', status, version, len(body)) + body
+
+def encode_search_result(fields, attrs, matches, total=None, total_found=None,
+                         time=0, words=(), status=SEARCHD_OK, message='', id64=True):
+    """
+    Encodes one result set of a SEARCH reply.
+
+    ``attrs`` is a list of (name, type) pairs and ``matches`` a list of
+    ``{'id': ..., 'weight': ..., 'attrs': {...}}`` dicts, the same shapes
+    SphinxClient.RunQueries() returns.
+    """
+    out = [pack('>L', status)]
+    if status != SEARCHD_OK:
+        out.append(pack_string(message))
+        if status != SEARCHD_WARNING:
+            return ''.join(out)
+
+    out.append(pack('>L', len(fields)))
+    out.extend([pack_string(f) for f in fields])
+
+    out.append(pack('>L', len(attrs)))
+    for name, type_ in attrs:
+        out.append(pack_string(name) + pack('>L', type_))
+
+    out.append(pack('>2L', len(matches), id64 and 1 or 0))
+    for match in matches:
+        if id64:
+            out.append(pack('>QL', match['id'], match['weight']))
+        else:
+            out.append(pack('>2L', match['id'], match['weight']))
+        for name, type_ in attrs:
+            value = match['attrs'][name]
+            if type_ == SPH_ATTR_FLOAT:
+                out.append(pack('>f', value))
+            elif type_ == SPH_ATTR_BIGINT:
+                out.append(pack('>q', value))
+            elif type_ == ATTR_MVA:
+                out.append(pack('>L', len(value)))
+                out.append(pack('>%dL' % len(value), *value))
+            else:
+                out.append(pack('>L', value))
+
+    if total is None:
+        total = len(matches)
+    if total_found is None:
+        total_found = total
+    out.append(pack('>4L', total, total_found, int(time), len(words)))
+    for word in words:
+        out.append(pack_string(word['word']) + pack('>2L', word['docs'], word['hits']))
+
+    return ''.join(out)
+
+def encode_search_response(results):
+    """Joins several encoded result sets into the body of a SEARCH reply."""
+    return ''.join(results)
+
+def encode_excerpts(excerpts):
+    return ''.join([pack_string(e) for e in excerpts])
+
+def encode_keywords(keywords, hits=False):
+    out = [pack('>L', len(keywords))]
+    for entry in keywords:
+        out.append(pack_string(entry['tokenized']) + pack_string(entry['normalized']))
+        if hits:
+            out.append(pack('>2L', entry.get('docs', 0), entry.get('hits', 0)))
+    return ''.join(out)
+
+def encode_update(updated):
+    return pack('>L', updated)
+
+class RequestReader(object):
+    """Sequential reader over the body of a client request."""
+
+    def __init__(self, body, offset=0):
+        self.body = body
+        self.offset = offset
+
+    def read(self, fmt):
+        values = unpack_from('>' + fmt, self.body, self.offset)
+        self.offset += calcsize('>' + fmt)
+        return values
+
+    def uint(self):
+        return self.read('L')[0]
+
+    def string(self):
+        length = self.uint()
+        value = self.body[self.offset:self.offset + length]
+        self.offset += length
+        return value
+
+def decode_search_request(reader):
+    """
+    Decodes one query of a SEARCH request (as built by SphinxClient.AddQuery)
+    into a dict, advancing ``reader`` past it.
+    """
+    req = {}
+    req['offset'], req['limit'], req['mode'], req['ranker'], req['sort'] = reader.read('5L')
+    req['sortby'] = reader.string()
+    req['query'] = reader.string()
+    req['weights'] = list(reader.read('%dL' % reader.uint()))
+    req['index'] = reader.string()
+    if reader.uint():
+        req['min_id'], req['max_id'] = reader.read('2Q')
+    else:
+        req['min_id'], req['max_id'] = reader.read('2L')
+
+    req['filters'] = []
+    for i in xrange(reader.uint()):
+        f = {'attr': reader.string(), 'type': reader.uint()}
+        if f['type'] == SPH_FILTER_VALUES:
+            f['values'] = list(reader.read('%dq' % reader.uint()))
+        elif f['type'] == SPH_FILTER_RANGE:
+            f['min'], f['max'] = reader.read('2q')
+        elif f['type'] == SPH_FILTER_FLOATRANGE:
+            f['min'], f['max'] = reader.read('2f')
+        f['exclude'] = reader.uint()
+        req['filters'].append(f)
+
+    req['groupfunc'] = reader.uint()
+    req['groupby'] = reader.string()
+    req['maxmatches'] = reader.uint()
+    req['groupsort'] = reader.string()
+    req['cutoff'], req['retrycount'], req['retrydelay'] = reader.read('3L')
+    req['groupdistinct'] = reader.string()
+
+    req['anchor'] = {}
+    if reader.uint():
+        req['anchor']['attrlat'] = reader.string()
+        req['anchor']['attrlong'] = reader.string()
+        req['anchor']['lat'], req['anchor']['long'] = reader.read('2f')
+
+    req['indexweights'] = dict([(reader.string(), reader.uint()) for i in xrange(reader.uint())])
+    req['maxquerytime'] = reader.uint()
+    req['fieldweights'] = dict([(reader.string(), reader.uint()) for i in xrange(reader.uint())])
+    req['comment'] = reader.string()
+
+    req['overrides'] = {}
+    for i in xrange(reader.uint()):
+        name = reader.string()
+        type_, count = reader.read('2L')
+        fmt = {SPH_ATTR_FLOAT: 'Qf', SPH_ATTR_BIGINT: 'Qq'}.get(type_, 'Ql')
+        req['overrides'][name] = {'name': name, 'type': type_,
+                                  'values': dict([reader.read(fmt) for j in xrange(count)])}
+
+    req['select'] = reader.string()
+    return req
+
+def decode_excerpts_request(reader):
+    req = {}
+    req['mode'], req['flags'] = reader.read('2L')
+    req['index'] = reader.string()
+    req['words'] = reader.string()
+    req['before_match'] = reader.string()
+    req['after_match'] = reader.string()
+    req['chunk_separator'] = reader.string()
+    req['limit'], req['around'] = reader.read('2L')
+    req['docs'] = [reader.string() for i in xrange(reader.uint())]
+    return req
+
+def decode_update_request(reader):
+    req = {'index': reader.string()}
+    req['attrs'] = [reader.string() for i in xrange(reader.uint())]
+    nattrs = len(req['attrs'])
+    req['values'] = {}
+    for i in xrange(reader.uint()):
+        docid = reader.read('Q')[0]
+        req['values'][docid] = list(reader.read('%dL' % nattrs))
+    return req
+
+def decode_keywords_request(reader):
+    req = {'query': reader.string(), 'index': reader.string()}
+    req['hits'] = reader.uint()
+    return req
+
+def generate_attrs(count=12, mva=False):
+    """
+    Builds a schema of ``count`` attributes mixing the common attribute
+    types, optionally with a multi-value attribute.
+    """
+    types = (SPH_ATTR_INTEGER, SPH_ATTR_TIMESTAMP, SPH_ATTR_FLOAT, SPH_ATTR_BIGINT)
+    attrs = [('attr%d' % i, types[i % len(types)]) for i in range(count)]
+    if mva:
+        attrs.append(('tags', ATTR_MVA))
+    return attrs
+
+def generate_matches(count, attrs, start_id=1, seed=None):
+    """Generates ``count`` matches with random values for ``attrs``."""
+    rand = random.Random(seed)
+    matches = []
+    for doc in xrange(start_id, start_id + count):
+        values = {}
+        for name, type_ in attrs:
+            if type_ == SPH_ATTR_FLOAT:
+                # round trip through a C float so values compare equal after decoding
+                values[name] = float(rand.randint(0, 1 << 16)) / 8
+            elif type_ == SPH_ATTR_BIGINT:
+                values[name] = rand.randint(-(1 << 40), 1 << 40)
+            elif type_ == ATTR_MVA:
+                values[name] = [rand.randint(1, 500) for i in range(rand.randint(0, 5))]
+            else:
+                values[name] = rand.randint(0, 1 << 31)
+        matches.append({'id': doc, 'weight': rand.randint(1, 1000), 'attrs': values})
+    return matches
@@ -0,0 +1,78 @@
+"""
+Cross-request cache of searchd results.
+
+Only what searchd returns is cached (match ids, weights, attributes and the
+totals), never model instances, so a cached search still loads fresh objects
+with one pk lookup.  Keys include a generation counter for every index the
+search ran on; bumping it makes all of that index's entries unreachable.
+Bump it once ``indexer --rotate`` has finished:
+
+<code>
+    indexer --all --rotate && ./manage.py bump_sphinx_generation
+</code>
+
+or from code with ``bump_index_generation('my_index')``.
+
+Passages are cached per object, keyed by the words they highlight and the
+text they were built from, so they go stale by themselves when it changes.
+
+default settings.py values
+<code>
+    SPHINX_RESULT_CACHE_TIMEOUT = 300  # 0 turns the cache off
+    SPHINX_PASSAGES_CACHE_TIMEOUT = 3600  # 0 turns the passages cache off
+</code>
+"""
+import hashlib
+import re
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+__all__ = ('RESULT_CACHE_TIMEOUT', 'PASSAGES_CACHE_TIMEOUT', 'index_generation',
+           'bump_index_generation', 'result_key', 'passages_key')
+
+RESULT_CACHE_TIMEOUT = int(getattr(settings, 'SPHINX_RESULT_CACHE_TIMEOUT', 300))
+PASSAGES_CACHE_TIMEOUT = int(getattr(settings, 'SPHINX_PASSAGES_CACHE_TIMEOUT', 3600))
+
+GENERATION_KEY = 'sphinx_index_generation_%s'
+RESULT_KEY = 'sphinx_results_%s_%s'
+PASSAGES_KEY = 'sphinx_passages_%s'
+
+def _index_names(index):
+    if isinstance(index, unicode):
+        index = index.encode('utf-8')
+    return [name for name in re.split(r'[\s,;]+', index or '') if name]
+
+def index_generation(index):
+    """
+    Returns the generations of the indexes in ``index`` (which may name
+    several, like searchd accepts) as one string, starting any that are
+    missing.
+    """
+    names = _index_names(index)
+    keys = [GENERATION_KEY % (name,) for name in names]
+    found = cache.get_many(keys)
+    for key in keys:
+        if found.get(key) is None:
+            generation = uuid.uuid4().hex
+            if not cache.add(key, generation):
+                generation = cache.get(key, generation)
+            found[key] = generation
+    return '-'.join([found[key] for key in keys])
+
+def bump_index_generation(*indexes):
+    """Drops every cached result of ``indexes``"""
+    for index in indexes:
+        for name in _index_names(index):
+            cache.set(GENERATION_KEY % (name,), uuid.uuid4().hex)
+
+def result_key(index, signature):
+    """Key of the cached results of a search on ``index`` with ``signature``"""
+    return RESULT_KEY % (hashlib.md5(index_generation(index)).hexdigest(),
+                         hashlib.md5(signature).hexdigest())
+
+def passages_key(index, words, opts, fields, docs):
+    """Key of the passages built from ``docs``, the texts of ``fields``"""
+    signature = repr((index, words, sorted(opts.items()), list(fields), list(docs)))
+    return PASSAGES_KEY % (hashlib.md5(signature).hexdigest(),)
@@ -0,0 +1,213 @@
+import socket
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from djangosphinx import models as sphinx_models
+from djangosphinx.apis.api278 import SEARCHD_ERROR
+from djangosphinx.fakesearchd import FakeSearchd, ResultSet
+from djangosphinx.models import SearchError, SphinxQuerySet
+from djangosphinx.paginator import SphinxPaginator
+from djangosphinx.protocol import encode_search_result
+from djangosphinx.pool import ConnectionPool, is_alive
+from djangosphinx.resultcache import bump_index_generation
+
+class FakeSearchdTestCase(TestCase):
+    """Points the connection pool at a fresh FakeSearchd for every test"""
+
+    def get_results(self):
+        return ResultSet.generate(100)
+
+    def setUp(self):
+        self.searchd = FakeSearchd(results=self.get_results()).start()
+        self.pool = ConnectionPool(*self.searchd.address)
+        self.saved = (sphinx_models.connection_pool, sphinx_models.RESULT_CACHE_TIMEOUT)
+        sphinx_models.connection_pool = self.pool
+        # every search should reach searchd
+        sphinx_models.RESULT_CACHE_TIMEOUT = 0
+
+    def tearDown(self):
+        sphinx_models.connection_pool, sphinx_models.RESULT_CACHE_TIMEOUT = self.saved
+        self.pool.clear()
+        self.searchd.stop()
+
+    def search(self, query='hello'):
+        return SphinxQuerySet(index='test_index').query(query)
+
+class FailingResultSet(ResultSet):
+    """Answers with an error, like searchd does for a missing index"""
+
+    def encode(self, request):
+        return encode_search_result([], [], [], status=SEARCHD_ERROR, message='no such index')
+
+class FakeSearchdSmokeTestCase(FakeSearchdTestCase):
+
+    def test_query(self):
+        """A plain SphinxClient gets a well-formed reply"""
+
+        client = sphinx_models.sphinxapi.SphinxClient()
+        client.SetServer(*self.searchd.address)
+        client.SetLimits(10, 5)
+        reply = client.Query('hello world', 'test_index')
+        self.assertEqual(client.GetLastError(), '')
+        self.assertEqual(reply['total_found'], 100)
+        self.assertEqual(len(reply['matches']), 5)
+        self.assertEqual(reply['fields'], ['title', 'keywords', 'description', 'content'])
+        self.assertEqual([w['word'] for w in reply['words']], ['hello', 'world'])
+
+        excerpts = client.BuildExcerpts(['Hello there', 'nothing'], 'test_index', 'hello', {})
+        self.assertEqual(excerpts, ['<b>Hello</b> there', 'nothing'])
+
+class PoolTestCase(FakeSearchdTestCase):
+
+    def test_is_alive(self):
+        a, b = socket.socketpair()
+        try:
+            self.assertTrue(is_alive(a))
+            b.close()
+            self.assertFalse(is_alive(a))
+        finally:
+            a.close()
+
+    def test_reuses_connections(self):
+        for i in range(3):
+            list(self.search())
+        self.assertEqual(self.searchd.stats['connections'], 1)
+        self.assertEqual(self.searchd.stats['search'], 3)
+        self.assertEqual(len(self.pool), 1)
+
+    def test_dead_connections_dropped(self):
+        list(self.search())
+        self.searchd.stop()
+        self.searchd = FakeSearchd(port=self.pool.port).start()
+        list(self.search())
+        self.assertEqual(self.searchd.stats['connections'], 1)
+
+    def test_reset_after_fork(self):
+        list(self.search())
+        self.assertEqual(len(self.pool), 1)
+        # as if this process had been forked from the one which opened it
+        self.pool._pid = -1
+        self.assertEqual(self.pool._checkout_socket(), None)
+        self.assertEqual(len(self.pool), 0)
+
+    def test_discard(self):
+        client = self.pool.get_client()
+        self.pool.release(client, discard=True)
+        self.assertEqual(len(self.pool), 0)
+
+        client = self.pool.get_client()
+        self.pool.release(client)
+        self.assertEqual(len(self.pool), 1)
+
+    def test_discard_on_exception(self):
+        """A socket left mid-reply is never handed out again"""
+
+        def broken_query(*args, **kwargs):
+            raise socket.error('connection reset mid-reply')
+
+        new_client = self.pool._new_client
+        def _new_client():
+            client = new_client()
+            client.Query = broken_query
+            return client
+        self.pool._new_client = _new_client
+
+        self.assertRaises(socket.error, list, self.search())
+        self.assertEqual(len(self.pool), 0)
+
+class BatchTestCase(FakeSearchdTestCase):
+
+    def get_results(self):
+        return {'hello': ResultSet.generate(50), 'world': ResultSet.generate(30),
+                'broken': FailingResultSet([])}
+
+    def test_window_is_lazy(self):
+        qs = self.search().window(10, 20)
+        self.assertEqual(self.searchd.stats.get('search'), None)
+        self.assertEqual(len(list(qs)), 10)
+        self.assertEqual(self.searchd.stats['search'], 1)
+
+    def test_batch(self):
+        """Every queryset is filled in by a single round trip"""
+
+        hello, world = SphinxQuerySet.batch(self.search('hello').window(0, 20), self.search('world').window(5, 10))
+        self.assertEqual(self.searchd.stats['search'], 1)
+        self.assertEqual(self.searchd.stats['queries'], 2)
+
+        self.assertEqual([r['id'] for r in hello], [r['id'] for r in self.search('hello').window(0, 20)])
+        self.assertEqual(len(list(world)), 5)
+        self.assertEqual(hello._sphinx['total_found'], 50)
+        self.assertEqual(world._sphinx['total_found'], 30)
+        # the second comparison search above was the only other round trip
+        self.assertEqual(self.searchd.stats['search'], 2)
+
+    def test_batch_errors(self):
+        """A failed search leaves the others filled in, and raises again when used"""
+
+        hello, broken, world = [self.search(q).window(0, 10) for q in ('hello', 'broken', 'world')]
+        self.assertRaises(SearchError, SphinxQuerySet.batch, hello, broken, world)
+        self.assertEqual(self.searchd.stats['search'], 1)
+
+        self.assertEqual(len(list(hello)), 10)
+        self.assertEqual(len(list(world)), 10)
+        self.assertRaises(SearchError, list, broken)
+        self.assertEqual(self.searchd.stats['search'], 1)
+
+class QuerySetTestCase(FakeSearchdTestCase):
+
+    def test_list_single_round_trip(self):
+        """list() and len() use the fetched window instead of counting first"""
+
+        qs = self.search().window(0, 20)
+        self.assertEqual(len(list(qs)), 20)
+        self.assertEqual(len(qs), 20)
+        self.assertEqual(self.searchd.stats['search'], 1)
+
+        # the total comes with the window
+        self.assertEqual(qs.count(), 100)
+        self.assertEqual(self.searchd.stats['search'], 1)
+
+    def test_paginator_single_round_trip(self):
+        paginator = SphinxPaginator(self.search(), 20)
+        page = paginator.page(2)
+        self.assertEqual(len(page.object_list), 20)
+        self.assertEqual(paginator.num_pages, 5)
+        self.assertEqual(self.searchd.stats['search'], 1)
+
+class ResultCacheTestCase(FakeSearchdTestCase):
+
+    def setUp(self):
+        super(ResultCacheTestCase, self).setUp()
+        sphinx_models.RESULT_CACHE_TIMEOUT = 300
+        cache.clear()
+
+    def test_hit(self):
+        """A repeated search is answered from the cache"""
+
+        first = [r['id'] for r in self.search().window(0, 20)]
+        self.assertEqual([r['id'] for r in self.search().window(0, 20)], first)
+        self.assertEqual(self.searchd.stats['search'], 1)
+
+        # anything else that goes into the request is another search
+        list(self.search().window(20, 40))
+        list(self.search('world').window(0, 20))
+        self.assertEqual(self.searchd.stats['search'], 3)
+
+    def test_bump(self):
+        """Bumping the generation of an index makes its cached results unreachable"""
+
+        list(self.search())
+        bump_index_generation('other_index')
+        list(self.search())
+        self.assertEqual(self.searchd.stats['search'], 1)
+
+        bump_index_generation('test_index')
+        list(self.search())
+        self.assertEqual(self.searchd.stats['search'], 2)
+
+        call_command('bump_sphinx_generation', 'test_index', verbosity=0)
+        list(self.search())
+        list(self.search())
+        self.assertEqual(self.searchd.stats['search'], 3)